@@ -9,16 +9,87 @@ Run
 ---
 $ microspec-gui
 
+Record every frame to a binary file while the GUI runs:
+$ microspec-gui --record out.bin
+
+Record without the GUI (Ctrl-C to stop):
+$ microspec-gui --headless --record out.bin
+
+Publish every frame to local TCP and WebSocket subscribers, e.g.,
+dashboards (see microspecgui.stream):
+$ microspec-gui --serve 8765 --serve-ws 8766
+
+Play back a recording (at 4x speed, starting 60 seconds in):
+$ microspec-gui --replay out.bin --speed 4 --start 60
+
+Connect to several kits, plotted in panels (Tab selects a kit):
+$ microspec-gui --serial 091103 --serial 125129 --layout stacked
+
+Run without a dev-kit, using a simulated kit:
+$ microspec-gui --simulate
+
+Show wavelengths from a wavelength map file (default: the map named
+after the kit serial number in ~/.microspecgui/maps):
+$ microspec-gui --map 091103.map
+
+Keep auto-exposing whenever the peak leaves the target:
+$ microspec-gui --track-exposure
+
+Mark the 4 largest peaks that stand out by at least 2000 counts:
+$ microspec-gui --peaks 4 --prominence 2000
+
+Average the last 16 frames to reduce noise:
+$ microspec-gui --average mean --average-n 16
+
+Plot all 784 pixels, and only pixels 300 to 700 (keys b and o switch
+binning and cropping):
+$ microspec-gui --binning off --roi 300 700 --crop
+
+Subtract the baseline and fit the main line on a worker process
+(p shows/hides the result):
+$ microspec-gui --process baseline fit
+
+Merge exposures of 1, 10 and 100 ms into one spectrum of extended
+dynamic range (e turns HDR mode on/off):
+$ microspec-gui --hdr 1 10 100
+
+Show spectra over time, newest at the top (w switches views):
+$ microspec-gui --waterfall
+
+Store dark and reference spectra in another folder (keys d and r
+capture them):
+$ microspec-gui --cal-dir ~/calibration
+
+Print the time from launch to the first frame plotted:
+$ microspec-gui --profile-startup
+
+Export loop timing and frame counters once per second:
+$ microspec-gui --metrics metrics.csv
+
 Keyboard controls
 -----------------
 q   - quit
 a   - auto-expose (spacebar works also)
+t   - start/stop tracking exposure (keep auto-exposing)
 x   - decrease exposure time
 X   - increase exposure time
 h/l - navigate wavelength slow
 j/k - navigate wavelength fast
 0   - go to shortest wavelength
 $   - go to longest wavelength
+[/] - skip back/forward 10 seconds (--replay only)
+n   - switch frame averaging: off, mean, ema, median
+v   - show/hide noise (standard deviation) of averaged frames
+m   - show/hide loop timing and frame counters
+w   - switch between trace and waterfall view
+d   - capture a dark spectrum (block the light first)
+r   - capture a reference spectrum
+c   - turn dark and reference correction on/off
+b   - switch pixel binning on/off (not while recording or replaying)
+o   - plot all pixels or only the meaningful pixels
+p   - show/hide the post-processed frame (smoothed, baseline, line fit)
+e   - turn HDR mode on/off (not while recording or replaying)
+Tab - select the next kit (several kits only)
 
 Joystick controls
 -----------------
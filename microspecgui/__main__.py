@@ -2,13 +2,43 @@
 """TODO
 [x] vertical line automatically drawn to show where the peak is
 [x] add space BELOW plot to print peak pixel number
-[ ] get start_pixel and stop_pixel from map file
+[x] get start_pixel and stop_pixel from map file
 """
 
+import time
+# Startup is timed from here, see --profile-startup
+_STARTED = time.perf_counter()
+
 import pygame # from PyPi
+import numpy as np
 import pygstuff as pygs # Simplify pygame interface
-from microspeclib.simple import MicroSpecSimpleInterface
+# microspeclib and asyncio are imported when first used: a simulated
+# kit or a recording does not need them, see open_devkits() and
+# configure_devkits(). Likewise multiprocessing, see PostProcessing,
+# and the frame server, see open_server().
 from pathlib import Path
+import argparse
+import bisect
+import os
+import threading
+from concurrent.futures import Future, wait
+from .acquire import Acquisition, FRAME_DTYPE
+from .plot import Trace
+from .record import Recorder
+from .replay import ReplayKit
+from .simulate import SimulatedKit
+from .metrics import Laps, Monitor, MetricsWriter, Milestones
+from .average import FrameAverager, MODES as AVERAGE_MODES
+from .wavelength import MAP_DIR, find_map, load_map, wavelength_at
+from .peaks import PeakFinder, METHODS as PEAK_METHODS
+from .autoexpose import ExposureController
+from .batch import BatchCapture
+from .waterfall import Waterfall
+from .calibration import CAL_DIR, Calibration
+from .controls import Controls
+from . import text as _text
+
+_IMPORTED = time.perf_counter()
 
 # Default all print() calls to display in console immediately
 from functools import partial
@@ -29,22 +59,36 @@ binning = BINNING_ON
 
 # Auto-expose parameters
 MAX_TRIES=12; TARGET=46420; TOL=3277; MAX_EXPOSURE=10000
+# Default exposure ladder of HDR mode in milliseconds, see --hdr
+HDR_MS = (1, 10, 100)
+# Retries of the auto-expose config (firmware bug, see configure_devkit_async)
+FIRMWARE_RETRIES=10
+# Seconds to wait for the dev-kit to reply while configuring
+COMMAND_TIMEOUT=2.0
 # start_pixel and stop_pixel depend on pixel binning.
 # start_pixel=8 if binning else 16 # MINIMUM start_pixel
 # start_pixel=392 if binning else 784 # MAXIMUM stop_pixel
 start_pixel=220 if binning else 440
 stop_pixel=373 if binning else 746
-# TODO: get start_pixel and stop_pixel from wavelength map file
+# If the kit has a wavelength map, start_pixel and stop_pixel come from
+# the map instead, see open_wavelength_map(), and --roi overrides both,
+# see pixel_range()
 
 
 # GUI uses Steve Losh's Badwolf color scheme and color names
 rgb = pygs.RGB()
 # example color: rgb.saltwatertaffy
 
+# Trace colors of the kits that are not selected
+DEVICE_COLORS = (rgb.orange, rgb.lime, rgb.taffy, rgb.tardis, rgb.toffee)
+
 # Make resource path agnostic to path GUI is launched from
 path = Path(__file__)
 _GUI = path.parent
 
+# Font for labels
+CONSOLA = _GUI.joinpath('_gui/consola.ttf')
+
 # Plot Display
 """
 - Want to use counts values as pixel y-coordinate,
@@ -55,7 +99,15 @@ _GUI = path.parent
     adding max_yval to all values.
   - Add an extra offset to control where the top of the plot is.
 """
-max_data_length = 392 if binning else 784
+num_pixels = 392 if binning else 784 # pixels per frame
+# Pixel numbers plotted: the whole frame, or only the meaningful pixels
+# if cropped, see set_pixel_layout()
+first_pixel = 1
+last_pixel = num_pixels
+max_data_length = last_pixel - first_pixel + 1 # number of pixels plotted
+# Plot width in screen columns: at least wide enough for the labels
+MIN_PLOT_WIDTH = 300
+plot_width = max(max_data_length, MIN_PLOT_WIDTH)
 plot_height = 300 # later call scale_data_to_fit(counts, plot_height)
 margin = 20 # space in screen pixels between plot top and window top
 xax_space = 40 # space below x-axis
@@ -65,6 +117,23 @@ yax_space = 40 # space left of y-axis
 # | GUI Elements |
 # ----------------
 
+class Window(pygs.Window):
+    """The GUI window, quick to open.
+
+    :class:`pygstuff.Window` calls ``pygame.init()``, which also starts
+    the joystick and audio subsystems: enumerating their devices can
+    take seconds on some machines. Only the display and the fonts are
+    started here. The joystick is started after the first frame (see
+    :func:`main`) and audio is never used.
+    """
+    def __init__(self, caption='Chromation Kit', icon=None):
+        os.environ['SDL_VIDEO_CENTERED'] = '1' # do before display init
+        pygame.display.init()
+        pygame.font.init()
+        pygame.display.set_caption(caption) # window title
+        if icon is not None:
+            pygame.display.set_icon(pygame.image.load(icon))
+
 class VerticalLine(object):
     def __init__(self, position=0, color=rgb.tardis):
         self.position = position
@@ -81,13 +150,8 @@ class Text(object):
     def __init__(self, text='', size_pt=16, antialias=1, color_rgb=rgb.snow, background_rgb=None):
         '''Initialize self.surface with consolas text and color.'''
 
-        # ---------------------------------
-        # | Fonts for labels              |
-        # ---------------------------------
-        consola = str(Path(_GUI).joinpath('_gui/consola.ttf'))
-
-        # create the font
-        self.font = pygame.font.Font(consola, size_pt)
+        # get the font (loaded from disk once, shared by all labels)
+        self.font = _text.get_font(CONSOLA, size_pt)
 
         # initialize text surface values
         self.text=text # display this text
@@ -96,16 +160,26 @@ class Text(object):
         self.background_rgb=background_rgb # rgb text background color, None: transparent
 
         # create the text surface
+        self.surface = None
         self.update(text=self.text, color_rgb=self.color_rgb)
 
     def update(self, text=None, color_rgb=None):
-        '''Update text and/or color on self.surface.'''
+        '''Update text and/or color on self.surface.
+
+        Does nothing if the text and color are unchanged.
+        '''
+        # nothing to do if text and color are unchanged
+        if ( self.surface is not None
+             and (text is None or text == self.text)
+             and (color_rgb is None or color_rgb == self.color_rgb)
+           ): return
         # update text if given:
         if text is not None: self.text=text
         # update color if given:
         if color_rgb is not None: self.color_rgb=color_rgb
-        # update the surface
-        self.surface = self.font.render(
+        # update the surface (rendered only if not cached)
+        self.surface = _text.surfaces.render(
+            self.font,
             self.text,
             self.antialias,
             self.color_rgb,
@@ -119,6 +193,8 @@ class AutoExpose(object):
         # initialize autoexpose results
         self.is_success =  True # kit.autoExposure().success
         self.num_tries = 1 # kit.autoExposure().iterations
+        # host-side auto-expose keeps adjusting exposure
+        self.tracking = False
 
         # initialize displayed text
         self.title = Text(
@@ -133,6 +209,11 @@ class AutoExpose(object):
             text=f'iterations: {self.num_tries}',
             color_rgb=rgb.darkgravel
             )
+        self.tracking_text = Text(
+            text='tracking',
+            size_pt=14,
+            color_rgb=rgb.dirtyblonde
+            )
 
 class Exposure(object):
     """Exposure information displayed on screen."""
@@ -154,6 +235,11 @@ class Exposure(object):
             text=f'{self.cycles} cycles',
             color_rgb=rgb.darkgravel
                 )
+        # exposure ladder in HDR mode
+        self.hdr_text = Text(
+            text='',
+            color_rgb=rgb.dirtyblonde
+            )
 
 class PeakCounts(object):
     """Peak counts information displayed on screen."""
@@ -172,91 +258,426 @@ class PeakCounts(object):
 class PeakPixel(object):
     '''Indicate the peak pixel on screen.'''
     def __init__(self):
-        self.value = 0
-        self.text = Text(text=f'self.value', size_pt=14, color_rgb=rgb.tardis)
+        self.value = 0 # fractional pixel number
+        self.text = Text(text=f'{self.value}', size_pt=14, color_rgb=rgb.tardis)
         self.line=VerticalLine()
 
+class PeakMarker(object):
+    '''Mark a peak other than the main peak on screen.'''
+    def __init__(self, color=rgb.dirtyblonde):
+        self.color = color
+        self.text = Text(text='', size_pt=11, color_rgb=color)
+
+class Averaging(object):
+    '''Frame averaging mode displayed on screen.'''
+    def __init__(self, num_pixels, mode=None, n=8):
+        '''
+        Parameters
+        ----------
+        num_pixels:
+            - pixels per frame
+        mode:
+            - averaging mode, see :data:`microspecgui.average.MODES`,
+              None: no averaging
+        n:
+            - number of frames averaged
+        '''
+        self.num_pixels = num_pixels
+        self.n = n
+        self.show_noise = False # plot per-pixel standard deviation
+        self.noise = np.zeros(num_pixels)
+        self.text = Text(text='', size_pt=14, color_rgb=rgb.gravel)
+        self.set_mode(mode)
+
+    def set_mode(self, mode):
+        '''Start averaging in `mode` (None: stop averaging).'''
+        self.mode = mode
+        self.key = None # (cycles, dtype) of the averaged frames
+        if mode is None:
+            self.averager = None
+        else:
+            self.averager = FrameAverager(self.num_pixels, mode, self.n)
+            self.text.update(text=f'average: {mode} of {self.n}')
+
+    def add(self, pixels, cycles):
+        '''Average the frame `pixels` captured with exposure `cycles`.
+
+        Starts over when the exposure time changes: frames of
+        different exposure times are not averaged, nor HDR merges
+        (floats) with single frames.
+        '''
+        key = (cycles, pixels.dtype)
+        if key != self.key:
+            self.averager.reset()
+            self.key = key
+        self.averager.add(pixels)
+
+    def next_mode(self):
+        '''Switch to the next averaging mode: off, mean, ema, median.'''
+        modes = (None,) + AVERAGE_MODES
+        self.set_mode(modes[(modes.index(self.mode)+1) % len(modes)])
+
+    def resize(self, num_pixels):
+        '''Average frames of `num_pixels` pixels from now on.'''
+        self.num_pixels = num_pixels
+        self.noise = np.zeros(num_pixels)
+        self.set_mode(self.mode)
+
+    def standard_deviation(self):
+        '''Return the per-pixel standard deviation of the averaged frames.'''
+        np.sqrt(self.averager.variance(), out=self.noise)
+        return self.noise
+
+class Correction(object):
+    '''Dark and reference correction displayed on screen.'''
+    def __init__(self, enabled=True):
+        '''
+        Parameters
+        ----------
+        enabled:
+            - if True, correct the frames of the selected kit with its
+              stored dark and reference spectra
+        '''
+        self.enabled = enabled
+        self.applied = () # kinds of spectra applied to the plotted frame
+        self.text = Text(text='', size_pt=14, color_rgb=rgb.gravel)
+
+    def update(self, calibration, cycles):
+        '''Update `applied` and the label for exposure `cycles`.'''
+        self.applied = calibration.applied(binning, cycles) if self.enabled else ()
+        if calibration.capturing is not None:
+            text = (f'capturing {calibration.capturing}: '
+                    f'{calibration.count}/{calibration.num_frames}')
+        elif self.applied:
+            text = f'corrected: {" and ".join(self.applied)}'
+        else:
+            text = ''
+        self.text.update(text=text)
+
+class PostProcessing(object):
+    '''Post-processing of the selected kit's frames displayed on screen.'''
+    def __init__(self, stages=None, workers=1, visible=False):
+        '''
+        Parameters
+        ----------
+        stages:
+            - see :data:`microspecgui.postprocess.STAGES`, None: all
+        workers:
+            - worker processes
+        visible:
+            - if True, start post-processing at once
+        '''
+        self.stages = stages
+        self.workers = workers
+        self.processor = None # started when first shown
+        self.result = None # newest result of the current pixel layout
+        self.text = Text(text='', size_pt=14, color_rgb=rgb.dalespale)
+        self.visible = False
+        if visible: self.toggle()
+
+    def toggle(self):
+        '''Show/hide the post-processed frame.
+
+        The worker processes start the first time it is shown.
+        '''
+        self.visible = not self.visible
+        if self.visible and self.processor is None:
+            # not imported at startup: most sessions do not post-process
+            from .postprocess import PostProcessor, STAGES
+            self.processor = PostProcessor(
+                self.stages or STAGES, max_pixels=784, workers=self.workers
+                )
+        self.result = None
+
+    def update(self, result, wavelengths=None):
+        '''Show :class:`microspecgui.postprocess.Result` `result`.'''
+        self.result = result
+        fit = result.fit
+        if fit is None:
+            text = 'fit: no line' if 'fit' in self.processor.stages else ''
+        else:
+            pixel = pixel_label(fit.index + first_pixel, wavelengths, decimals=2)
+            text = f'fit: {pixel} FWHM {fit.fwhm:.2f}px'
+        self.text.update(text=text)
+
+    def close(self):
+        '''Stop the worker processes.'''
+        if self.processor is not None:
+            self.processor.close()
+
+class MetricsOverlay(object):
+    '''Loop timing and frame counters displayed on screen.'''
+    def __init__(self, stages):
+        '''
+        Parameters
+        ----------
+        stages:
+            - GUI loop stages to display, see :data:`GUI_STAGES`
+        '''
+        self.visible = False
+        self.stages = tuple(stages) + ('capture',)
+        # one line of text per stage plus three lines of counters
+        self.lines = [
+            Text(text='', size_pt=11, color_rgb=rgb.lightgravel,
+                 background_rgb=rgb.blackestgravel)
+            for line in range(len(self.stages)+3)
+            ]
+        self.lines[0].update(text='metrics: waiting...')
+
+    def update(self, row):
+        '''Display a row of metrics from :class:`Monitor`.'''
+        self.lines[0].update(text=(
+            f'loop {row["loop_fps"]:6.1f}/s  '
+            f'new {row["plotted_fps"]:6.1f}/s  '
+            f'kit {row["captured_fps"]:6.1f}/s'
+            ))
+        self.lines[1].update(text=(
+            f'dropped {row["dropped"]}  '
+            f'overwritten {row["overwritten"]}  '
+            f'stale {row["stale"]}'
+            ))
+        self.lines[2].update(text=f'{"stage":>8} {"mean ms":>8} {"p99 ms":>8}')
+        for line, stage in zip(self.lines[3:], self.stages):
+            line.update(text=(
+                f'{stage:>8} {row[stage+"_ms"]:8.3f} {row[stage+"_p99_ms"]:8.3f}'
+                ))
+
+    def draw(self, surface, position):
+        '''Blit the overlay at `position`. Return the rects drawn.'''
+        x, y = position
+        rects = []
+        for line in self.lines:
+            rects.append(surface.blit(line.surface, (x, y)))
+            y += line.surface.get_height()
+        return rects
+
+class Device(object):
+    '''A dev-kit plotted by the GUI, with its own exposure state.'''
+    def __init__(self, kit, color=rgb.orange):
+        '''
+        Parameters
+        ----------
+        kit:
+            - :class:`MicroSpecSimpleInterface`, already configured
+        color:
+            - trace color when this kit is not the selected kit
+        '''
+        self.kit = kit
+        self.serial_number = kit.serial.serial_number.strip("CHROMATION")
+        self.color = color
+        # exposure and auto-expose state displayed when selected
+        self.exposure = Exposure(kit)
+        self.autoexpose = AutoExpose()
+        # dummy plot data to plot until the 1st frame arrives
+        self.counts = np.zeros(max_data_length, dtype=FRAME_DTYPE)
+        # exposure time `counts` were captured with, in cycles (in HDR
+        # mode, the longest exposure time of the ladder)
+        self.cycles = self.exposure.cycles
+        # acquisition worker, see main()
+        self.acq = None
+        # dark and reference spectra, see main()
+        self.calibration = None
+        # exposure ladder in cycles in HDR mode, None if not in HDR mode
+        self.hdr = None
+        # labels displayed when not selected
+        self.name = Text(text=self.serial_number, size_pt=12, color_rgb=color)
+        self.info = Text(text='', size_pt=12, color_rgb=rgb.gravel)
+        self.update_info()
+
+    def update_info(self):
+        '''Update the label of exposure time and auto-expose result.'''
+        if self.hdr is not None:
+            self.info.update(text=f'HDR {to_ms(self.hdr[0]):g}-{to_ms(self.hdr[-1]):g}ms')
+            return
+        self.info.update(text=(
+            f'{to_ms(self.exposure.cycles):.2f}ms '
+            f'{"hit" if self.autoexpose.is_success else "gave up"}'
+            ))
+
+    def set_hdr(self, ladder):
+        '''Enter HDR mode with exposure `ladder` in cycles, None: leave it.'''
+        self.hdr = ladder
+        self.exposure.hdr_text.update(text='' if ladder is None else (
+            'HDR: ' + ', '.join(f'{to_ms(cycles):g}' for cycles in ladder) + 'ms'
+            ))
+        self.update_info()
+
 class Cursor(object):
     '''Vertical line to inspect pixel number.'''
-    def __init__(self, position=yax_space+round(max_data_length/2), color=rgb.tardis):
+    def __init__(self, position=None, color=rgb.tardis):
         '''
         Parameters
         ----------
         position:
-            - initial x-location of vertical line
+            - initial x-location of vertical line, default is the
+              middle of the plot
         color:
             - color of the line
         '''
+        if position is None: position = yax_space+round(max_data_length/2)
         self.position = position
         self.color = color
         self.ybot = plot_height+margin+round(xax_space/2)
         self.ytop = margin
-        # now pixel_number is set in the loop, line 510
-        self.pixel_number = start_pixel # used to be this: yax_space+max_data_length-position
+        # home/end: left-most/right-most end of the useful range
+        self.home_position = yax_space+max_data_length-stop_pixel
+        self.end_position = yax_space+max_data_length-start_pixel
+        # set from the trace each GUI frame, see Trace.pixel_number
+        self.pixel_number = start_pixel
         self.text = Text(
             text=f'{self.pixel_number}',
             size_pt=14,
             color_rgb=self.color
             )
-        self.motions = []
-
-    def get_motions_pressed(self, event, key_pressed, key_mods):
-        # empty the motion list
-        self.motions = []
-
-        # add motions to the list
-        if pygs.user.pressed_right(event, key_pressed, key_mods): self.motions.append('right')
-        if pygs.user.pressed_up   (event, key_pressed, key_mods): self.motions.append('up')
-        if pygs.user.pressed_left (event, key_pressed, key_mods): self.motions.append('left')
-        if pygs.user.pressed_down (event, key_pressed, key_mods): self.motions.append('down')
-        if pygs.user.pressed_home (event, key_pressed, key_mods): self.motions.append('home')
-        if pygs.user.pressed_end (event, key_pressed, key_mods): self.motions.append('end')
-        '''joystick control: test with "Controller (XBOX 360 For Windows)"'''
-        if event.type == pygame.JOYAXISMOTION:
-            # right-hand stick for fine-grain left/right
-            if round(joy.get_axis(4),1) == -1.0:
-                self.motions.append('left')
-            elif round(joy.get_axis(4),1) == 1.0:
-                self.motions.append('right')
-            # left-hand stick for coarse-grain left/right
-            if round(joy.get_axis(0),1) == -1.0:
-                self.motions.append('down')
-            elif round(joy.get_axis(0),1) == 1.0:
-                self.motions.append('up')
-            # left-trigger to go home (left-most end of useful range)
-            if round(joy.get_axis(2),1) == 1.0:
-                self.motions.append('home')
-            # right-trigger to go to end (right-most end of useful range)
-            if round(joy.get_axis(2),1) == -1.0:
-                self.motions.append('end')
-
-    def move(self):
-        big = 10
-        for motion in self.motions:
-            if motion == 'right':
-                # self.pixel_number -= 1
-                self.position += 1
-            if motion == 'left':
-                # self.pixel_number += 1
-                self.position -= 1
-            if motion == 'up':
-                # self.pixel_number -= big
-                self.position += big
-            if motion == 'down':
-                # self.pixel_number += big
-                self.position -= big
-            if motion == 'home':
-                # self.pixel_number = stop_pixel
-                self.position = yax_space+max_data_length-stop_pixel
-            if motion == 'end':
-                # self.pixel_number = start_pixel
-                self.position = yax_space+max_data_length-start_pixel
-
-        # ------------------
-        # | VERY IMPORTANT |
-        # ------------------
-        # empty the motion list
-        self.motions = []
+        # screen columns the cursor stays in: the plotted pixels
+        self.min_position = yax_space
+        self.max_position = yax_space+max_data_length-1
+
+    def move(self, motion):
+        '''Move by `motion`, see :class:`microspecgui.controls.Motion`.
+
+        The cursor stays on the plotted pixels.
+        '''
+        position = self.position
+        if motion.jump == 'home':
+            position = self.home_position
+        elif motion.jump == 'end':
+            position = self.end_position
+        position += motion.step
+        self.position = min(max(position, self.min_position), self.max_position)
+
+    def set_range(self, trace):
+        '''Stay on the pixels plotted by `trace`, see :class:`Layout`.
+
+        Home and end are the ends of the meaningful pixels.
+        '''
+        ends = (trace.position(start_pixel), trace.position(stop_pixel))
+        self.home_position, self.end_position = min(ends), max(ends)
+        self.min_position = int(trace.x.min())
+        self.max_position = int(trace.x.max())
+
+class Layout(object):
+    """Plot geometry of the pixel configuration set by :func:`set_pixel_layout`.
+
+    Everything the GUI precomputes from the pixel configuration is
+    computed here once: switching pixel binning or cropping swaps in
+    the layout of the new configuration instead of recomputing it
+    every frame. See :func:`layout_key`.
+
+    Attributes
+    ----------
+    size : tuple
+        (width, height) of the window
+    pixels : slice
+        pixels of a frame that are plotted
+    trace, noise_trace, processed_trace : :class:`microspecgui.plot.Trace`
+        plot of the selected kit, noise of its averaged frames, and its
+        newest post-processed frame
+    other_traces : list
+        :class:`microspecgui.plot.Trace` of each kit not selected
+    panels : list
+        (top, height) of each stacked panel, see :func:`draw_background`
+    waterfall : :class:`microspecgui.waterfall.Waterfall`
+    peak_finder : :class:`microspecgui.peaks.PeakFinder`
+    wavelengths : numpy.ndarray
+        wavelength of each pixel of a frame, None if no map
+    titles, ticks : list
+        see :func:`draw_background`
+    background : :class:`pygame.Surface`
+        the static layers, see :func:`draw_background`
+    """
+    def __init__(self, args, num_kits, wavelength_map, exposure, autoexpose,
+                 yrange=65535):
+        '''
+        Parameters
+        ----------
+        args:
+            - command line, see :func:`parse_args`
+        num_kits:
+            - number of kits plotted
+        wavelength_map:
+            - :class:`microspecgui.wavelength.WavelengthMap`, or None
+        exposure, autoexpose:
+            - :class:`Exposure` and :class:`AutoExpose` of the titles
+        yrange:
+            - counts value plotted at the top of the plot
+        '''
+        self.pixels = slice(first_pixel-1, last_pixel)
+
+        # Plot short wavelengths on the left: reverse the x-axis unless
+        # the die orientation in the map is increasing wavelength.
+        reverse = wavelength_map is None or not wavelength_map.increasing
+
+        # Precompute the plot x-axis. Plot data is updated in place.
+        self.trace = Trace(
+            max_data_length,
+            start_pixel, stop_pixel,
+            plot_height, margin, yax_space,
+            yrange, reverse, first_pixel
+            )
+        # Noise (standard deviation) of averaged frames
+        self.noise_trace = Trace(
+            max_data_length,
+            start_pixel, stop_pixel,
+            plot_height, margin, yax_space,
+            yrange, reverse, first_pixel
+            )
+        # Newest post-processed frame
+        self.processed_trace = Trace(
+            max_data_length,
+            start_pixel, stop_pixel,
+            plot_height, margin, yax_space,
+            yrange, reverse, first_pixel
+            )
+
+        # Traces of the kits that are not selected: overlaid on the plot,
+        # or stacked below it in panels of half the plot height
+        panel_height = plot_height//2
+        self.panels = [] # (top, height) of each stacked panel
+        self.other_traces = []
+        for slot in range(num_kits-1):
+            top, height = margin, plot_height
+            if args.layout == 'stacked':
+                top = plot_height + margin + xax_space + margin + slot*(panel_height+margin)
+                height = panel_height
+                self.panels.append((top, height))
+            self.other_traces.append(Trace(
+                max_data_length,
+                start_pixel, stop_pixel,
+                height, top, yax_space,
+                yrange, reverse, first_pixel
+                ))
+        self.size = window_size(len(self.panels))
+
+        # Waterfall view: one row per frame of the selected kit, in the
+        # plot area, columns lined up with the trace
+        self.waterfall = Waterfall(self.trace.x - yax_space, num_rows=plot_height)
+
+        # Find peaks in the meaningful data with sub-pixel resolution
+        self.peak_finder = PeakFinder(
+            start_pixel, stop_pixel,
+            num_peaks=args.peaks,
+            min_prominence=args.prominence,
+            method=args.peak_method,
+            first_pixel=first_pixel
+            )
+
+        # Pixel-to-wavelength lookup table, None: label pixel numbers only
+        self.wavelengths = None
+        if wavelength_map is not None:
+            self.wavelengths = wavelength_map.table(binning).wavelengths
+
+        # Draw the static layers once. Each frame erases by blitting
+        # from this background instead of redrawing the static layers.
+        self.background = pygame.Surface(self.size).convert()
+        self.titles = [
+            (exposure.title,   (yax_space+plot_width-140, margin+110)),
+            (autoexpose.title, (yax_space+10, margin+110)),
+            ]
+        self.ticks = []
+        if self.wavelengths is not None:
+            self.ticks = wavelength_ticks(self.trace, self.wavelengths)
+        draw_background(self.background, yrange, self.titles, self.ticks, self.panels)
 
 def to_cycles(ms):
     u"""Convert exposure time from milliseconds to cycles.
@@ -292,12 +713,212 @@ def to_ms(cycles):
 
     return cycles*20e-3
 
-def configure_devkit(kit):
+# Exposure times the x and X keys step through, in cycles: the shortest
+# exposure time, then one significant digit from 0.1ms to 1000ms
+# (0.1ms, 0.2ms, ... 0.9ms, 1ms, 2ms, ... 900ms, 1000ms)
+EXPOSURE_STEPS = (1,) + tuple(
+    to_cycles(digit*10**power)
+    for power in range(-1, 3)
+    for digit in range(1, 10)
+    ) + (to_cycles(1000),)
+
+def step_exposure(cycles, direction):
+    """Return the exposure time one step up or down from `cycles`.
+
+    Parameters
+    ----------
+    cycles : int
+        exposure time in cycles, on a step of :data:`EXPOSURE_STEPS` or
+        between two steps
+    direction : int
+        1 for the next step up, -1 for the next step down; the
+        shortest and longest steps stay where they are
+    """
+    if direction > 0:
+        i = bisect.bisect_right(EXPOSURE_STEPS, cycles)
+        return EXPOSURE_STEPS[min(i, len(EXPOSURE_STEPS)-1)]
+    i = bisect.bisect_left(EXPOSURE_STEPS, cycles) - 1
+    return EXPOSURE_STEPS[max(i, 0)]
+
+def set_pixel_layout(new_binning, new_start_pixel, new_stop_pixel, crop=False):
+    """Change the pixel configuration the GUI plots.
+
+    Call before the GUI is set up, e.g., to plot a recording made with
+    a different pixel configuration, or while the GUI runs, then swap
+    in the :class:`Layout` of the new configuration.
+
+    Parameters
+    ----------
+    new_binning : int
+        BINNING_ON or BINNING_OFF
+    new_start_pixel, new_stop_pixel : int
+        first and last pixel of meaningful data
+    crop : bool
+        if True, plot only the meaningful data, else the whole frame
+    """
+    global binning, num_pixels, start_pixel, stop_pixel
+    global first_pixel, last_pixel, max_data_length, plot_width
+    binning = new_binning
+    num_pixels = 392 if binning else 784
+    start_pixel = new_start_pixel
+    stop_pixel = new_stop_pixel
+    first_pixel, last_pixel = (start_pixel, stop_pixel) if crop else (1, num_pixels)
+    max_data_length = last_pixel - first_pixel + 1
+    plot_width = max(max_data_length, MIN_PLOT_WIDTH)
+
+def pixel_range(new_binning, wavelength_map=None, roi=None):
+    """Return the (start_pixel, stop_pixel) of meaningful data with `new_binning`.
+
+    The range is, in order of precedence:
+
+    - `roi`: (first, last) pixel numbers without binning (1 to 784),
+      e.g., from ``--roi``
+    - the range of `wavelength_map`
+    - the current range, converted to `new_binning`
+
+    A binned pixel is the sum of unbinned pixels 2n-1 and 2n.
+    """
+    if roi is not None:
+        first, last = roi
+        return ((first+1)//2, (last+1)//2) if new_binning else (first, last)
+    if wavelength_map is not None:
+        table = wavelength_map.table(new_binning)
+        return table.start_pixel, table.stop_pixel
+    if new_binning == binning:
+        return start_pixel, stop_pixel
+    if new_binning:
+        return (start_pixel+1)//2, (stop_pixel+1)//2
+    return 2*start_pixel-1, 2*stop_pixel
+
+def layout_key():
+    """Return the pixel configuration set by :func:`set_pixel_layout`."""
+    return (binning, start_pixel, stop_pixel, first_pixel, last_pixel)
+
+def open_wavelength_map(kit, path=None, map_dir=MAP_DIR):
+    """Return the wavelength map of `kit`, or None if it has no map.
+
+    Parameters
+    ----------
+    kit : :class:`MicroSpecSimpleInterface`
+    path : str
+        map file, default is the file in `map_dir` named after the kit
+        serial number, see :mod:`microspecgui.wavelength`
+    map_dir : str
+        folder of map files
+    """
+    if path is None:
+        serial_number = kit.serial.serial_number.strip("CHROMATION")
+        path = find_map(serial_number, map_dir)
+        if path is None:
+            print(f"No wavelength map for kit {serial_number} in {map_dir}")
+            return None
+    wavelength_map = load_map(path)
+    print(f"Wavelength map: {path}")
+    return wavelength_map
+
+def log_scale(counts, full_scale, out, yrange=65535):
+    """Write `counts` on a log scale into `out`. Return `out`.
+
+    Scaled so `full_scale` counts plot at `yrange`, e.g., to plot the
+    extended range of HDR mode. Counts below 0 plot at 0.
+    """
+    np.maximum(counts, 0, out=out)
+    np.log1p(out, out=out)
+    out *= yrange/np.log1p(full_scale)
+    return out
+
+def pixel_label(pixel, wavelengths=None, decimals=0):
+    """Return the label of pixel number `pixel`.
+
+    The label is the pixel number, followed by its wavelength if
+    `wavelengths` (see :class:`microspecgui.wavelength.PixelTable`) is
+    given. A fractional pixel number (e.g., a sub-pixel peak) is
+    labeled with `decimals` digits, and its wavelength with one.
+    """
+    label = f'{pixel:.{decimals}f}'
+    if wavelengths is None:
+        return label
+    nm = wavelength_at(wavelengths, pixel)
+    return f'{label} {nm:.{1 if decimals else 0}f}nm'
+
+def wavelength_ticks(trace, wavelengths, spacing=40):
+    """Return wavelength labels for the x-axis.
+
+    Labels are round wavelengths in the meaningful pixels, every 10,
+    20, 50, 100 or 200 nanometers: the smallest step that puts at
+    least `spacing` screen pixels between labels.
+
+    Return
+    ------
+    list
+        (:class:`Text`, x) pairs: label and screen column of the pixel
+        nearest its wavelength
+    """
+    meaningful = wavelengths[start_pixel-1:stop_pixel]
+    lo, hi = meaningful.min(), meaningful.max()
+    nm_per_pixel = (hi-lo)/max(len(meaningful)-1, 1)
+    for step in (10, 20, 50, 100, 200):
+        if step >= spacing*nm_per_pixel: break
+    ticks = []
+    for nm in range(int(np.ceil(lo/step))*step, int(hi)+1, step):
+        pixel = start_pixel + int(np.argmin(np.abs(meaningful-nm)))
+        ticks.append((
+            Text(text=f'{nm}', size_pt=10, color_rgb=rgb.gravel),
+            trace.position(pixel)
+            ))
+    return ticks
+
+def open_devkits(serial_numbers):
+    """Open the dev-kits with `serial_numbers`, all at once.
+
+    Return
+    ------
+    list
+        a :class:`MicroSpecSimpleInterface` per serial number, None
+        opens the first kit found
+    """
+    # not imported at startup: simulated kits and recordings do without
+    from microspeclib.simple import MicroSpecSimpleInterface
+    # daemon threads: a kit that never opens does not hold up exit
+    def open_devkit(serial_number):
+        return MicroSpecSimpleInterface(serial_number=serial_number)
+    opening = [in_background(open_devkit, serial_number) for serial_number in serial_numbers]
+    return [future.result() for future in opening]
+
+def configure_devkits(kits, timeout=COMMAND_TIMEOUT):
+    """Configure several dev-kits at once with :func:`configure_devkit_async`.
+
+    The kits are configured concurrently on one event loop, so the
+    round trips (and the firmware bug retries) of different kits
+    overlap: startup takes as long as the slowest kit, not the sum of
+    all kits.
+
+    Parameters
+    ----------
+    kits : list
+        :class:`MicroSpecSimpleInterface` or stand-ins
+    timeout : float
+        seconds to wait for each reply, see :class:`AsyncKit`
+    """
+    import asyncio
+    from .asynckit import AsyncKit
+    async_kits = [AsyncKit(kit, timeout) for kit in kits]
+    async def configure_all():
+        await asyncio.gather(*(configure_devkit_async(kit) for kit in async_kits))
+    try:
+        asyncio.run(configure_all())
+    finally:
+        for kit in async_kits: kit.close()
+
+def configure_devkit(kit, timeout=COMMAND_TIMEOUT):
     """Configure the spectrometer dev-kit.
 
     Parameters
     ----------
     kit : :class:`MicroSpecSimpleInterface`
+        or a stand-in such as :class:`SimulatedKit`
+    timeout : float
+        seconds to wait for each reply
 
     Example
     -------
@@ -307,36 +928,46 @@ def configure_devkit(kit):
     >>> configure_devkit(kit)
 
     """
+    configure_devkits([kit], timeout)
+
+async def configure_devkit_async(kit, retries=FIRMWARE_RETRIES):
+    """Configure the spectrometer dev-kit.
+
+    Raise :class:`TimeoutError` if the kit stops replying, and
+    RuntimeError if the firmware bug on setting max_exposure persists
+    after `retries` retries.
+
+    Parameters
+    ----------
+    kit : :class:`microspecgui.asynckit.AsyncKit`
+    retries : int
+        retries of the auto-expose config, see the firmware bug below
+    """
+    import asyncio
 
     # Indicator LEDs: ON and GREEN
-    kit.setBridgeLED(0,GREEN)
-    kit.setSensorLED(0,GREEN)
-    kit.setSensorLED(1,GREEN)
+    await kit.setBridgeLED(0,GREEN)
+    await kit.setSensorLED(0,GREEN)
+    await kit.setSensorLED(1,GREEN)
 
     # Configure pixels
     # (This is the firmware default if binning == BINNING_ON)
-    kit.setSensorConfig(binning, GAIN_1X, ALL_ROWS_ACTIVE)
+    await kit.setSensorConfig(binning, GAIN_1X, ALL_ROWS_ACTIVE)
 
     # Set initial exposure time
     # (This is the firmware default if milliseconds == 1)
     milliseconds = 1
-    kit.setExposure( to_cycles(milliseconds) )
-    # print(f"Expect 50: {kit.getExposure().cycles}")
+    await kit.setExposure( to_cycles(milliseconds) )
+    # print(f"Expect 50: {(await kit.getExposure()).cycles}")
 
     # TODO: fix firmware bug on setting max_exposure:
     # Occasionally max_exposure becomes 4112 instead of the value sent.
-    kit.setAutoExposeConfig(
-        MAX_TRIES,
-        start_pixel,
-        stop_pixel,
-        TARGET,
-        TOL,
-        MAX_EXPOSURE
-        )
-    # kludge workaround to firmware bug:
+    # kludge workaround to firmware bug: send the config again, waiting
+    # longer each time, and give up after `retries` retries
     print("Waiting for firmware...")
-    while kit.getAutoExposeConfig().max_exposure == 4112:
-        kit.setAutoExposeConfig(
+    delay = 0.01 # seconds
+    for attempt in range(retries+1):
+        await kit.setAutoExposeConfig(
             MAX_TRIES,
             start_pixel,
             stop_pixel,
@@ -344,342 +975,1242 @@ def configure_devkit(kit):
             TOL,
             MAX_EXPOSURE
             )
+        max_exposure = (await kit.getAutoExposeConfig()).max_exposure
+        if max_exposure != 4112: break
+        await asyncio.sleep(delay)
+        delay = min(2*delay, 1.0)
+    else:
+        raise RuntimeError(
+            f"firmware set max_exposure to 4112 instead of {MAX_EXPOSURE} "
+            f"{retries+1} times"
+            )
     # Check value of max_exposure
-    print("Maximum exposure for auto-expose: "
-        f"{kit.getAutoExposeConfig().max_exposure} cycles")
+    print(f"Maximum exposure for auto-expose: {max_exposure} cycles")
 
-def main():
-    # ----------------------
-    # | Spectrometer Setup |
-    # ----------------------
+def draw_background(surface, yrange, titles, ticks=(), panels=()):
+    """Draw the static layers of the GUI on `surface`.
+
+    The static layers are the full-scale lines, the auto-expose
+    reference lines, the wavelength axis and the titles. They do not
+    change while the GUI runs: draw them once and blit the result to
+    erase each frame.
 
-    # Open communication. Communication closes when this app quits.
-    kit = MicroSpecSimpleInterface(
-        # serial_number='125129',
-        # serial_number='091103',
+    Parameters
+    ----------
+    surface : :class:`pygame.Surface`
+    yrange : int
+        counts value plotted at the top of the plot
+    titles : list
+        (:class:`Text`, (x,y)) pairs
+    ticks : list
+        (:class:`Text`, x) pairs of x-axis labels, see
+        :func:`wavelength_ticks`
+    panels : list
+        (top, height) of the plot panel of each stacked kit
+    """
+
+    # Blank screen
+    surface.fill(rgb.blackestgravel)
+
+    # Full scale level
+    # top
+    pygame.draw.aaline(
+        surface,
+        rgb.darkgravel,
+        (yax_space,margin), (yax_space+max_data_length,margin) # start, end
+        )
+    # bottom
+    pygame.draw.aaline(
+        surface,
+        rgb.darkgravel,
+        (yax_space,plot_height+margin), (yax_space+max_data_length,plot_height+margin) # start, end
         )
 
-    configure_devkit(kit)
+    # AutoExpose target level
+    # example: TARGET = 46420
+    ae_y = round(plot_height + margin - plot_height/yrange * TARGET)
+    pygame.draw.aaline(
+        surface,
+        rgb.dress,
+        (yax_space,ae_y), (yax_space+max_data_length,ae_y) # start, end
+        )
+    # example: TARGET = 46420 + 3277
+    ae_y = round(plot_height + margin - plot_height/yrange * (TARGET+TOL))
+    pygame.draw.aaline(
+        surface,
+        rgb.deepgravel,
+        (yax_space,ae_y), (yax_space+max_data_length,ae_y) # start, end
+        )
+    # example: TARGET = 46420 - 3277
+    ae_y = round(plot_height + margin - plot_height/yrange * (TARGET-TOL))
+    pygame.draw.aaline(
+        surface,
+        rgb.deepgravel,
+        (yax_space,ae_y), (yax_space+max_data_length,ae_y) # start, end
+        )
+    max_dark = 4500
+    ae_y = round(plot_height + margin - plot_height/yrange * max_dark)
+    pygame.draw.aaline(
+        surface,
+        rgb.deepgravel,
+        (yax_space,ae_y), (yax_space+max_data_length,ae_y) # start, end
+        )
 
-    # --------------
-    # | Data Setup |
-    # --------------
+    # Stacked kits: full scale lines of each panel
+    for top, height in panels:
+        for y in (top, top+height):
+            pygame.draw.aaline(
+                surface,
+                rgb.darkgravel,
+                (yax_space,y), (yax_space+max_data_length,y) # start, end
+                )
 
-    # Create dummy plot data in case 1st acquired frame is dropped.
-    counts = [0 for pixels in range(start_pixel,stop_pixel+1)]
+    draw_labels(surface, titles, ticks)
 
-    # -------------
-    # | GUI Setup |
-    # -------------
+def draw_labels(surface, titles, ticks=()):
+    """Draw the titles and the wavelength axis on `surface`.
 
-    # GUI Window icon
-    chromation_logo = str(Path(_GUI).joinpath('_gui/icon.png'))
+    Part of :func:`draw_background`. The waterfall view covers the
+    plot area: draw the labels again on top of it.
+
+    Parameters
+    ----------
+    surface : :class:`pygame.Surface`
+    titles, ticks : list
+        see :func:`draw_background`
+
+    Return
+    ------
+    list
+        rects drawn
+    """
+    drawn = []
+    # Wavelength axis: ticks and labels just above the bottom line
+    ybot = plot_height+margin
+    for label, x in ticks:
+        drawn.append(pygame.draw.aaline(surface, rgb.gravel, (x,ybot), (x,ybot-4)))
+        drawn.append(surface.blit(
+            label.surface,
+            (x-label.surface.get_width()//2, ybot-4-label.surface.get_height())
+            ))
+
+    # Titles
+    for title, position in titles:
+        drawn.append(surface.blit(title.surface, position))
+    return drawn
+
+def parse_args(argv=None):
+    """Parse the ``microspec-gui`` command line.
 
-    # Create the GUI window
-    win = pygs.Window(
-        caption=f'Chromation Kit: {kit.serial.serial_number.strip("CHROMATION")}',
-        icon=chromation_logo
+    Parameters
+    ----------
+    argv : list
+        command line arguments, default is ``sys.argv[1:]``
+    """
+    parser = argparse.ArgumentParser(
+        prog='microspec-gui',
+        description='Chromation spectrometer dev-kit GUI.'
         )
+    parser.add_argument('--headless', action='store_true',
+        help='acquire without opening the GUI window (requires --record '
+             'or a --serve port)')
+    parser.add_argument('--record', metavar='FILE',
+        help='record every captured frame to binary file FILE')
+    parser.add_argument('--frames', metavar='N', type=int, default=0,
+        help='stop after N frames (default: run until quit, '
+             'or with --headless, record until Ctrl-C)')
+    parser.add_argument('--framerate', metavar='FPS', type=int, default=50,
+        help='maximum GUI frame rate, 0 is unlimited (default: 50)')
+    parser.add_argument('--average', choices=AVERAGE_MODES,
+        help='average frames: running mean, exponential moving '
+             'average, or median (key n switches mode)')
+    parser.add_argument('--average-n', metavar='N', type=int, default=8,
+        help='number of frames averaged (default: 8)')
+    parser.add_argument('--metrics', metavar='FILE',
+        help='write loop timing and frame counters to FILE once per '
+             'second, as CSV if FILE ends in .csv, else as JSON lines')
+    parser.add_argument('--track-exposure', action='store_true',
+        help='keep auto-exposing whenever the peak leaves the target '
+             '(key t turns tracking on/off)')
+    parser.add_argument('--firmware-autoexpose', action='store_true',
+        help='auto-expose with the dev-kit firmware instead of on the '
+             'host (blocks frames until done, no tracking)')
+    parser.add_argument('--hdr', metavar='MS', type=float, nargs='*',
+        help='HDR mode: capture a frame at each exposure time MS (at '
+             'least two) and plot their merge on a log scale, to see '
+             'weak and strong lines at once (default exposure times: '
+             f'{" ".join(map(str, HDR_MS))}) (key e turns HDR on/off)')
+    parser.add_argument('--waterfall', action='store_true',
+        help='start in the waterfall view: spectra over time, newest '
+             'at the top (key w switches views)')
+    parser.add_argument('--peaks', metavar='K', type=int, default=1,
+        help='mark the K largest peaks (default: 1, the main peak only)')
+    parser.add_argument('--prominence', metavar='COUNTS', type=float,
+        default=2000, help='with --peaks, mark peaks that stand out by '
+        'at least COUNTS from the surrounding spectrum (default: 2000)')
+    parser.add_argument('--peak-method', choices=PEAK_METHODS,
+        default='parabolic', help='sub-pixel peak position: vertex of a '
+        'parabola fit or centroid (default: parabolic)')
+    parser.add_argument('--cal-dir', metavar='DIR', default=CAL_DIR,
+        help='folder of stored dark and reference spectra (keys d and r '
+             f'capture them, key c turns correction on/off) (default: {CAL_DIR})')
+    parser.add_argument('--cal-frames', metavar='N', type=int, default=16,
+        help='average N frames per captured dark or reference spectrum '
+             '(default: 16)')
+    parser.add_argument('--binning', choices=('on', 'off'),
+        help='bin pixels in pairs (392 pixels per frame) or not (784 '
+             'pixels per frame) (default: on) (key b switches)')
+    parser.add_argument('--roi', metavar=('FIRST', 'LAST'), type=int, nargs=2,
+        help='meaningful pixels: auto-expose and peaks use pixel numbers '
+             'FIRST to LAST, numbered without binning (1 to 784) '
+             '(default: the range of the wavelength map)')
+    parser.add_argument('--crop', action='store_true',
+        help='plot and process only the meaningful pixels, see --roi '
+             '(key o switches)')
+    parser.add_argument('--process', metavar='STAGE', nargs='*',
+        help='post-process the frames of the selected kit on worker '
+             'processes and overlay the newest result; stages, in order: '
+             'smooth (Savitzky-Golay), baseline (subtract the baseline), '
+             'fit (Gaussian fit of the main line) (key p shows/hides, '
+             'default stages: all)')
+    parser.add_argument('--process-workers', metavar='N', type=int, default=1,
+        help='with --process, post-process on N worker processes '
+             '(default: 1)')
+    parser.add_argument('--map', metavar='FILE',
+        help='wavelength map file (default: the map named after the '
+             'kit serial number in --map-dir)')
+    parser.add_argument('--map-dir', metavar='DIR', default=MAP_DIR,
+        help=f'folder of wavelength map files (default: {MAP_DIR})')
+    parser.add_argument('--replay', metavar='FILE',
+        help='play back recording FILE instead of connecting to a kit')
+    parser.add_argument('--speed', metavar='X', type=float, default=1,
+        help='with --replay, play back X times faster than real-time, '
+             '0 plays as fast as possible (default: 1)')
+    parser.add_argument('--start', metavar='SECONDS', type=float, default=0,
+        help='with --replay, start SECONDS into the recording')
+    parser.add_argument('--serial', metavar='SN', action='append',
+        help='connect to the kit with serial number SN; repeat to '
+             'connect to several kits (key Tab selects a kit)')
+    parser.add_argument('--layout', choices=('overlaid', 'stacked'),
+        default='overlaid', help='with several kits, plot the kits that '
+        'are not selected in the same plot or in panels below it '
+        '(default: overlaid)')
+    parser.add_argument('--simulate', action='store_true',
+        help='use a simulated kit instead of connecting to a kit')
+    parser.add_argument('--sim-kits', metavar='N', type=int, default=1,
+        help='with --simulate, simulate N kits (default: 1)')
+    parser.add_argument('--sim-latency', metavar='MS', type=float, default=0,
+        help='with --simulate, add MS milliseconds to every command')
+    parser.add_argument('--sim-drop-rate', metavar='P', type=float, default=0,
+        help='with --simulate, drop frames with probability P')
+    parser.add_argument('--serve', metavar='PORT', type=int,
+        help='publish every captured frame to subscribers on TCP port '
+             'PORT, see microspecgui.stream')
+    parser.add_argument('--serve-ws', metavar='PORT', type=int,
+        help='publish every captured frame to WebSocket subscribers on '
+             'port PORT')
+    parser.add_argument('--serve-host', metavar='HOST', default='127.0.0.1',
+        help='with --serve or --serve-ws, listen on interface HOST '
+             '(default: 127.0.0.1, local subscribers only)')
+    parser.add_argument('--profile-startup', action='store_true',
+        help='print the time from launch to each step of startup, up '
+             'to the first frame plotted')
+    args = parser.parse_args(argv)
+    args.serving = args.serve is not None or args.serve_ws is not None
+    if args.headless and args.record is None and not args.serving:
+        parser.error('--headless requires --record FILE, --serve PORT or --serve-ws PORT')
+    if args.headless and args.hdr is not None:
+        parser.error('--headless cannot be used with --hdr')
+    if args.headless and args.replay is not None:
+        parser.error('--headless cannot be used with --replay')
+    if args.simulate and args.replay is not None:
+        parser.error('--simulate cannot be used with --replay')
+    if args.serial and (args.simulate or args.replay is not None):
+        parser.error('--serial cannot be used with --simulate or --replay')
+    if args.binning is not None and args.replay is not None:
+        parser.error('--binning cannot be used with --replay')
+    if args.process is not None:
+        from .postprocess import STAGES
+        for stage in args.process:
+            if stage not in STAGES:
+                parser.error(f'--process STAGE must be one of {", ".join(STAGES)}, got {stage!r}')
+    if args.hdr is not None and len({to_cycles(ms) for ms in args.hdr or HDR_MS}) < 2:
+        parser.error('--hdr needs at least two different exposure times')
+    if args.hdr is not None and (args.replay is not None or args.record is not None):
+        parser.error('--hdr cannot be used with --replay or --record')
+    if args.roi is not None and not 1 <= args.roi[0] < args.roi[1] <= 784:
+        parser.error('--roi FIRST LAST must be pixel numbers 1 <= FIRST < LAST <= 784')
+    args.num_kits = len(args.serial) if args.serial else args.sim_kits if args.simulate else 1
+    if args.num_kits > 1 and args.record is not None:
+        parser.error('--record can only record one kit')
+    return args
+
+def open_server(args):
+    """Start the server that publishes frames to subscribers.
 
-    # ---------------------------
-    # | Initialize GUI Displays |
-    # ---------------------------
-    #
-    # Initialize GUI display of auto-expose results
-    autoexpose = AutoExpose()
+    Parameters
+    ----------
+    args : argparse.Namespace
+        see :func:`parse_args`
+
+    Return
+    ------
+    :class:`microspecgui.stream.FrameServer`
+        already listening, each kit publishes on its own
+        :meth:`~microspecgui.stream.FrameServer.channel`
+    """
+    from .stream import FrameServer
+    server = FrameServer(args.serve_host, port=args.serve, ws_port=args.serve_ws)
+    server.start()
+    for protocol, host, port in server.addresses:
+        print(f"Publishing frames on {protocol}://{host}:{port}")
+    return server
 
-    # Initialize GUI display of exposure-time
-    exposure = Exposure(kit)
+def close_server(server):
+    """Disconnect the subscribers of `server` and report its counters."""
+    server.close()
+    print(f"Sent {server.sent} frames to subscribers, "
+        f"dropped {server.dropped} slow subscribers")
 
-    # Initialize GUI display of peak counts
-    peak_counts = PeakCounts()
+def open_recorder(path, kit):
+    """Create a recording of the frames captured by `kit`.
 
-    # Open the GUI window
-    win.open_window(
-        yax_space + max_data_length + 100,  # width
-        xax_space + plot_height + margin    # height
+    The header stores the pixel configuration and the exposure time
+    the kit is configured with.
+
+    Parameters
+    ----------
+    path : str
+        recording file, see :mod:`microspecgui.record`
+    kit : :class:`MicroSpecSimpleInterface`
+    """
+    return Recorder(
+        path,
+        binning=binning,
+        num_pixels=num_pixels,
+        start_pixel=start_pixel,
+        stop_pixel=stop_pixel,
+        cycles=kit.getExposure().cycles
         )
-    print(f"Display window size: {win.width}x{win.height}")
-    clock = pygs.Clock(framerate=50)
 
-    # Initialize vertical line and label of peak feature
-    peak_pixel = PeakPixel()
+def run_headless(kit, recorder=None, num_frames=0, burst=256, stream=None):
+    """Record or publish frames as fast as the kit captures them.
+
+    No window is opened and nothing is plotted. Capture stops after
+    `num_frames` frames, or at Ctrl-C if `num_frames` is 0.
+
+    Frames are captured in bursts of `burst` frames into one
+    preallocated array (see :class:`microspecgui.batch.BatchCapture`).
+    Each burst is recorded with one write, and its frames are
+    published to `stream`.
+
+    Parameters
+    ----------
+    kit : :class:`MicroSpecSimpleInterface`
+    recorder : :class:`microspecgui.record.Recorder`
+        None: do not record
+    num_frames : int
+    burst : int
+    stream : :class:`microspecgui.stream.Channel`
+        None: do not publish
+    """
+    if recorder is not None: print(f"Recording to {recorder.path}... (Ctrl-C to stop)")
+    else: print("Publishing frames... (Ctrl-C to stop)")
+    if num_frames: burst = min(burst, num_frames)
+    batch = BatchCapture(kit, burst, num_pixels=num_pixels)
+    # published frames carry the exposure time
+    if stream is not None: stream.update('getExposure', kit.getExposure())
+    captured = 0
+    dropped = 0
+    def save():
+        nonlocal captured, dropped
+        timestamps = batch.timestamps[:batch.count]
+        frames = batch.frames[:batch.count]
+        if recorder is not None: recorder.write_batch(timestamps, frames)
+        if stream is not None:
+            for timestamp, pixels in zip(timestamps, frames):
+                stream.publish(pixels, timestamp)
+        captured += batch.count
+        dropped += batch.dropped
+    start = time.perf_counter()
+    try:
+        while not num_frames or captured < num_frames:
+            # last burst: only the frames still missing
+            if num_frames: batch.capture(min(burst, num_frames - captured))
+            else: batch.capture()
+            save()
+    except KeyboardInterrupt:
+        # keep the frames of the interrupted burst
+        save()
+    except RuntimeError as error:
+        # the kit stopped sending frames: keep the frames captured
+        save()
+        print(f"Capture stopped: {error}")
+    elapsed = time.perf_counter() - start
+    print(f"{'Recorded' if recorder is not None else 'Published'} {captured} "
+        f"frames in {elapsed:.1f}s ({captured/elapsed:.1f} frames/s), "
+        f"frames dropped by kit: {dropped}")
+
+def open_kits(args):
+    """Open the kits given on the command line and configure them.
+
+    Also sets the pixel layout: binning from the recording with
+    ``--replay``, else from ``--binning``, and the meaningful pixels
+    from ``--roi``, else from the recording or the wavelength map of
+    the first kit, see :func:`pixel_range`.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        see :func:`parse_args`
+
+    Return
+    ------
+    tuple
+        (kits, wavelength_map): the first kit sets the pixel layout
+        and is recorded, `wavelength_map` is None if not known
+    """
+    if args.replay is not None:
+        # Play back a recording instead of connecting to a kit
+        kit = ReplayKit(args.replay, speed=args.speed)
+        kit.seekTime(args.start)
+        # Plot with the pixel configuration of the recording
+        new_binning = kit.header['binning']
+        new_range = (kit.header['start_pixel'], kit.header['stop_pixel'])
+        if args.roi is not None:
+            new_range = pixel_range(new_binning, roi=args.roi)
+        set_pixel_layout(new_binning, *new_range, args.crop)
+        # Show wavelengths only if a map is given
+        wavelength_map = None
+        if args.map is not None:
+            wavelength_map = open_wavelength_map(kit, args.map)
+        return [kit], wavelength_map
+
+    if args.simulate:
+        # Simulate kits: no hardware needed
+        kits = [
+            SimulatedKit(
+                latency=args.sim_latency*1e-3,
+                drop_rate=args.sim_drop_rate,
+                serial_number='SIMULATED' if args.sim_kits == 1 else f'SIMULATED{i+1}'
+                )
+            for i in range(args.sim_kits)
+            ]
+    else:
+        # Open communication with each kit, all at once, or with the
+        # first kit found. Communication closes when this app quits.
+        kits = open_devkits(args.serial or [None])
+    # The first kit sets the pixel layout and is recorded
+    kit = kits[0]
+
+    # Plot the wavelength range of the map. Set this before
+    # configuring the kit: the kit uses binning and auto-expose uses
+    # start/stop_pixel.
+    wavelength_map = open_wavelength_map(kit, args.map, args.map_dir)
+    new_binning = binning
+    if args.binning is not None:
+        new_binning = BINNING_ON if args.binning == 'on' else BINNING_OFF
+    set_pixel_layout(
+        new_binning,
+        *pixel_range(new_binning, wavelength_map, args.roi),
+        args.crop
+        )
 
-    # control data cursor with h,j,k,l or with a joystick
-    cursor = Cursor(position=yax_space+max_data_length-stop_pixel)
+    configure_devkits(kits)
+    return kits, wavelength_map
 
-    # add the last connected joystick
-    if pygame.joystick.get_count() > 0:
-        joy = pygame.joystick.Joystick(pygame.joystick.get_count()-1)
-        joy.init()
+def in_background(function, *args):
+    """Call `function` with `args` on a daemon thread.
 
-    # ------------
-    # | GUI Loop |
-    # ------------
-    quit = False
-    while not quit:
-        clock.tick()
+    A daemon thread does not keep the app running: if the user quits
+    while a kit is still connecting, the app exits without waiting for
+    the kit to reply. The kit commands run on daemon threads too, see
+    :func:`open_devkits` and :class:`microspecgui.asynckit.AsyncKit`.
 
-        '''---EVENTS---'''
+    Return
+    ------
+    :class:`concurrent.futures.Future`
+        the result (or exception) of the call
+    """
+    future = Future()
+    def run():
+        try:
+            future.set_result(function(*args))
+        except BaseException as error:
+            future.set_exception(error)
+    threading.Thread(target=run, name='microspec-connect', daemon=True).start()
+    return future
+
+def wait_connecting(win, future, message):
+    """Show `message` in the window until `future` is done.
+
+    The window stays responsive meanwhile: it is redrawn and it quits
+    on q or on the window close button.
+
+    Return
+    ------
+    bool
+        False if the user quit before `future` was done
+    """
+    text = Text(text=message, color_rgb=rgb.gravel)
+    started = time.perf_counter()
+    while True:
         for event in pygame.event.get():
-            kp = pygame.key.get_pressed()
-            km = pygame.key.get_mods()
-            cursor.get_motions_pressed(event, kp, km)
-            quit = pygs.user.quit(event, kp, km)
+            if pygs.user.quit(event, pygame.key.get_pressed(), pygame.key.get_mods()):
+                return False
+        # one more dot every half second
+        dots = int(2*(time.perf_counter() - started)) % 4
+        text.update(text=message + '.'*dots)
+        win.surface.fill(rgb.blackestgravel)
+        win.surface.blit(text.surface, (yax_space+10, margin+110))
+        pygame.display.flip()
+        # redraw 20 times per second, return as soon as done
+        if wait([future], timeout=0.05).done: return True
 
-            if event.type == pygame.JOYBUTTONDOWN:
-                if joy.get_button(6) == 1:
-                    quit = True
+def window_size(num_panels=0):
+    """Return the (width, height) of the GUI window.
 
-            if ( pygs.user.pressed_X(event, kp, km)
-                 or
-                 event.type == pygame.JOYBUTTONDOWN and joy.get_button(3) == 1
-               ): # increase exposure
+    Parameters
+    ----------
+    num_panels : int
+        stacked panels below the plot, one per kit that is not
+        selected with ``--layout stacked``
+    """
+    panel_height = plot_height//2
+    return (
+        yax_space + plot_width + 100,       # width
+        xax_space + plot_height + margin    # height
+        + num_panels*(panel_height+margin) + (margin if num_panels else 0)
+        )
 
-                # read exposure to INCREASE, convert to milliseconds
-                ms = to_ms(kit.getExposure().cycles)
+# Stages of the GUI loop timed by main()
+GUI_STAGES = ('events', 'acquire', 'plot', 'text', 'draw', 'flip')
 
-                # round milliseconds to nearest single significant digit
-                # use second-most significant when most sig digit == 0
-                if str(ms)[0] == '0':
-                    ms = float(str(ms)[0:3])
-                else:
-                    nsigdig = 1 # e.g., if exposure_ms = 123.45, want 100
-                    ms = int(round( ms, nsigdig-len(str(ms).split('.')[0])))
+def main(argv=None, laps=None, stats=None):
+    """Run the ``microspec-gui`` application.
 
-                # INCREMENT significant digit
-                # use second-most significant when most sig digit == 0
-                if (str(ms)[0] == '0'):
-                    ms = float(str(float(str(ms)[0:3])+0.1).format(".3f"))
-                else:
-                    # increment first leading digit ('1:9')
-                    ms = int(str(int(str(ms)[0])+1)+str(ms)[1:])
-
-                # set new exposure
-                kit.setExposure( to_cycles(ms) )
-
-                # get new exposure for reporting in GUI
-                exposure.cycles = kit.getExposure().cycles
-
-                # update GUI label "exposure"
-                exposure.ms_text.update(text=f'{to_ms(exposure.cycles):.2f}ms', color_rgb=rgb.saltwatertaffy)
-                exposure.cycles_text.update(text=f'{exposure.cycles} cycles', color_rgb=rgb.dirtyblonde)
-                # grey out GUI labels "success" and "iterations"
-                autoexpose.hitmiss.update(text=f'{"HIT TARGET" if autoexpose.is_success else "GAVE UP"}', color_rgb=rgb.darkgravel)
-                autoexpose.iterations.update(text=f'iterations: {autoexpose.num_tries}', color_rgb=rgb.darkgravel)
-
-            if ( pygs.user.pressed_x(event, kp, km)
-                 or
-                 event.type == pygame.JOYBUTTONDOWN and joy.get_button(2) == 1
-               ):  # decrease exposure
-
-                # read exposure to DECREASE, convert to milliseconds
-                ms = to_ms(kit.getExposure().cycles)
-
-                # round milliseconds to nearest single significant digit
-                # use second-most significant when most sig digit == 0
-                if str(ms)[0] == '0':
-                    ms = float(str(ms)[0:3])
-                else:
-                    nsigdig = 1 # e.g., if exposure_ms = 123.45, want 100
-                    ms = int(round( ms, nsigdig-len(str(ms).split('.')[0])))
-
-                # DECREMENT significant digit
-                # use second-most significant when most sig digit == 0
-                # also use second-most significant digit when round(ms) == 1ms
-                if (str(ms)[0] == '0') or (ms == 1):
-                    ms = float(str(float(str(ms)[0:3])-0.1).format(".3f"))
-                # carry when most significant digit == 1
-                elif str(ms)[0] == '1':
-                    # decrement using first two leading digits ('10')
-                    ms = int(str(int(str(ms)[0:2])-1)+str(ms)[2:])
-                else:
-                    # decrement first leading digit ('2:9')
-                    ms = int(str(int(str(ms)[0:1])-1)+str(ms)[1:])
-
-                # set new exposure
-                kit.setExposure( to_cycles(ms) )
-
-                # get new exposure for reporting in GUI
-                exposure.cycles = kit.getExposure().cycles
-
-                # update GUI label "exposure"
-                exposure.ms_text.update(text=f'{to_ms(exposure.cycles):.2f}ms', color_rgb=rgb.saltwatertaffy)
-                exposure.cycles_text.update(text=f'{exposure.cycles} cycles', color_rgb=rgb.dirtyblonde)
-                # grey out GUI labels "success" and "iterations"
-                autoexpose.hitmiss.update(text=f'{"HIT TARGET" if autoexpose.is_success else "GAVE UP"}', color_rgb=rgb.darkgravel)
-                autoexpose.iterations.update(text=f'iterations: {autoexpose.num_tries}', color_rgb=rgb.darkgravel)
-
-            if ( pygs.user.pressed_spacebar(event, kp)
-                 or
-                 pygs.user.pressed_a(event, kp, km)
-                 or
-                 event.type == pygame.JOYBUTTONDOWN and joy.get_button(0) == 1
-               ): # autoexpose
-
-                # auto-expose
-                reply = kit.autoExposure()
-
-                # get algorithm results for reporting in GUI
-                autoexpose.is_success = True if reply.success else False
-                autoexpose.num_tries = reply.iterations
-
-                # update GUI labels "success" and "iterations"
-                autoexpose.hitmiss.update(text=f'{"HIT TARGET" if autoexpose.is_success else "GAVE UP"}', color_rgb=rgb.dirtyblonde)
-                autoexpose.iterations.update(text=f'iterations: {autoexpose.num_tries}', color_rgb=rgb.dirtyblonde)
-
-                # get new exposure for reporting in GUI
-                exposure.cycles = kit.getExposure().cycles
-
-                # update GUI label "exposure"
-                exposure.ms_text.update(text=f'{to_ms(exposure.cycles):.2f}ms', color_rgb=rgb.saltwatertaffy)
-                exposure.cycles_text.update(text=f'{exposure.cycles} cycles', color_rgb=rgb.dirtyblonde)
-
-        '''---UPDATE PIXEL NUMBER LABEL---'''
-        cursor.move()
-        cursor.text.update(text=f'{cursor.pixel_number}')
-
-        '''--- ACQUIRE SPECTRUM ---'''
-        # capture one frame
-        frame = kit.captureFrame()
-
-        # Exception: 'NoneType' object has no attribute 'pixels'
-        # This is rare but it causes the application to quit.
-        # Instead of quitting, just ignore the dropped frame and
-        # replot the previous value of `counts`.
-        if frame is not None: counts = frame.pixels
-
-        '''--- CREATE PLOT DATA ---'''
-        # put short wavelengths on left side of plot
-        # counts.reverse()
-        # create x-axis: 1,2,...,391,392
-        pixnum = list(range(1,len(counts)+1))
-        # convert to screen pixels 0:391 + yax_space
-        screen_pixels = [(p-1)+yax_space for p in pixnum]
-        # put short wavelengths on left side of plot
-        screen_pixels.reverse()
-
-        # display peak
-        peak_counts.value = max(counts[start_pixel-1:stop_pixel])
-        peak_counts.text.update(text=f'peak: {peak_counts.value}')
-        # TODO: correct this for offset-by-one and for mirrored x-axis
-        # TODO: turn this into a single update call
-        peak_pixel.line.position = screen_pixels[counts.index(peak_counts.value)] # screen pixel number
-        peak_pixel.value = pixnum[counts.index(peak_counts.value)] # actual pixel number
-        peak_pixel.text.update(text=f'{peak_pixel.value}')
-
-        # update cursor pixel text using screen_pixels
-        # todo: add a hard limit to the cursor, otherwise this will take us outside
-        # the range of screen_pixels
-        cursor.pixel_number = pixnum[screen_pixels.index(cursor.position)]
-
-        # scale counts to plot height
-        yrange = 65535
-        counts = pygs.plot.scale_data_to_fixed_yrange(counts, plot_height, yrange)
-
-        # flip to plot upright
-        counts = [ plot_height + margin - val for val in counts ]
-
-        # turn x and y data arrays into x,y coordinate pairs
-        zipped = list(zip(screen_pixels, counts))
-
-        '''--- UPDATE SCREEN ---'''
-        # Blank screen
-        win.surface.fill(rgb.blackestgravel)
+    Parameters
+    ----------
+    argv : list
+        command line arguments, see :func:`parse_args`
+    laps : :class:`microspecgui.metrics.Laps`
+        record the duration of each of the :data:`GUI_STAGES` of every
+        frame here, default is a new :class:`Laps`
+    stats : dict
+        if given, filled when the GUI quits with 'laps' (the GUI loop
+        :class:`Laps`), 'capture_laps' (the acquisition worker
+        :class:`Laps`), frame counts 'captured', 'plotted',
+        'dropped', 'overwritten', and 'startup' (seconds from launch
+        to each step of startup, see :class:`Milestones`)
+    """
+    args = parse_args(argv)
+    startup = Milestones(start=_STARTED)
+    startup.mark('imports', at=_IMPORTED)
+
+    # Publish every captured frame to local subscribers
+    server = None
+    if args.serving:
+        server = open_server(args)
+
+    # Record or publish without the GUI
+    if args.headless:
+        kits, wavelength_map = open_kits(args)
+        kit = kits[0]
+        stream = None
+        if server is not None:
+            stream = server.channel(kit.serial.serial_number.strip("CHROMATION"))
+        try:
+            if args.record is None:
+                run_headless(kit, num_frames=args.frames, stream=stream)
+            else:
+                with open_recorder(args.record, kit) as recorder:
+                    run_headless(kit, recorder, args.frames, stream=stream)
+        finally:
+            if server is not None: close_server(server)
+        return
 
-        # Full scale level
-        # top
-        pygame.draw.aaline(
-            win.surface,
-            rgb.darkgravel,
-            (yax_space,margin), (yax_space+len(counts),margin) # start, end
-            )
-        # bottom
-        pygame.draw.aaline(
-            win.surface,
-            rgb.darkgravel,
-            (yax_space,plot_height+margin), (yax_space+len(counts),plot_height+margin) # start, end
-            )
+    # ----------------------
+    # | Spectrometer Setup |
+    # ----------------------
+    #
+    # Open the window first and connect to the kits in the background:
+    # the window shows up at once, even if a kit is slow to reply.
 
-        # AutoExpose target level
-        # example: TARGET = 46420
-        ae_y = round(plot_height + margin - plot_height/yrange * TARGET)
-        pygame.draw.aaline(
-            win.surface,
-            rgb.dress,
-            (yax_space,ae_y), (yax_space+len(counts),ae_y) # start, end
-            )
-        # example: TARGET = 46420 + 3277
-        ae_y = round(plot_height + margin - plot_height/yrange * (TARGET+TOL))
-        pygame.draw.aaline(
-            win.surface,
-            rgb.deepgravel,
-            (yax_space,ae_y), (yax_space+len(counts),ae_y) # start, end
-            )
-        # example: TARGET = 46420 - 3277
-        ae_y = round(plot_height + margin - plot_height/yrange * (TARGET-TOL))
-        pygame.draw.aaline(
-            win.surface,
-            rgb.deepgravel,
-            (yax_space,ae_y), (yax_space+len(counts),ae_y) # start, end
-            )
-        max_dark = 4500
-        ae_y = round(plot_height + margin - plot_height/yrange * max_dark)
-        pygame.draw.aaline(
-            win.surface,
-            rgb.deepgravel,
-            (yax_space,ae_y), (yax_space+len(counts),ae_y) # start, end
-            )
+    # GUI Window icon
+    chromation_logo = str(_GUI.joinpath('_gui/icon.png'))
 
-        # Draw plot: meaningful data
-        meaningful_data = zipped[start_pixel-1:stop_pixel]
-        ignored_lower_data = zipped[0:start_pixel-1]
-        ignored_upper_data = zipped[stop_pixel:]
-        pygame.draw.aalines(
-            win.surface,
-            rgb.mediumgravel,
-            False, # if True, connect first and last points
-            ignored_lower_data # XY plot data [(x0,y0), ... (xn,yn)]
-            )
-        pygame.draw.aalines(
-            win.surface,
-            rgb.gravel,
-            False, # if True, connect first and last points
-            ignored_upper_data # XY plot data [(x0,y0), ... (xn,yn)]
-            )
-        pygame.draw.aalines(
-            win.surface,
-            rgb.saltwatertaffy,
-            False, # if True, connect first and last points
-            meaningful_data # XY plot data [(x0,y0), ... (xn,yn)]
-            )
+    # Create the GUI window, sized for the default pixel layout
+    win = Window(icon=chromation_logo)
+    stacked = args.num_kits-1 if args.layout == 'stacked' else 0
+    win.open_window(*window_size(stacked))
+    startup.mark('window')
 
-        # Draw pixel label
-        win.surface.blit(cursor.text.surface, (cursor.position+2, win.height-xax_space))
-        win.surface.blit(exposure.title.surface,    (yax_space+max_data_length-140, margin+110))
-        win.surface.blit(exposure.ms_text.surface,     (yax_space+max_data_length-120, margin+130))
-        win.surface.blit(exposure.cycles_text.surface, (yax_space+max_data_length-120, margin+150))
-        win.surface.blit(autoexpose.title.surface,              (yax_space+10, margin+110))
-        win.surface.blit(autoexpose.hitmiss.surface,         (yax_space+30, margin+130))
-        win.surface.blit(autoexpose.iterations.surface,      (yax_space+30, margin+150))
-        win.surface.blit(peak_counts.text.surface,            (yax_space+10, margin+190))
-        win.surface.blit(peak_pixel.text.surface, (peak_pixel.line.position+2, win.height-round(xax_space/2)))
-        # Draw vertical line through peak feature
-        pygame.draw.aaline(
-            win.surface,
-            peak_pixel.line.color,
-            (peak_pixel.line.position, peak_pixel.line.ybot), # start
-            (peak_pixel.line.position, peak_pixel.line.ytop) # end
-            )
+    connecting = in_background(open_kits, args)
+
+    # Meanwhile, set up the GUI displays that do not depend on the kits
+
+    # Initialize GUI display of peak counts
+    peak_counts = PeakCounts()
+
+    # Initialize vertical line and label of peak feature
+    peak_pixel = PeakPixel()
+    # and markers of the other peaks
+    peak_markers = [PeakMarker() for peak in range(args.peaks-1)]
+
+    # Loop timing and frame counters, see key m and --metrics
+    metrics = MetricsOverlay(GUI_STAGES)
+
+    message = (
+        'Opening recording' if args.replay is not None
+        else f'Connecting to {args.num_kits} dev-kits' if args.num_kits > 1
+        else 'Connecting to dev-kit'
+        )
+    if not wait_connecting(win, connecting, message):
+        if server is not None: close_server(server)
+        return
+    try:
+        kits, wavelength_map = connecting.result()
+    except Exception as error:
+        # e.g., no kit found, or a kit that stops replying
+        print(f"{message} failed: {error}")
+        if server is not None: close_server(server)
+        return
+    kit = kits[0]
+    startup.mark('connected')
+    pygame.display.set_caption(f'Chromation Kit: {kit.serial.serial_number.strip("CHROMATION")}')
+
+    # Record every captured frame
+    recorder = None
+    if args.record is not None:
+        recorder = open_recorder(args.record, kit)
+
+    # --------------
+    # | Data Setup |
+    # --------------
+
+    # Plot full scale is the largest 16-bit counts value
+    yrange = 65535
+
+    # ---------------------------
+    # | Initialize GUI Displays |
+    # ---------------------------
+    #
+    # Initialize each kit's display of exposure-time and auto-expose
+    # results. Keys act on the selected kit (Tab selects the next).
+    devices = [
+        Device(k, color=DEVICE_COLORS[i % len(DEVICE_COLORS)])
+        for i, k in enumerate(kits)
+        ]
+    selected = 0
+    device = devices[selected]
+
+    # GUI display of auto-expose results of the selected kit
+    autoexpose = device.autoexpose
+
+    # GUI display of exposure-time of the selected kit
+    exposure = device.exposure
+
+    # Plot geometry of each pixel configuration, computed once: keys
+    # b and o switch configurations
+    layouts = {}
+    layout = layouts[layout_key()] = Layout(
+        args, len(kits), wavelength_map, exposure, autoexpose, yrange
+        )
+    trace, noise_trace, other_traces, panels = (
+        layout.trace, layout.noise_trace, layout.other_traces, layout.panels
+        )
+    waterfall, peak_finder, wavelengths, processed_trace = (
+        layout.waterfall, layout.peak_finder, layout.wavelengths, layout.processed_trace
+        )
+    crop = args.crop
 
-        # Draw pixel label line
-        pygame.draw.aaline(
-            win.surface,
-            cursor.color,
-            (cursor.position, cursor.ybot), # start
-            (cursor.position,cursor.ytop) # end
+    # -------------
+    # | GUI Setup |
+    # -------------
+
+    # Resize the window if the kits changed the pixel layout, e.g., a
+    # recording made without pixel binning
+    if layout.size != (win.width, win.height):
+        win.open_window(*layout.size)
+    print(f"Display window size: {win.width}x{win.height}")
+    clock = pygs.Clock(framerate=args.framerate)
+
+    # Initialize frame averaging and its GUI display
+    averaging = Averaging(max_data_length, mode=args.average, n=args.average_n)
+
+    # Dark and reference spectra of each kit, loaded from disk once.
+    # With a reference, 1.0 (counts equal to the reference) plots at
+    # full scale.
+    for dev in devices:
+        dev.calibration = Calibration(
+            dev.serial_number,
+            args.cal_dir,
+            num_frames=args.cal_frames,
+            scale=yrange
             )
+    correction = Correction()
+
+    # Waterfall view instead of the traces, see key w
+    show_waterfall = args.waterfall
+
+    # Exposure ladder of HDR mode in cycles, see key e
+    hdr_ladder = tuple(sorted({to_cycles(ms) for ms in args.hdr or HDR_MS}))
+    # HDR frames on a log scale
+    log_counts = np.zeros(max_data_length)
+
+    # Smoothing, baseline removal and line fitting on worker
+    # processes, see key p
+    post = PostProcessing(
+        args.process,
+        workers=args.process_workers,
+        visible=args.process is not None
+        )
+
+    # CSV/JSON-lines export of the metrics, see --metrics
+    metrics_writer = None
 
-        # Flip to new surface drawing
+    # from here on, always stop the workers, see the finally clause
+    try:
+        # control data cursor with h,j,k,l or with a joystick
+        cursor = Cursor()
+        cursor.set_range(trace)
+        cursor.position = cursor.home_position
+
+        # Keyboard and joystick input. The joystick is started after the
+        # first frame, see Window.
+        controls = Controls()
+
+        # Erase each frame by blitting from the background of the layout
+        win.surface.blit(layout.background, (0,0))
         pygame.display.flip()
+        # screen regions drawn on in the last frame
+        dirty = []
+
+        # Capture frames in the background. From here on, only the
+        # acquisition worker talks to the kit.
+        # Auto-expose on the host, one step per frame, unless asked to use
+        # the firmware. A recording cannot change exposure: replay always
+        # uses the firmware stand-in.
+        # Each kit has its own worker and its own auto-expose.
+        host_autoexpose = not (args.firmware_autoexpose or isinstance(kit, ReplayKit))
+        for dev in devices:
+            controller = None
+            if host_autoexpose:
+                controller = ExposureController(
+                    start_pixel, stop_pixel,
+                    target=TARGET,
+                    tol=TOL,
+                    max_tries=MAX_TRIES,
+                    max_cycles=MAX_EXPOSURE
+                    )
+            dev.acq = Acquisition(
+                dev.kit,
+                recorder=recorder if dev.kit is kit else None,
+                autoexpose=controller,
+                stream=None if server is None else server.channel(dev.serial_number)
+                )
+            dev.acq.start()
+            if host_autoexpose and args.track_exposure:
+                dev.autoexpose.tracking = True
+                dev.acq.send('hostAutoExposure', True)
+            if args.hdr is not None:
+                dev.acq.send('startHdr', hdr_ladder)
+        # worker of the selected kit
+        acq = device.acq
+        # metrics follow the first kit
+        monitored = devices[0].acq
+
+        # Summarize loop timing and frame counters once per second,
+        # display them with key m, and export them with --metrics
+        if laps is None: laps = Laps(GUI_STAGES)
+        monitor = Monitor(laps, monitored.laps)
+        if args.metrics is not None:
+            metrics_writer = MetricsWriter(args.metrics)
+        # GUI frames that re-plot old counts because no new frame arrived
+        stale = 0
+        startup.mark('setup')
+
+        # ------------
+        # | GUI Loop |
+        # ------------
+        quit = False
+        while not quit:
+            clock.tick()
+            laps.start()
+
+            '''---EVENTS---'''
+            for action in controls.read(pygame.event.get()):
+
+                if action == 'quit':
+                    quit = True
 
+                elif action in ('increase_exposure', 'decrease_exposure'):
+                    # step to the next exposure time up or down, see
+                    # EXPOSURE_STEPS (GUI label updates when kit replies)
+                    direction = 1 if action == 'increase_exposure' else -1
+                    cycles = step_exposure(exposure.cycles, direction)
+
+                    # exposure set by hand: stop tracking
+                    if autoexpose.tracking:
+                        autoexpose.tracking = False
+                        acq.send('stopAutoExposure')
+                    acq.send('setExposure', cycles)
+
+                    # grey out GUI labels "success" and "iterations"
+                    autoexpose.hitmiss.update(text=f'{"HIT TARGET" if autoexpose.is_success else "GAVE UP"}', color_rgb=rgb.darkgravel)
+                    autoexpose.iterations.update(text=f'iterations: {autoexpose.num_tries}', color_rgb=rgb.darkgravel)
+
+                elif action == 'hdr':
+                    # turn HDR mode on/off (GUI labels update when kit replies)
+                    if device.hdr is not None:
+                        acq.send('stopHdr')
+                    elif recorder is not None or isinstance(kit, ReplayKit):
+                        print("HDR mode cannot start while recording or replaying")
+                    else:
+                        # HDR mode stops auto-expose
+                        autoexpose.tracking = False
+                        acq.send('startHdr', hdr_ladder)
+
+                elif action in ('skip_back', 'skip_forward'):
+                    # skip back/forward 10 seconds in a recording
+                    if isinstance(kit, ReplayKit):
+                        acq.send('skip', 10 if action == 'skip_forward' else -10)
+
+                elif action == 'next_kit':
+                    # select the next kit
+                    selected = (selected+1) % len(devices)
+                    device = devices[selected]
+                    acq = device.acq
+                    exposure = device.exposure
+                    autoexpose = device.autoexpose
+                    # do not average frames of different kits
+                    if averaging.averager is not None: averaging.averager.reset()
+                    pygame.display.set_caption(f'Chromation Kit: {device.serial_number}')
+
+                elif action in ('binning', 'crop'):
+                    # switch pixel binning on/off, or crop to the meaningful
+                    # pixels on/off
+                    new_binning = binning
+                    if action == 'binning':
+                        # recordings hold frames of one pixel configuration
+                        if recorder is not None or isinstance(kit, ReplayKit):
+                            print("Pixel binning cannot change while recording or replaying")
+                            continue
+                        new_binning = BINNING_OFF if binning else BINNING_ON
+                    else:
+                        crop = not crop
+                    new_range = pixel_range(new_binning, wavelength_map, args.roi)
+                    # the pixel under the cursor, in the new binning
+                    pixel = cursor.pixel_number
+                    if new_binning != binning:
+                        pixel = (pixel+1)//2 if new_binning else 2*pixel
+                        # frames of the new size are captured after these
+                        # commands, the GUI skips the frames before them
+                        for dev in devices:
+                            dev.acq.send('setSensorConfig', new_binning, GAIN_1X, ALL_ROWS_ACTIVE)
+                            dev.acq.send('setAutoExposeConfig',
+                                MAX_TRIES, *new_range, TARGET, TOL, MAX_EXPOSURE
+                                )
+                    set_pixel_layout(new_binning, *new_range, crop)
+                    # swap in the layout of the new pixel configuration
+                    layout = layouts.get(layout_key())
+                    if layout is None:
+                        layout = layouts[layout_key()] = Layout(
+                            args, len(kits), wavelength_map, exposure, autoexpose, yrange
+                            )
+                    trace, noise_trace, other_traces, panels = (
+                        layout.trace, layout.noise_trace, layout.other_traces, layout.panels
+                        )
+                    waterfall, peak_finder, wavelengths, processed_trace = (
+                        layout.waterfall, layout.peak_finder, layout.wavelengths, layout.processed_trace
+                        )
+                    averaging.resize(max_data_length)
+                    post.result = None
+                    for dev in devices:
+                        dev.counts = np.zeros(max_data_length, dtype=FRAME_DTYPE)
+                    cursor.set_range(trace)
+                    cursor.position = trace.position(min(max(pixel, first_pixel), last_pixel))
+                    # redraw the whole window
+                    if layout.size != (win.width, win.height):
+                        win.open_window(*layout.size)
+                    win.surface.blit(layout.background, (0,0))
+                    pygame.display.flip()
+                    dirty = []
+
+                elif action == 'waterfall':
+                    # switch between trace and waterfall view
+                    show_waterfall = not show_waterfall
+
+                elif action == 'average':
+                    # switch frame averaging mode
+                    averaging.next_mode()
+
+                elif action == 'postprocess':
+                    # show/hide the post-processed frame
+                    post.toggle()
+
+                elif action == 'noise':
+                    # show/hide noise of averaged frames
+                    averaging.show_noise = not averaging.show_noise
+
+                elif action in ('capture_dark', 'capture_reference'):
+                    # capture a dark (light blocked) or reference spectrum
+                    device.calibration.start('dark' if action == 'capture_dark' else 'reference')
+
+                elif action == 'correction':
+                    # turn dark and reference correction on/off
+                    correction.enabled = not correction.enabled
+
+                elif action == 'metrics':
+                    # show/hide metrics
+                    metrics.visible = not metrics.visible
+
+                elif action == 'autoexpose':
+                    # auto-expose (GUI labels update when kit replies)
+                    if host_autoexpose:
+                        acq.send('hostAutoExposure', autoexpose.tracking)
+                    else:
+                        acq.send('autoExposure')
+
+                elif action == 'track_exposure':
+                    # start/stop tracking exposure
+                    if host_autoexpose:
+                        autoexpose.tracking = not autoexpose.tracking
+                        if autoexpose.tracking:
+                            acq.send('hostAutoExposure', True)
+                        else:
+                            acq.send('stopAutoExposure')
+
+            '''---DEV-KIT REPLIES---'''
+            for dev in devices:
+                while not dev.acq.replies.empty():
+                    name, reply = dev.acq.replies.get_nowait()
+
+                    if name == 'autoExposure':
+                        # get algorithm results for reporting in GUI
+                        dev.autoexpose.is_success = True if reply.success else False
+                        dev.autoexpose.num_tries = reply.iterations
+
+                        # update GUI labels "success" and "iterations"
+                        dev.autoexpose.hitmiss.update(text=f'{"HIT TARGET" if dev.autoexpose.is_success else "GAVE UP"}', color_rgb=rgb.dirtyblonde)
+                        dev.autoexpose.iterations.update(text=f'iterations: {dev.autoexpose.num_tries}', color_rgb=rgb.dirtyblonde)
+
+                    if name == 'getExposure':
+                        # get new exposure for reporting in GUI
+                        dev.exposure.cycles = reply.cycles
+
+                        # update GUI label "exposure"
+                        dev.exposure.ms_text.update(text=f'{to_ms(dev.exposure.cycles):.2f}ms', color_rgb=rgb.saltwatertaffy)
+                        dev.exposure.cycles_text.update(text=f'{dev.exposure.cycles} cycles', color_rgb=rgb.dirtyblonde)
+
+                    if name in ('startHdr', 'stopHdr'):
+                        dev.set_hdr(reply)
+
+                    # update the label shown when the kit is not selected
+                    dev.update_info()
+
+            # move the cursor: all motions of this frame at once
+            if controls.motion.jump or controls.motion.step:
+                cursor.move(controls.motion)
+            laps.lap('events')
+
+            '''--- ACQUIRE SPECTRUM ---'''
+            # get the newest frame of each kit from its acquisition worker
+            fresh = False # a new frame of the selected kit arrived
+            for dev in devices:
+                frame = dev.acq.frames.latest()
+                pixels = None
+                # skip frames captured before pixel binning changed
+                if frame is not None and len(frame[0]) == num_pixels:
+                    pixels, cycles = frame
+
+                # No new frame since the last loop (or the kit dropped it):
+                # replot the previous value of `counts`.
+                if pixels is not None:
+                    # capture dark or reference spectrum, if asked to
+                    # (keyed on the exposure time of the frame, not on the
+                    # last exposure time the kit replied with)
+                    dev.calibration.add(pixels, binning, cycles)
+                    # process the plotted pixels only
+                    pixels = pixels[layout.pixels]
+                    dev.counts = pixels
+                    dev.cycles = cycles
+                    if dev is device: fresh = True
+                    # average new frames of the selected kit only
+                    if dev is device and averaging.averager is not None:
+                        averaging.add(pixels, cycles)
+                    # and add them to the waterfall
+                    if dev is device: waterfall.add(pixels)
+                elif dev.acq is monitored: stale += 1
+            counts = device.counts
+            laps.lap('acquire')
+
+            '''--- CREATE PLOT DATA ---'''
+            # plot the average if averaging, else the newest frame
+            averaged = averaging.averager is not None and averaging.averager.count > 0
+            plotted = averaging.averager.average if averaged else counts
+
+            # correct with the dark and reference spectra of the selected kit
+            correction.update(device.calibration, device.cycles)
+            # HDR: plot the extended range on a log scale, unless corrected
+            # with a reference: then the plot is a fraction of full scale
+            log_plot = device.hdr is not None and 'reference' not in correction.applied
+            if correction.applied:
+                plotted = device.calibration.correct(
+                    plotted, binning, device.cycles, layout.pixels
+                    )
+                # keep the trace in the plot (or on the log scale)
+                np.clip(plotted, 0, None if log_plot else yrange, out=plotted)
+
+            # find peaks in the meaningful data, main peak first
+            peaks = peak_finder.find(plotted)
+            peak_counts.value = int(round(peaks[0].counts))
+            peak_pixel.line.position = trace.screen_x(peaks[0].index) # screen x
+            peak_pixel.value = peaks[0].pixel # fractional pixel number
+
+            # update cursor pixel text using the trace x-axis (the cursor
+            # stays on the plotted pixels)
+            cursor.pixel_number = trace.pixel_number(cursor.position)
+
+            # post-process new frames if a worker is free, and show the
+            # newest result of the current pixel layout
+            if post.visible:
+                if fresh:
+                    post.processor.submit(
+                        plotted,
+                        window=(peak_finder.start, peak_finder.stop),
+                        tag=layout_key()
+                        )
+                result = post.processor.poll()
+                if result is not None and result.tag == layout_key():
+                    post.update(result, wavelengths)
+                    spectrum = result.spectrum
+                    if log_plot:
+                        spectrum = log_scale(spectrum, 65535*device.hdr[-1]/device.hdr[0], spectrum)
+                    processed_trace.update(spectrum)
+
+            shown = plotted
+            if log_plot:
+                if len(log_counts) != len(plotted): log_counts = np.zeros(len(plotted))
+                shown = log_scale(plotted, 65535*device.hdr[-1]/device.hdr[0], log_counts)
+
+            # scale counts to plot height and flip to plot upright
+            trace.update(shown)
+            # the other kits, in order after the selected kit
+            others = devices[selected+1:] + devices[:selected]
+            for dev, other_trace in zip(others, other_traces):
+                other_trace.update(dev.counts)
+            if averaged and averaging.show_noise:
+                noise_trace.update(averaging.standard_deviation())
+            laps.lap('plot')
+
+            '''--- UPDATE LABELS ---'''
+            cursor.text.update(text=pixel_label(cursor.pixel_number, wavelengths))
+            if 'reference' in correction.applied:
+                # fraction of the reference
+                peak_counts.text.update(text=f'peak: {peak_counts.value/yrange:.3f}')
+            else:
+                peak_counts.text.update(text=f'peak: {peak_counts.value}')
+            peak_pixel.text.update(text=pixel_label(peak_pixel.value, wavelengths, decimals=2))
+            for marker, peak in zip(peak_markers, peaks[1:]):
+                marker.text.update(text=pixel_label(peak.pixel, wavelengths, decimals=1))
+            laps.lap('text')
+
+            '''--- UPDATE SCREEN ---'''
+            # Erase last frame's drawing by restoring the background
+            for rect in dirty:
+                win.surface.blit(layout.background, rect, rect)
+            drawn = []
+
+            # Draw the waterfall in place of the traces
+            if show_waterfall:
+                drawn.extend(waterfall.draw(win.surface, (yax_space, margin)))
+                drawn.extend(draw_labels(win.surface, layout.titles, layout.ticks))
+
+            # Draw noise of averaged frames
+            if averaged and averaging.show_noise and not show_waterfall:
+                drawn.append(pygame.draw.aalines(
+                    win.surface,
+                    rgb.toffee,
+                    False, # if True, connect first and last points
+                    noise_trace.xy # XY plot data [(x0,y0), ... (xn,yn)]
+                    ))
+
+            # Draw the other kits and their labels
+            for slot, (dev, other_trace) in enumerate(zip(others, other_traces)):
+                if panels or not show_waterfall:
+                    drawn.append(pygame.draw.aalines(
+                        win.surface,
+                        dev.color,
+                        False, # if True, connect first and last points
+                        other_trace.xy # XY plot data [(x0,y0), ... (xn,yn)]
+                        ))
+                if panels:
+                    # stacked: serial number and exposure in the panel
+                    x, y = yax_space+5, panels[slot][0]+2
+                    drawn.append(win.surface.blit(dev.name.surface, (x, y)))
+                    x += dev.name.surface.get_width() + 10
+                else:
+                    # overlaid: legend right of the plot
+                    x, y = yax_space+plot_width+5, margin + slot*36
+                    drawn.append(win.surface.blit(dev.name.surface, (x, y)))
+                    y += dev.name.surface.get_height()
+                drawn.append(win.surface.blit(dev.info.surface, (x, y)))
+
+            # Draw plot: meaningful data
+            if not show_waterfall:
+                meaningful_data = trace.meaningful
+                ignored_lower_data = trace.ignored_lower
+                ignored_upper_data = trace.ignored_upper
+                # cropped: no ignored data
+                if len(ignored_lower_data) > 1:
+                    drawn.append(pygame.draw.aalines(
+                        win.surface,
+                        rgb.mediumgravel,
+                        False, # if True, connect first and last points
+                        ignored_lower_data # XY plot data [(x0,y0), ... (xn,yn)]
+                        ))
+                if len(ignored_upper_data) > 1:
+                    drawn.append(pygame.draw.aalines(
+                        win.surface,
+                        rgb.gravel,
+                        False, # if True, connect first and last points
+                        ignored_upper_data # XY plot data [(x0,y0), ... (xn,yn)]
+                        ))
+                drawn.append(pygame.draw.aalines(
+                    win.surface,
+                    rgb.saltwatertaffy,
+                    False, # if True, connect first and last points
+                    meaningful_data # XY plot data [(x0,y0), ... (xn,yn)]
+                    ))
+                # Draw the newest post-processed frame on top
+                if post.visible and post.result is not None:
+                    drawn.append(pygame.draw.aalines(
+                        win.surface,
+                        rgb.dalespale,
+                        False, # if True, connect first and last points
+                        processed_trace.xy # XY plot data [(x0,y0), ... (xn,yn)]
+                        ))
+
+            # Draw pixel label
+            drawn.append(win.surface.blit(cursor.text.surface, (cursor.position+2, plot_height+margin)))
+            drawn.append(win.surface.blit(exposure.ms_text.surface,     (yax_space+plot_width-120, margin+130)))
+            drawn.append(win.surface.blit(exposure.cycles_text.surface, (yax_space+plot_width-120, margin+150)))
+            if device.hdr is not None:
+                drawn.append(win.surface.blit(exposure.hdr_text.surface, (yax_space+plot_width-120, margin+170)))
+            drawn.append(win.surface.blit(autoexpose.hitmiss.surface,         (yax_space+30, margin+130)))
+            drawn.append(win.surface.blit(autoexpose.iterations.surface,      (yax_space+30, margin+150)))
+            if autoexpose.tracking:
+                drawn.append(win.surface.blit(autoexpose.tracking_text.surface, (yax_space+30, margin+170)))
+            drawn.append(win.surface.blit(peak_counts.text.surface,            (yax_space+10, margin+190)))
+            if averaging.mode is not None:
+                drawn.append(win.surface.blit(averaging.text.surface,          (yax_space+10, margin+215)))
+            if correction.text.text:
+                drawn.append(win.surface.blit(correction.text.surface,         (yax_space+10, margin+235)))
+            if post.visible and post.text.text:
+                drawn.append(win.surface.blit(post.text.surface,               (yax_space+10, margin+255)))
+            drawn.append(win.surface.blit(peak_pixel.text.surface, (peak_pixel.line.position+2, plot_height+margin+round(xax_space/2))))
+            # Draw vertical line through peak feature
+            drawn.append(pygame.draw.aaline(
+                win.surface,
+                peak_pixel.line.color,
+                (peak_pixel.line.position, peak_pixel.line.ybot), # start
+                (peak_pixel.line.position, peak_pixel.line.ytop) # end
+                ))
+
+            # Mark the other peaks: short line and label above the peak
+            for marker, peak in zip(peak_markers, peaks[1:]):
+                x = trace.screen_x(peak.index)
+                y = trace.xy[int(round(peak.index)),1]
+                drawn.append(pygame.draw.aaline(
+                    win.surface,
+                    marker.color,
+                    (x, y-4), # start
+                    (x, y-14) # end
+                    ))
+                drawn.append(win.surface.blit(marker.text.surface, (x+2, max(y-26, 0))))
+
+            # Draw pixel label line
+            drawn.append(pygame.draw.aaline(
+                win.surface,
+                cursor.color,
+                (cursor.position, cursor.ybot), # start
+                (cursor.position,cursor.ytop) # end
+                ))
+
+            # Draw metrics
+            if metrics.visible:
+                drawn.extend(metrics.draw(win.surface, (yax_space+10, margin+2)))
+
+            laps.lap('draw')
+
+            # Push only the changed regions to the screen: what was
+            # erased and what was drawn
+            pygame.display.update(dirty + drawn)
+            dirty = drawn
+            laps.lap('flip')
+            laps.end()
+
+            # Startup is over when the first frame of a kit is on screen
+            if 'first frame' not in startup.times and monitored.frames.read:
+                startup.mark('first frame')
+                if args.profile_startup: print(startup.report())
+                # Start the joystick: sends JOYDEVICEADDED for each joystick
+                # already connected
+                pygame.joystick.init()
+
+            # Summarize the last second
+            row = monitor.update(
+                plotted=monitored.frames.read,
+                captured=monitored.laps.count - monitored.dropped,
+                dropped=monitored.dropped,
+                overwritten=monitored.frames.overwritten,
+                stale=stale,
+                )
+            if row is not None:
+                metrics.update(row)
+                if metrics_writer is not None: metrics_writer.write(row)
+
+            # Stop after a fixed number of frames
+            if args.frames and laps.count >= args.frames: quit = True
+    finally:
+        # Stop capturing frames, and shut down the post-processing pool
+        # even if the loop raised: its shared memory outlives the
+        # process unless unlinked. Then close what the frames and
+        # metrics are written to, so no buffered records are lost.
+        for dev in devices:
+            if dev.acq is not None: dev.acq.stop()
+        post.close()
+        # closed by its worker, unless the loop raised before the
+        # worker started
+        if recorder is not None: recorder.close()
+        if server is not None: close_server(server)
+        if metrics_writer is not None: metrics_writer.close()
+
+    # Report frames the GUI never plotted
+    if post.processor is not None:
+        processor = post.processor
+        print(f"Post-processed {processor.processed} frames, "
+            f"skipped {processor.skipped} stale results, "
+            f"dropped {processor.dropped} frames while the workers were busy")
+        if processor.failed:
+            print(f"Post-processing failed on {processor.failed} frames: {processor.error!r}")
+    if stats is not None:
+        stats.update(
+            laps=laps,
+            capture_laps=monitored.laps,
+            captured=monitored.laps.count - monitored.dropped,
+            plotted=monitored.frames.read,
+            dropped=monitored.dropped,
+            overwritten=monitored.frames.overwritten,
+            startup=startup.times,
+            )
+    for dev in devices:
+        kit_name = f"{dev.serial_number}: " if len(devices) > 1 else ""
+        print(f"{kit_name}Frames dropped by kit: {dev.acq.dropped}, "
+            f"frames overwritten before plotting: {dev.acq.frames.overwritten}")
+    if recorder is not None:
+        print(f"Recorded {recorder.num_frames} frames to {recorder.path}")
+
+if __name__ == '__main__':
+    main()
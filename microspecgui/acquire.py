@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+"""Acquire frames from the dev-kit on a background thread.
+
+The GUI loop never talks to the dev-kit directly. An
+:class:`Acquisition` worker owns the dev-kit, captures frames
+back-to-back, and pushes them into a :class:`RingBuffer`. The GUI
+loop takes the newest frame from the ring buffer at its own frame
+rate, so a long exposure no longer freezes event handling and
+redraw.
+
+Dev-kit commands (e.g., ``setExposure``, ``autoExposure``) are queued
+to the worker with :meth:`Acquisition.send`. The worker runs them
+between frames and posts the replies back to the GUI loop.
+
+Each frame is converted once, on the worker, into a read-only
+``uint16`` array (see :func:`as_frame`). That one array is the frame
+from then on: it is recorded, auto-exposed on, pushed to the GUI and
+plotted, and nothing downstream converts it again. It is pushed with
+the exposure time it was captured with: a reply that changes the
+exposure time may reach the GUI before the last frame of the old
+exposure time does.
+
+Host-side auto-expose (see :mod:`microspecgui.autoexpose`) runs in the
+worker too: ``hostAutoExposure`` adjusts the exposure time one step
+per captured frame, and with ``tracking=True`` keeps adjusting until
+``stopAutoExposure``. The result is posted like the reply to the
+firmware ``autoExposure``.
+
+In HDR mode (``startHdr``, see :mod:`microspecgui.hdr`) the worker
+captures one frame at each exposure time of a ladder and pushes their
+merge (float counts, see
+:meth:`~microspecgui.hdr.ExposureLadder.merge`) instead of the frames.
+A command that sets the exposure time (or auto-exposes) ends HDR mode.
+
+With a ``stream`` (see :mod:`microspecgui.stream`) the worker also
+publishes every frame it pushes, with the exposure time and
+auto-expose result of the kit, to the subscribers of a frame server.
+
+Example
+-------
+>>> kit = MicroSpecSimpleInterface()
+>>> configure_devkit(kit)
+>>> acq = Acquisition(kit)
+>>> acq.start()
+>>> acq.send('hostAutoExposure')
+>>> frame = acq.frames.latest() # None until a new frame arrives
+>>> pixels, cycles = frame
+>>> acq.stop()
+"""
+
+import queue
+import threading
+import time
+import numpy as np
+from .metrics import Laps
+from .hdr import ExposureLadder
+from . import replies
+
+# Counts of a frame: 16-bit unsigned, like the sensor ADC
+FRAME_DTYPE = np.uint16
+
+def as_frame(pixels):
+    '''Return `pixels` as a frame: a read-only ``uint16`` array.
+
+    :class:`MicroSpecSimpleInterface` replies with a list of counts,
+    converted here in one pass. Stand-ins such as
+    :class:`~microspecgui.simulate.SimulatedKit` and
+    :class:`~microspecgui.replay.ReplayKit` reply with ``uint16``
+    arrays, used as they are: no copy.
+
+    The frame is read-only because the worker and the GUI share it.
+    '''
+    if isinstance(pixels, np.ndarray):
+        frame = pixels if pixels.dtype == FRAME_DTYPE else pixels.astype(FRAME_DTYPE)
+    else:
+        frame = np.fromiter(pixels, FRAME_DTYPE, len(pixels))
+    frame.flags.writeable = False
+    return frame
+
+class RingBuffer(object):
+    """Bounded single-producer single-consumer frame buffer.
+
+    The producer (the acquisition worker) calls :meth:`push`. The
+    consumer (the GUI loop) calls :meth:`latest`. The producer only
+    writes ``_head`` and the consumer only writes ``_seen``, so
+    neither side takes a lock: the slot is written before ``_head``
+    is published, and attribute assignment is atomic under the GIL.
+
+    When the producer is faster than the consumer, the oldest unread
+    frames are overwritten. The consumer counts these in
+    ``overwritten`` and counts the frames it reads in ``read``.
+    """
+    def __init__(self, size=4):
+        '''
+        Parameters
+        ----------
+        size:
+            - number of slots, must be at least 2
+        '''
+        if size < 2:
+            raise ValueError(f"RingBuffer needs at least 2 slots, got {size}")
+        self._size = size
+        self._slots = [None]*size
+        self._head = 0 # number of frames pushed, written by producer
+        self._seen = 0 # value of _head at last read, written by consumer
+        self.overwritten = 0 # frames pushed but never read
+        self.read = 0 # frames returned by latest()
+
+    def push(self, item):
+        '''Store item in the next slot, overwriting the oldest.'''
+        self._slots[self._head % self._size] = item
+        # publish the slot only after it is written
+        self._head += 1
+
+    def latest(self):
+        '''Return the newest item, or None if nothing new was pushed.'''
+        head = self._head
+        if head == self._seen: return None
+        item = self._slots[(head-1) % self._size]
+        # every frame pushed since the last read, except this one,
+        # is never seen by the consumer
+        self.overwritten += head - self._seen - 1
+        self._seen = head
+        self.read += 1
+        return item
+
+    def __len__(self):
+        '''Number of frames pushed but not yet read.'''
+        return min(self._head - self._seen, self._size)
+
+class Acquisition(threading.Thread):
+    """Worker thread that owns the dev-kit and captures frames.
+
+    Attributes
+    ----------
+    frames : :class:`RingBuffer`
+        Newest captured ``(pixels, cycles)``: ``frame.pixels`` (see
+        :func:`as_frame`) and the exposure time of the capture.
+    cycles : int
+        Exposure time the kit captures with, None until the worker
+        starts. In HDR mode, the exposure time of the last rung set.
+    replies : :class:`queue.Queue`
+        ``(command_name, reply)`` pairs for commands queued with
+        :meth:`send`. After a command that changes exposure time, the
+        worker also posts a ``('getExposure', reply)`` pair.
+    dropped : int
+        Number of times ``kit.captureFrame()`` returned None.
+    recorder : :class:`microspecgui.record.Recorder`
+        If not None, every captured frame is also recorded.
+    laps : :class:`microspecgui.metrics.Laps`
+        Duration of each ``kit.captureFrame()`` call (stage 'capture').
+    autoexpose : :class:`microspecgui.autoexpose.ExposureController`
+        Host-side auto-expose, None: commands ``hostAutoExposure`` and
+        ``stopAutoExposure`` do nothing. ``setAutoExposeConfig`` also
+        sets the pixels it searches for the peak.
+    hdr : :class:`microspecgui.hdr.ExposureLadder`
+        The exposure ladder in HDR mode, None if not in HDR mode, see
+        :meth:`startHdr`.
+    stream : :class:`microspecgui.stream.Channel`
+        If not None, every frame pushed is also published.
+    """
+    # commands that change the exposure time
+    _CHANGES_EXPOSURE = ('setExposure', 'autoExposure')
+    # commands run by the worker itself instead of the kit
+    _WORKER_COMMANDS = ('hostAutoExposure', 'stopAutoExposure', 'startHdr', 'stopHdr')
+
+    def __init__(self, kit, buffer_size=4, recorder=None, autoexpose=None,
+                 stream=None):
+        '''
+        Parameters
+        ----------
+        kit:
+            - :class:`MicroSpecSimpleInterface`, already configured
+            - the worker owns the kit once started: do not call the
+              kit from another thread
+        buffer_size:
+            - number of frames held in the ring buffer
+        recorder:
+            - :class:`microspecgui.record.Recorder` to record every
+              captured frame, default is None (do not record)
+            - the worker owns the recorder once started, and closes it
+              when it stops
+        autoexpose:
+            - :class:`microspecgui.autoexpose.ExposureController`,
+              default is None (no host-side auto-expose)
+        stream:
+            - :class:`microspecgui.stream.Channel` to publish every
+              frame, default is None (do not publish)
+        '''
+        super().__init__(name='microspec-acquisition', daemon=True)
+        self.kit = kit
+        self.frames = RingBuffer(buffer_size)
+        self.commands = queue.Queue()
+        self.replies = queue.Queue()
+        self.dropped = 0
+        self.recorder = recorder
+        self.laps = Laps(['capture'])
+        self.autoexpose = autoexpose
+        self.stream = stream
+        self.cycles = None
+        self.hdr = None
+        self._restore_cycles = None # exposure time before HDR mode
+        self._stop_event = threading.Event()
+
+    def send(self, name, *args):
+        '''Queue dev-kit command `name` to run before the next frame.
+
+        Parameters
+        ----------
+        name:
+            - name of a :class:`MicroSpecSimpleInterface` method,
+              e.g., 'setExposure', or 'hostAutoExposure' or
+              'stopAutoExposure', see :meth:`hostAutoExposure`
+        args:
+            - arguments passed to the method
+        '''
+        self.commands.put((name, args))
+
+    def stop(self, timeout=2.0):
+        '''Stop capturing and wait for the worker to finish.
+
+        The worker finishes the frame it is capturing, so `timeout`
+        should exceed the exposure time. A worker with a recorder is
+        waited for however long it takes: it closes the recorder on
+        its way out, and the recording is not complete until then.
+
+        Return
+        ------
+        bool
+            False if the worker is still running
+        '''
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(None if self.recorder is not None else timeout)
+        return not self.is_alive()
+
+    def run(self):
+        try:
+            self._capture()
+        finally:
+            # the worker owns the recorder: close it here, so nothing
+            # is written to it once closed
+            if self.recorder is not None: self.recorder.close()
+
+    def _capture(self):
+        '''Capture frames until stopped.'''
+        # frames carry the exposure time they are captured with
+        reply = self.kit.getExposure()
+        self.cycles = reply.cycles
+        if self.stream is not None: self.stream.update('getExposure', reply)
+        while not self._stop_event.is_set():
+            self._run_commands()
+            if self.hdr is not None:
+                self._capture_hdr()
+                continue
+            self.laps.start()
+            frame = self.kit.captureFrame()
+            self.laps.lap('capture')
+            self.laps.end()
+            # rare: the frame is dropped
+            if frame is None:
+                self.dropped += 1
+                continue
+            # stopped during the exposure: the GUI is done with frames
+            if self._stop_event.is_set():
+                break
+            # the one conversion of the frame
+            pixels = as_frame(frame.pixels)
+            if self.recorder is not None or self.stream is not None:
+                timestamp = time.time()
+                if self.recorder is not None: self.recorder.write(timestamp, pixels)
+                if self.stream is not None: self.stream.publish(pixels, timestamp)
+            self.frames.push((pixels, self.cycles))
+            if self.autoexpose is not None and self.autoexpose.active:
+                self._step_autoexpose(pixels)
+
+    def hostAutoExposure(self, tracking=False):
+        '''Start host-side auto-expose. Runs on the worker thread.
+
+        Queue it with ``send('hostAutoExposure', tracking)``. Each
+        adjustment posts an ``('autoExposure', reply)`` pair when it
+        hits the target or gives up.
+
+        Parameters
+        ----------
+        tracking:
+            - if True, keep adjusting whenever the peak leaves the
+              target tolerance, until ``send('stopAutoExposure')``
+        '''
+        if self.autoexpose is None: return
+        self.autoexpose.start(self.kit.getExposure().cycles, tracking)
+
+    def stopAutoExposure(self):
+        '''Stop host-side auto-expose. Runs on the worker thread.'''
+        if self.autoexpose is None: return
+        self.autoexpose.stop()
+
+    def startHdr(self, cycles):
+        '''Start HDR mode. Runs on the worker thread.
+
+        Queue it with ``send('startHdr', cycles)``. Posts a
+        ``('startHdr', cycles)`` pair, and a ``('stopHdr', None)`` pair
+        when HDR mode ends. Stops host-side auto-expose. Frames are not
+        recorded in HDR mode.
+
+        Parameters
+        ----------
+        cycles:
+            - the exposure ladder: exposure times in cycles, see
+              :class:`microspecgui.hdr.ExposureLadder`
+        '''
+        if self.autoexpose is not None: self.autoexpose.stop()
+        if self.hdr is None: self._restore_cycles = self.kit.getExposure().cycles
+        self.hdr = ExposureLadder(cycles)
+        self._reply('startHdr', tuple(int(c) for c in self.hdr.cycles))
+
+    def stopHdr(self):
+        '''Stop HDR mode and set the exposure time back. Runs on the worker thread.'''
+        if self.hdr is None: return
+        self._end_hdr()
+        self.kit.setExposure(self._restore_cycles)
+        self._reply('getExposure', self.kit.getExposure())
+
+    def _end_hdr(self):
+        self.hdr = None
+        self._reply('stopHdr', None)
+
+    def _capture_hdr(self):
+        '''Capture a frame at each exposure time of the ladder, push the merge.'''
+        hdr = self.hdr
+        for index, cycles in enumerate(hdr.cycles):
+            # stopped: drop the partial ladder
+            if self._stop_event.is_set():
+                return
+            self.kit.setExposure(int(cycles))
+            self.cycles = int(cycles)
+            self.laps.start()
+            frame = self.kit.captureFrame()
+            self.laps.lap('capture')
+            self.laps.end()
+            # rare: the frame is dropped, start the ladder over
+            if frame is None:
+                self.dropped += 1
+                return
+            hdr.add(index, frame.pixels)
+        merged = hdr.merge()
+        # shared with the GUI, like the frames of as_frame
+        merged.flags.writeable = False
+        if self.stream is not None: self.stream.publish(merged, time.time())
+        # in counts at the longest exposure time
+        self.frames.push((merged, int(hdr.cycles[-1])))
+
+    def _reply(self, name, reply):
+        '''Post the `reply` to command `name` to the GUI loop.'''
+        self.replies.put((name, reply))
+        if name == 'getExposure': self.cycles = reply.cycles
+        if self.stream is not None: self.stream.update(name, reply)
+
+    def _step_autoexpose(self, pixels):
+        '''Adjust the exposure time for the next frame.'''
+        cycles = self.autoexpose.update(pixels)
+        if cycles is not None:
+            reply = self.kit.setExposure(cycles)
+            # the new exposure time is known: skip the getExposure round trip
+            self._reply('getExposure', replies.GetExposure(
+                status=reply.status, cycles=cycles
+                ))
+        if self.autoexpose.result is not None:
+            self._reply('autoExposure', self.autoexpose.result)
+            self.autoexpose.result = None
+
+    def _run_commands(self):
+        '''Run all queued commands and post their replies.'''
+        while True:
+            try:
+                name, args = self.commands.get_nowait()
+            except queue.Empty:
+                return
+            if self.hdr is not None and (
+                    name in self._CHANGES_EXPOSURE or name == 'hostAutoExposure'
+                    ):
+                # exposure time set by hand or auto-exposed: end HDR mode
+                self._end_hdr()
+            if name in self._WORKER_COMMANDS:
+                getattr(self, name)(*args)
+                continue
+            reply = getattr(self.kit, name)(*args)
+            self._reply(name, reply)
+            if name == 'setAutoExposeConfig' and self.autoexpose is not None:
+                # host-side auto-expose searches the same pixels
+                self.autoexpose.set_pixels(args[1], args[2])
+            if name in self._CHANGES_EXPOSURE:
+                reply = self.kit.getExposure()
+                self._reply('getExposure', reply)
+                # host-side auto-expose continues from the new exposure
+                if self.autoexpose is not None:
+                    self.autoexpose.cycles = reply.cycles
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""Asyncio interface to a dev-kit, with timeouts.
+
+:class:`MicroSpecSimpleInterface` commands block until the dev-kit
+replies, and a kit that stops replying blocks forever.
+:class:`AsyncKit` wraps a kit so each command is a coroutine:
+
+- the blocking call runs on a thread owned by the :class:`AsyncKit`,
+  so the event loop stays free while the kit works
+- the thread is a daemon thread, so a kit that never replies does
+  not keep the app from exiting
+- each command has a timeout: a kit that does not reply in time
+  raises :class:`TimeoutError` instead of hanging
+- a command can be cancelled like any other task
+
+Each kit has one command thread, so the commands of one kit run in
+order, and the commands of different kits run at the same time. This
+is how several kits are coordinated on one event loop, e.g.,
+configured at the same time with :func:`asyncio.gather`.
+
+Timeouts cannot interrupt the blocking call itself. After a timeout
+or cancellation the call finishes (or not) on the command thread and
+its reply is discarded; later commands of the same kit wait for it.
+
+Example
+-------
+>>> async def main():
+...     kit = AsyncKit(MicroSpecSimpleInterface(), timeout=2.0)
+...     await kit.setExposure(50)
+...     frame = await kit.captureFrame()
+...     kit.close()
+>>> asyncio.run(main())
+"""
+
+import asyncio
+from functools import partial
+import queue
+import threading
+from .replies import SECONDS_PER_CYCLE
+
+# Dev-kit commands available as coroutines
+COMMANDS = (
+    'setBridgeLED', 'getBridgeLED',
+    'setSensorLED', 'getSensorLED',
+    'setSensorConfig', 'getSensorConfig',
+    'setExposure', 'getExposure',
+    'setAutoExposeConfig', 'getAutoExposeConfig',
+    'captureFrame', 'autoExposure',
+    )
+
+class AsyncKit(object):
+    """Run dev-kit commands as coroutines with timeouts.
+
+    Commands are the :data:`COMMANDS` methods of the wrapped kit, with
+    the same arguments and replies, e.g., ``await kit.getExposure()``.
+
+    Attributes
+    ----------
+    kit : :class:`MicroSpecSimpleInterface`
+        the wrapped kit, or a stand-in such as :class:`SimulatedKit`
+    timeout : float
+        seconds to wait for a reply; commands that expose wait longer,
+        see :meth:`timeout_of`
+    cycles : int
+        last exposure time sent to or read from the kit, None until
+        known
+    max_tries, max_exposure : int
+        last auto-expose config sent to the kit, used by
+        :meth:`timeout_of`
+    """
+    def __init__(self, kit, timeout=2.0):
+        self.kit = kit
+        self.timeout = timeout
+        self.cycles = None
+        self.max_tries = 12
+        self.max_exposure = 65535
+        # (loop, future, function, args) of each command, None: stop
+        self._commands = queue.Queue()
+        # not a ThreadPoolExecutor: its threads are joined at exit
+        self._thread = threading.Thread(
+            target=self._run, name='microspec-command', daemon=True
+            )
+        self._thread.start()
+
+    def __getattr__(self, name):
+        if name not in COMMANDS:
+            raise AttributeError(f"{type(self).__name__} has no command {name!r}")
+        return partial(self.call, name)
+
+    def timeout_of(self, name):
+        '''Return the timeout in seconds of command `name`.
+
+        Commands that capture frames also wait for the exposures:
+        ``captureFrame`` one exposure, ``autoExposure`` up to
+        `max_tries` exposures of up to `max_exposure` cycles.
+        '''
+        if name == 'captureFrame' and self.cycles is not None:
+            return self.timeout + self.cycles*SECONDS_PER_CYCLE
+        if name in ('captureFrame', 'autoExposure'):
+            return self.timeout + self.max_tries*self.max_exposure*SECONDS_PER_CYCLE
+        return self.timeout
+
+    async def call(self, name, *args, timeout=None):
+        '''Run kit command `name` on the command thread. Return its reply.
+
+        Parameters
+        ----------
+        name:
+            - one of :data:`COMMANDS`
+        args:
+            - arguments of the command
+        timeout:
+            - seconds to wait for the reply, default is
+              :meth:`timeout_of` `name`
+
+        Raise :class:`TimeoutError` if the kit does not reply in time.
+        '''
+        if timeout is None: timeout = self.timeout_of(name)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._commands.put((loop, future, getattr(self.kit, name), args))
+        try:
+            reply = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(
+                f"kit did not reply to {name} within {timeout:.3g}s"
+                ) from None
+        self._track(name, args, reply)
+        return reply
+
+    def _track(self, name, args, reply):
+        '''Remember the settings that change command timeouts.'''
+        if name == 'setExposure':
+            self.cycles = args[0]
+        elif name == 'getExposure':
+            self.cycles = reply.cycles
+        elif name == 'setAutoExposeConfig':
+            self.max_tries = args[0]
+            self.max_exposure = args[-1]
+
+    def _run(self):
+        '''Run the queued commands in order. Runs on the command thread.'''
+        while True:
+            command = self._commands.get()
+            if command is None:
+                return
+            loop, future, function, args = command
+            try:
+                reply, error = function(*args), None
+            except Exception as exception:
+                reply, error = None, exception
+            try:
+                loop.call_soon_threadsafe(_resolve, future, reply, error)
+            except RuntimeError:
+                # the event loop is closed: nobody waits for the reply
+                pass
+
+    def close(self):
+        '''Stop the command thread once it is idle.'''
+        self._commands.put(None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def _resolve(future, reply, error):
+    '''Set the reply (or error) of a command, unless it timed out.'''
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(reply)
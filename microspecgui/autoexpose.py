@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""Host-side auto-expose.
+
+The dev-kit firmware auto-expose (``kit.autoExposure()``) blocks the
+dev-kit for up to ``max_tries`` full exposures. :class:`ExposureController`
+runs auto-expose on the host instead, one step per captured frame, so
+frames keep flowing to the GUI while the exposure time converges.
+
+Counts above the dark level are proportional to the exposure time, so
+each step *predicts* the exposure time that puts the peak counts on
+the target instead of searching for it:
+
+- first step: scale the exposure time by ``(target-dark)/(peak-dark)``
+- next steps: fit a line through the last two (exposure, peak) pairs
+  (secant method), which also measures the dark level
+- saturated frames: the peak is unknown, quarter the exposure time
+
+A frame usually hits the target within one or two steps.
+
+In *tracking* mode the controller never stops: whenever the peak
+leaves the target tolerance (e.g., the light source changes) it
+adjusts the exposure time again.
+
+Example
+-------
+>>> ae = ExposureController(start_pixel=220, stop_pixel=373)
+>>> ae.start(kit.getExposure().cycles)
+>>> while ae.active:
+...     cycles = ae.update(kit.captureFrame().pixels)
+...     if cycles is not None: kit.setExposure(cycles)
+>>> ae.result.success, ae.result.iterations
+"""
+
+import numpy as np
+from . import replies
+
+# Peak counts at or above this value are saturated
+SATURATION = 65000
+
+class ExposureController(object):
+    """Predict the exposure time that puts the peak counts on target.
+
+    Attributes
+    ----------
+    active : bool
+        True while adjusting (or tracking)
+    tracking : bool
+        if True, keep adjusting whenever the peak leaves the tolerance
+    cycles : int
+        exposure time the next frame is captured with
+    iterations : int
+        frames measured in the current adjustment
+    result : :class:`microspecgui.replies.AutoExposure`
+        set when an adjustment finishes (hit the target or gave up),
+        None until then; clear it after reporting it
+    """
+    def __init__(self, start_pixel, stop_pixel, target=46420, tol=3277,
+                 max_tries=12, max_cycles=10000, min_cycles=1, dark=0):
+        '''
+        Parameters
+        ----------
+        start_pixel, stop_pixel:
+            - pixel numbers searched for the peak
+        target, tol:
+            - target peak counts and tolerance, like the firmware
+              auto-expose config
+        max_tries:
+            - give up after this many frames
+        max_cycles, min_cycles:
+            - exposure time limits in cycles
+        dark:
+            - dark level in counts assumed by the first step
+        '''
+        self._pixels = slice(start_pixel-1, stop_pixel)
+        self.target = target
+        self.tol = tol
+        self.max_tries = max_tries
+        self.max_cycles = max_cycles
+        self.min_cycles = min_cycles
+        self.dark = dark
+        self.active = False
+        self.tracking = False
+        self.cycles = None
+        self.iterations = 0
+        self.result = None
+        self._last = None # (cycles, peak) of the previous step
+        self._settled = False # finished the current adjustment
+        self._hold = None # peak counts when the adjustment gave up
+
+    def set_pixels(self, start_pixel, stop_pixel):
+        '''Search pixel numbers `start_pixel` to `stop_pixel` for the peak.
+
+        E.g., after the pixel binning changes. An adjustment in
+        progress starts over.
+        '''
+        self._pixels = slice(start_pixel-1, stop_pixel)
+        self._begin()
+
+    def start(self, cycles, tracking=False):
+        '''Start adjusting from exposure time `cycles`.'''
+        self.active = True
+        self.tracking = tracking
+        self.cycles = cycles
+        self.result = None
+        self._begin()
+
+    def stop(self):
+        '''Stop adjusting (and tracking).'''
+        self.active = False
+        self.tracking = False
+
+    def _begin(self):
+        self.iterations = 0
+        self._last = None
+        self._settled = False
+        self._hold = None
+
+    def update(self, pixels):
+        '''Measure a frame captured with exposure time `cycles`.
+
+        Return
+        ------
+        int
+            the exposure time to set for the next frame, or None to
+            keep the exposure time
+        '''
+        if not self.active: return None
+        peak = float(np.max(np.asarray(pixels)[self._pixels]))
+        on_target = abs(peak - self.target) <= self.tol
+
+        if self._settled:
+            # tracking: adjust again only if the scene changed
+            if on_target: return None
+            if self._hold is not None and abs(peak - self._hold) <= self.tol:
+                return None
+            self._begin()
+
+        self.iterations += 1
+        if on_target:
+            self._finish(success=True)
+            return None
+        if self.iterations >= self.max_tries:
+            self._finish(success=False, peak=peak)
+            return None
+        cycles = self._predict(peak)
+        if cycles == self.cycles:
+            # cannot get closer: exposure time is at its limit
+            self._finish(success=False, peak=peak)
+            return None
+        self.cycles = cycles
+        return cycles
+
+    def _predict(self, peak):
+        '''Return the exposure time predicted to hit the target.'''
+        cycles = self.cycles
+        if peak >= SATURATION:
+            # peak is clipped: its true value is unknown
+            self._last = None
+            predicted = cycles/4
+        else:
+            slope = 0
+            if self._last is not None and self._last[0] != cycles:
+                last_cycles, last_peak = self._last
+                slope = (peak - last_peak)/(cycles - last_cycles)
+            if slope > 0:
+                # secant: counts = peak + slope*(cycles' - cycles)
+                predicted = cycles + (self.target - peak)/slope
+            else:
+                # proportional: counts above dark scale with exposure
+                predicted = cycles*(self.target - self.dark)/max(peak - self.dark, 1)
+            self._last = (cycles, peak)
+        return int(min(max(round(predicted), self.min_cycles), self.max_cycles))
+
+    def _finish(self, success, peak=None):
+        self.result = replies.AutoExposure(
+            status=replies.STATUS_OK,
+            success=int(success),
+            iterations=self.iterations,
+            )
+        self._settled = True
+        # after giving up, wait for the scene to change
+        self._hold = None if success else peak
+        if not self.tracking: self.active = False
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""Average frames to reduce noise.
+
+:class:`FrameAverager` keeps the last N frames in a preallocated NumPy
+frame stack and averages them one of three ways:
+
+mean
+    running average of the last N frames
+ema
+    exponential moving average with smoothing factor 2/(N+1)
+median
+    median of the last N frames (rejects spikes)
+
+The running mean is updated in O(1) per frame: the newest frame is
+added to a running sum and the frame it replaces in the stack is
+subtracted, so the history is never re-summed. Counts are integers,
+so the running sums are exact in float64 and do not drift.
+
+Per-pixel variance is available in every mode, so noise can be
+displayed next to the averaged trace.
+
+Example
+-------
+>>> avg = FrameAverager(num_pixels=392, mode='mean', n=8)
+>>> avg.add(frame.pixels)
+>>> avg.average # averaged counts, updated in place
+>>> avg.variance() # per-pixel variance
+"""
+
+import numpy as np
+
+MODES = ('mean', 'ema', 'median')
+
+class FrameAverager(object):
+    """Average the most recent frames.
+
+    Attributes
+    ----------
+    mode : str
+        one of :data:`MODES`
+    n : int
+        number of frames averaged (for 'ema', sets the smoothing
+        factor ``alpha = 2/(n+1)``)
+    average : numpy.ndarray
+        averaged counts, updated in place by :meth:`add`
+    count : int
+        number of frames in the average, at most `n`
+    """
+    def __init__(self, num_pixels, mode='mean', n=8):
+        '''
+        Parameters
+        ----------
+        num_pixels:
+            - pixels per frame
+        mode, n:
+            - see class attributes
+        '''
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}, got {mode!r}")
+        if n < 1:
+            raise ValueError(f"n must be at least 1, got {n}")
+        self.mode = mode
+        self.n = n
+        self.alpha = 2/(n+1)
+        # frame stack: the last n frames, oldest overwritten first
+        self._stack = np.zeros((n, num_pixels))
+        self._next = 0
+        # running sums over the frame stack
+        self._sum = np.zeros(num_pixels)
+        self._sum_sq = np.zeros(num_pixels)
+        # exponentially weighted variance
+        self._ema_var = np.zeros(num_pixels)
+        # scratch buffers so updates allocate nothing
+        self._scratch = np.zeros(num_pixels)
+        self._variance = np.zeros(num_pixels)
+        self.average = np.zeros(num_pixels)
+        self.count = 0
+
+    def reset(self):
+        '''Forget all frames, e.g., after the exposure time changes.'''
+        self.count = 0
+        self._next = 0
+        self._sum[:] = 0
+        self._sum_sq[:] = 0
+
+    def add(self, counts):
+        '''Add a frame and update `average`. Return `average`.'''
+        scratch = self._scratch
+        slot = self._stack[self._next]
+
+        # remove the frame leaving the stack from the running sums
+        if self.count == self.n:
+            self._sum -= slot
+            np.multiply(slot, slot, out=scratch)
+            self._sum_sq -= scratch
+        else:
+            self.count += 1
+
+        # add the new frame to the stack and to the running sums
+        slot[:] = counts
+        self._next = (self._next + 1) % self.n
+        self._sum += slot
+        np.multiply(slot, slot, out=scratch)
+        self._sum_sq += scratch
+
+        if self.mode == 'mean':
+            np.divide(self._sum, self.count, out=self.average)
+        elif self.mode == 'median':
+            np.median(self._stack[:self.count], axis=0, out=self.average)
+        elif self.count == 1:
+            # ema: start from the first frame
+            self.average[:] = slot
+            self._ema_var[:] = 0
+        else:
+            # ema: d = x - avg; avg += alpha*d; var = (1-alpha)*(var + alpha*d*d)
+            np.subtract(slot, self.average, out=scratch)
+            scratch *= self.alpha # alpha*d
+            self.average += scratch
+            scratch *= scratch # alpha^2*d^2
+            scratch /= self.alpha # alpha*d^2
+            self._ema_var += scratch
+            self._ema_var *= 1 - self.alpha
+        return self.average
+
+    def variance(self):
+        '''Return the per-pixel variance of the averaged frames.
+
+        For 'mean' and 'median' this is the variance of the frames in
+        the stack, for 'ema' the exponentially weighted variance. The
+        returned array is reused by the next call.
+        '''
+        if self.mode == 'ema':
+            return self._ema_var
+        if self.count == 0:
+            self._variance[:] = 0
+            return self._variance
+        # var = E[x^2] - E[x]^2
+        np.divide(self._sum, self.count, out=self._scratch)
+        self._scratch *= self._scratch
+        np.divide(self._sum_sq, self.count, out=self._variance)
+        self._variance -= self._scratch
+        # rounding can make a zero variance slightly negative
+        np.maximum(self._variance, 0, out=self._variance)
+        return self._variance
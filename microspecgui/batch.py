@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""Capture bursts of frames into preallocated arrays.
+
+:class:`BatchCapture` captures N frames back-to-back with
+``kit.captureFrame()`` into a preallocated ``uint16`` array of shape
+``(N, num_pixels)`` and an array of N timestamps. The capture loop
+does nothing but call the kit and copy the pixels into the next row,
+so a burst allocates no per-frame arrays, and capturing another burst
+reuses the same arrays.
+
+Iterate to process frames as they arrive, or call
+:meth:`BatchCapture.capture` to capture all N frames at once:
+
+>>> batch = BatchCapture(kit, num_frames=1000)
+>>> for timestamp, pixels in batch: # pixels is a row of batch.frames
+...     check(pixels)
+>>> frames = batch.capture() # (1000, num_pixels) uint16
+
+Dropped frames (``captureFrame()`` returns None) are retried, so a
+burst always holds N frames, and are counted in ``dropped``. A kit
+that drops ``max_dropped`` frames in a row (e.g., unplugged) ends the
+burst with a RuntimeError, the frames captured so far kept in the
+first ``count`` rows.
+
+The kit must not be in use by another thread, e.g., an
+:class:`~microspecgui.acquire.Acquisition` worker.
+"""
+
+import time
+import numpy as np
+
+def num_pixels_of(kit):
+    '''Return the number of pixels per frame `kit` is configured for.'''
+    return 392 if kit.getSensorConfig().binning else 784
+
+class BatchCapture(object):
+    """Capture `num_frames` frames back-to-back.
+
+    Attributes
+    ----------
+    frames : numpy.ndarray
+        ``(num_frames, num_pixels)`` uint16 counts, row i is frame i
+    timestamps : numpy.ndarray
+        capture time of each frame in seconds since the epoch
+    count : int
+        frames captured in the current burst
+    dropped : int
+        frames dropped by the kit (and retried) in the current burst
+    max_dropped : int
+        frames dropped in a row that end the burst
+    """
+    def __init__(self, kit, num_frames, num_pixels=None, max_dropped=10):
+        '''
+        Parameters
+        ----------
+        kit:
+            - :class:`MicroSpecSimpleInterface`, already configured,
+              or a stand-in such as :class:`SimulatedKit`
+        num_frames:
+            - frames per burst
+        num_pixels:
+            - pixels per frame, default is read from the kit's sensor
+              config (392 with binning on, 784 with binning off)
+        max_dropped:
+            - raise RuntimeError when the kit drops this many frames
+              in a row, instead of retrying forever
+        '''
+        if num_pixels is None: num_pixels = num_pixels_of(kit)
+        self.kit = kit
+        self.frames = np.zeros((num_frames, num_pixels), dtype=np.uint16)
+        self.timestamps = np.zeros(num_frames)
+        self.count = 0
+        self.dropped = 0
+        self.max_dropped = max_dropped
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __iter__(self):
+        '''Capture a burst, yielding each frame as it arrives.
+
+        Yield
+        -----
+        tuple
+            (timestamp, pixels) where pixels is the row of `frames`
+            holding the frame
+        '''
+        return self._burst(len(self.frames))
+
+    def capture(self, num_frames=None):
+        '''Capture a burst. Return the `frames` captured.
+
+        Parameters
+        ----------
+        num_frames:
+            - capture only this many frames (into the first rows),
+              default is all `num_frames` rows
+        '''
+        if num_frames is None: num_frames = len(self.frames)
+        for _ in self._burst(num_frames): pass
+        return self.frames[:num_frames]
+
+    def _burst(self, num_frames):
+        # bind everything the loop uses to locals
+        capture = self.kit.captureFrame
+        now = time.time
+        frames = self.frames
+        timestamps = self.timestamps
+        self.count = 0
+        self.dropped = 0
+        i = 0
+        in_a_row = 0
+        while i < num_frames:
+            frame = capture()
+            # rare: the frame is dropped
+            if frame is None:
+                self.dropped += 1
+                in_a_row += 1
+                if in_a_row >= self.max_dropped:
+                    raise RuntimeError(
+                        f"kit dropped {in_a_row} frames in a row, "
+                        f"captured {i} of {num_frames} frames"
+                        )
+                continue
+            in_a_row = 0
+            timestamps[i] = now()
+            frames[i] = frame.pixels
+            i += 1
+            self.count = i
+            yield timestamps[i-1], frames[i-1]
+
+def capture_frames(kit, num_frames, num_pixels=None):
+    '''Capture `num_frames` frames back-to-back.
+
+    Return
+    ------
+    tuple
+        (frames, timestamps), see :class:`BatchCapture`
+    '''
+    batch = BatchCapture(kit, num_frames, num_pixels)
+    batch.capture()
+    return batch.frames, batch.timestamps
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""Benchmark the GUI loop with a simulated kit.
+
+Runs the ``microspec-gui`` loop for a fixed number of frames with
+SDL's dummy video driver (no window is shown) and a
+:class:`~microspecgui.simulate.SimulatedKit`, once with pixel binning
+on (392 pixels) and once with binning off (784 pixels). For each run
+it reports:
+
+- throughput: GUI loop frames/s, and new frames plotted per second
+- latency of each stage of the GUI loop (p50/p99 in milliseconds),
+  and of ``kit.captureFrame()`` in the acquisition worker
+- peak bytes allocated per frame (measured in a second run with
+  :mod:`tracemalloc`, which slows the loop down)
+
+Results are printed as a table and optionally written as JSON, so a
+regression in the hot loop is caught by comparing runs.
+
+Run
+---
+$ python -m microspecgui.bench --frames 1000 --output bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+# Must be set before pygame is initialized
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import numpy as np
+from . import __main__ as gui
+from .metrics import Laps
+
+# (name, binning, start_pixel, stop_pixel)
+CONFIGS = (
+    ('binning_on', gui.BINNING_ON, 220, 373),
+    ('binning_off', gui.BINNING_OFF, 440, 746),
+    )
+
+def run_gui(num_frames, trace_allocations=False):
+    '''Run the GUI loop with a simulated kit for `num_frames` frames.
+
+    Return
+    ------
+    dict
+        the `stats` filled by :func:`microspecgui.__main__.main`, and
+        'seconds', the wall time of the run
+    '''
+    stats = {}
+    laps = Laps(gui.GUI_STAGES, capacity=num_frames,
+                trace_allocations=trace_allocations)
+    start = time.perf_counter()
+    gui.main(
+        ['--simulate', '--frames', str(num_frames), '--framerate', '0'],
+        laps=laps,
+        stats=stats
+        )
+    stats['seconds'] = time.perf_counter() - start
+    return stats
+
+def bench_config(name, binning, start_pixel, stop_pixel, num_frames,
+                 allocations=True):
+    '''Benchmark one pixel configuration. Return the results as a dict.'''
+    gui.set_pixel_layout(binning, start_pixel, stop_pixel)
+    stats = run_gui(num_frames)
+    laps = stats['laps']
+    result = dict(
+        config=name,
+        num_pixels=gui.num_pixels,
+        frames=laps.count,
+        seconds=stats['seconds'],
+        loop_fps=laps.count/stats['seconds'],
+        plotted_fps=stats['plotted']/stats['seconds'],
+        stages=laps.summary(),
+        capture=stats['capture_laps'].summary()['capture'],
+        )
+    if allocations:
+        tracemalloc.start()
+        try:
+            laps = run_gui(num_frames, trace_allocations=True)['laps']
+        finally:
+            tracemalloc.stop()
+        result['allocated_bytes_per_frame'] = dict(
+            p50=float(np.percentile(laps.allocated, 50)),
+            p99=float(np.percentile(laps.allocated, 99)),
+            )
+    return result
+
+def print_result(result):
+    '''Print one benchmark result as a table.'''
+    print(f"\n{result['config']} ({result['num_pixels']} pixels): "
+        f"{result['frames']} frames in {result['seconds']:.2f}s, "
+        f"loop {result['loop_fps']:.1f} frames/s, "
+        f"plotted {result['plotted_fps']:.1f} new frames/s")
+    print(f"{'stage':>10} {'p50 ms':>9} {'p99 ms':>9}")
+    rows = list(result['stages'].items()) + [('capture', result['capture'])]
+    for stage, t in rows:
+        print(f"{stage:>10} {t['p50']:9.3f} {t['p99']:9.3f}")
+    if 'allocated_bytes_per_frame' in result:
+        a = result['allocated_bytes_per_frame']
+        print(f"allocated per frame: p50 {a['p50']:.0f} bytes, "
+            f"p99 {a['p99']:.0f} bytes")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m microspecgui.bench',
+        description='Benchmark the microspec-gui loop with a simulated kit.'
+        )
+    parser.add_argument('--frames', metavar='N', type=int, default=500,
+        help='frames per run (default: 500)')
+    parser.add_argument('--output', metavar='FILE',
+        help='write the results to FILE as JSON')
+    parser.add_argument('--no-allocations', action='store_true',
+        help='skip the (slow) allocation measurement run')
+    args = parser.parse_args(argv)
+
+    results = [
+        bench_config(*config, num_frames=args.frames,
+                     allocations=not args.no_allocations)
+        for config in CONFIGS
+        ]
+    for result in results:
+        print_result(result)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(dict(
+                python=sys.version.split()[0],
+                platform=platform.platform(),
+                results=results,
+                ), f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""Dark and reference calibration of raw counts.
+
+A *dark* spectrum (light blocked) and a *reference* spectrum (e.g., a
+white reference or the bare light source) turn raw counts into a
+calibrated spectrum::
+
+    corrected = (raw - dark) / (ref - dark)
+
+With a dark spectrum only, the correction is the dark subtraction
+``raw - dark``.
+
+Spectra depend on the pixel binning and the exposure time, so each
+spectrum is stored under its (binning, exposure cycles) key. A spectrum
+is captured as the mean of several frames and stored in an in-memory
+cache and on disk, one ``.npz`` file per kit named after the kit serial
+number, e.g., ``~/.microspecgui/calibration/091103.npz``. Spectra are
+loaded from disk once, when the kit is opened, and are not captured
+again when the exposure time changes:
+
+- dark counts grow linearly with exposure time, so the dark spectrum
+  at an exposure time with no stored dark is interpolated per pixel
+  between the two nearest stored exposure times (extrapolated beyond
+  them); a single stored dark is used at every exposure time
+- counts above dark are proportional to exposure time, so the
+  reference at an exposure time with no stored reference is the
+  nearest stored reference, scaled by the ratio of exposure times
+
+The correction arrays ``dark`` and ``gain = 1/(ref - dark)`` are
+computed once per (binning, cycles) and cached, so correcting a frame
+is one subtraction and one multiplication into a preallocated array.
+
+Example
+-------
+>>> cal = Calibration('091103')
+>>> cal.start('dark') # block the light, then feed it frames
+>>> while cal.capturing:
+...     cal.add(kit.captureFrame().pixels, binning=1, cycles=500)
+>>> corrected = cal.correct(frame.pixels, binning=1, cycles=500)
+"""
+
+from pathlib import Path
+import numpy as np
+
+# Default folder of calibration files
+CAL_DIR = Path.home().joinpath('.microspecgui', 'calibration')
+
+# Kinds of calibration spectra
+KINDS = ('dark', 'reference')
+
+class Calibration(object):
+    """Dark and reference spectra of one kit.
+
+    Attributes
+    ----------
+    path : :class:`pathlib.Path`
+        file the spectra are stored in
+    spectra : dict
+        ``{(kind, binning, cycles): numpy.ndarray}`` stored spectra,
+        mean counts per pixel
+    capturing : str
+        kind of spectrum being captured, None if not capturing
+    count : int
+        frames captured so far, while capturing
+    num_frames : int
+        frames averaged per captured spectrum
+    scale : float
+        corrected spectra with a reference are multiplied by `scale`,
+        e.g., to plot 1.0 (counts equal to the reference) at full scale
+    min_signal : float
+        pixels where the reference is less than `min_signal` counts
+        above dark are corrected to 0: dividing by the noise of an
+        unlit pixel is meaningless
+    """
+    def __init__(self, serial_number, directory=CAL_DIR, num_frames=16,
+                 scale=1.0, min_signal=500):
+        '''
+        Parameters
+        ----------
+        serial_number:
+            - serial number of the kit, names the calibration file
+        directory:
+            - folder of calibration files
+        num_frames, scale, min_signal:
+            - see class attributes
+        '''
+        self.path = Path(directory).joinpath(f'{serial_number}.npz')
+        self.num_frames = num_frames
+        self.scale = scale
+        self.min_signal = min_signal
+        self.spectra = self._load()
+        self.capturing = None
+        self.count = 0
+        self._key = None # (binning, cycles) of the capture in progress
+        self._sum = None
+        self._corrections = {} # (binning, cycles): (dark, gain)
+        self._out = None
+
+    def _load(self):
+        if not self.path.is_file():
+            return {}
+        spectra = {}
+        with np.load(self.path) as npz:
+            for name in npz.files:
+                # e.g., 'dark_1_500'
+                kind, binning, cycles = name.rsplit('_', 2)
+                spectra[(kind, int(binning), int(cycles))] = npz[name]
+        return spectra
+
+    def save(self):
+        '''Write all spectra to `path`.'''
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # write a new file, then replace the old one: a crash while
+        # writing does not lose the stored spectra
+        tmp = self.path.with_suffix('.tmp')
+        with open(tmp, 'wb') as f:
+            np.savez(f, **{
+                f'{kind}_{binning}_{cycles}': spectrum
+                for (kind, binning, cycles), spectrum in self.spectra.items()
+                })
+        tmp.replace(self.path)
+
+    def start(self, kind):
+        '''Start capturing a `kind` spectrum from the next frames.'''
+        if kind not in KINDS:
+            raise ValueError(f"kind must be one of {KINDS}, got {kind!r}")
+        self.capturing = kind
+        self.count = 0
+        self._key = None
+
+    def add(self, pixels, binning, cycles):
+        '''Add a frame captured with `binning` and exposure `cycles`.
+
+        Does nothing if not capturing. The capture starts over if the
+        exposure time changes, so every frame of a spectrum has the
+        same exposure time.
+
+        Return
+        ------
+        bool
+            True if the frame finished the capture
+        '''
+        if self.capturing is None:
+            return False
+        if (binning, cycles) != self._key:
+            self._key = (binning, cycles)
+            self._sum = np.zeros(len(pixels))
+            self.count = 0
+        self._sum += pixels
+        self.count += 1
+        if self.count < self.num_frames:
+            return False
+        self.store(self.capturing, binning, cycles, self._sum/self.count)
+        self.capturing = None
+        return True
+
+    def store(self, kind, binning, cycles, spectrum):
+        '''Store a `kind` spectrum at (binning, cycles) and save it.'''
+        self.spectra[(kind, binning, cycles)] = np.asarray(spectrum, dtype=float)
+        # corrections may depend on the new spectrum
+        self._corrections.clear()
+        self.save()
+
+    def _stored(self, kind, binning):
+        '''Return the sorted exposure times of the stored `kind` spectra.'''
+        return sorted(c for k, b, c in self.spectra if k == kind and b == binning)
+
+    def dark(self, binning, cycles):
+        '''Return the dark spectrum at (binning, cycles), or None.
+
+        Interpolated between stored exposure times if no dark is stored
+        at `cycles`, see the module docstring.
+        '''
+        stored = self._stored('dark', binning)
+        if not stored:
+            return None
+        if cycles in stored or len(stored) == 1:
+            nearest = cycles if cycles in stored else stored[0]
+            return self.spectra[('dark', binning, nearest)]
+        # the stored exposure times around cycles, or the two nearest
+        i = min(max(int(np.searchsorted(stored, cycles)), 1), len(stored)-1)
+        c0, c1 = stored[i-1], stored[i]
+        d0 = self.spectra[('dark', binning, c0)]
+        d1 = self.spectra[('dark', binning, c1)]
+        dark = d0 + (d1 - d0)*((cycles - c0)/(c1 - c0))
+        # dark counts are never negative
+        return np.maximum(dark, 0, out=dark)
+
+    def correction(self, binning, cycles):
+        '''Return the (dark, gain) arrays of the correction at (binning, cycles).
+
+        The correction is ``(raw - dark)*gain``. `dark` is None if no
+        dark is stored, `gain` is None if no reference is stored (a
+        reference is only used with a dark). Computed once per
+        (binning, cycles) until a spectrum is stored.
+        '''
+        key = (binning, cycles)
+        correction = self._corrections.get(key)
+        if correction is None:
+            # auto-expose may visit many exposure times: bound the cache
+            if len(self._corrections) >= 64: self._corrections.clear()
+            correction = self._corrections[key] = self._compute(binning, cycles)
+        return correction
+
+    def _compute(self, binning, cycles):
+        dark = self.dark(binning, cycles)
+        stored = self._stored('reference', binning)
+        if dark is None or not stored:
+            return dark, None
+        nearest = min(stored, key=lambda c: abs(c - cycles))
+        signal = self.spectra[('reference', binning, nearest)] - self.dark(binning, nearest)
+        # counts above dark are proportional to exposure time
+        signal *= cycles/nearest
+        # pixels with no signal in the reference are corrected to 0
+        gain = np.zeros_like(signal)
+        np.divide(self.scale, signal, out=gain, where=signal >= self.min_signal)
+        return dark, gain
+
+    def applied(self, binning, cycles):
+        '''Return the kinds of spectra :meth:`correct` uses at (binning, cycles).'''
+        dark, gain = self.correction(binning, cycles)
+        return KINDS[:(dark is not None) + (gain is not None)]
+
+    def correct(self, counts, binning, cycles, pixels=slice(None)):
+        '''Return `counts` corrected with the spectra at (binning, cycles).
+
+        Return `counts` itself if no dark is stored. The corrected
+        array is reused by the next call: copy it to keep it.
+
+        `counts` of a cropped frame are corrected with the `pixels`
+        slice of the stored (full frame) spectra.
+        '''
+        dark, gain = self.correction(binning, cycles)
+        if dark is None:
+            return counts
+        out = self._out
+        if out is None or len(out) != len(counts):
+            out = self._out = np.empty(len(counts))
+        np.subtract(counts, dark[pixels], out=out)
+        if gain is not None:
+            np.multiply(out, gain[pixels], out=out)
+        return out
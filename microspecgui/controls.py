@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""Translate keyboard and joystick input into GUI actions.
+
+Input is looked up in dispatch tables instead of testing every key
+against every event:
+
+- :data:`KEYS` maps (key, Shift held) to an action
+- :data:`BUTTONS` maps a joystick button to an action
+
+so each event costs one dictionary lookup, and the key state is read
+from the event itself, not from ``pygame.key.get_pressed()``.
+
+Cursor motions are *coalesced*: :meth:`Controls.read` sums the motions
+of all events of a frame into one move, see :class:`Motion`, so a
+burst of key presses moves the cursor once per frame by the total.
+
+Joystick sticks are polled once per frame instead of handled per
+event: a stick sends a stream of axis events that would flood the
+event queue and stall rendering, so axis events are blocked as soon as
+a joystick is connected.
+
+Example
+-------
+>>> controls = Controls()
+>>> while True:
+...     actions = controls.read(pygame.event.get())
+...     if 'quit' in actions: break
+...     cursor.move(controls.motion)
+"""
+
+from collections import namedtuple
+import pygame
+
+# Actions that move the cursor, in screen columns, see Motion
+STEPS = dict(left=-1, right=1, down=-10, up=10)
+JUMPS = ('home', 'end')
+
+# Keys that act the same with or without Shift
+_ANY_SHIFT = {
+    pygame.K_q: 'quit',
+    pygame.K_SPACE: 'autoexpose',
+    pygame.K_t: 'track_exposure',
+    pygame.K_LEFTBRACKET: 'skip_back',
+    pygame.K_RIGHTBRACKET: 'skip_forward',
+    pygame.K_TAB: 'next_kit',
+    pygame.K_w: 'waterfall',
+    pygame.K_n: 'average',
+    pygame.K_v: 'noise',
+    pygame.K_d: 'capture_dark',
+    pygame.K_r: 'capture_reference',
+    pygame.K_c: 'correction',
+    pygame.K_m: 'metrics',
+    pygame.K_b: 'binning',
+    pygame.K_o: 'crop',
+    pygame.K_p: 'postprocess',
+    pygame.K_e: 'hdr',
+    }
+
+# Keyboard: (key, Shift held) -> action
+KEYS = {
+    (pygame.K_x, False): 'decrease_exposure',
+    (pygame.K_x, True): 'increase_exposure',
+    (pygame.K_a, False): 'autoexpose',
+    (pygame.K_h, False): 'left',
+    (pygame.K_l, False): 'right',
+    (pygame.K_j, False): 'down',
+    (pygame.K_k, False): 'up',
+    (pygame.K_0, False): 'home',
+    (pygame.K_4, True): 'end', # $
+    }
+KEYS.update({
+    (key, shift): action
+    for key, action in _ANY_SHIFT.items()
+    for shift in (False, True)
+    })
+
+# Joystick buttons, tested with "Controller (XBOX 360 For Windows)"
+BUTTONS = {
+    0: 'autoexpose',        # A
+    2: 'decrease_exposure', # X
+    3: 'increase_exposure', # Y
+    6: 'quit',              # BACK
+    }
+
+Motion = namedtuple('Motion', [
+    'jump', # 'home', 'end', or None: move to the end of the range first
+    'step', # then move this many screen columns (right is positive)
+    ])
+
+class Controls(object):
+    """Read the actions of a frame from its events.
+
+    Attributes
+    ----------
+    joystick : :class:`pygame.joystick.Joystick`
+        the last connected joystick, None until one is connected
+    motion : :class:`Motion`
+        cursor motion of the events of the last :meth:`read`
+    """
+    def __init__(self):
+        self.joystick = None
+        self.motion = Motion(None, 0)
+
+    def read(self, events):
+        '''Return the actions of `events`, in order, except cursor motions.
+
+        Cursor motions are summed into `motion`.
+        '''
+        actions = []
+        jump, step = None, 0
+        for event in events:
+            action = None
+            if event.type == pygame.KEYDOWN:
+                action = KEYS.get((event.key, bool(event.mod & pygame.KMOD_SHIFT)))
+            elif event.type == pygame.JOYBUTTONDOWN:
+                action = BUTTONS.get(event.button)
+            elif event.type == pygame.QUIT:
+                action = 'quit'
+            elif event.type == pygame.JOYDEVICEADDED:
+                self._add_joystick(event.device_index)
+            if action is None:
+                continue
+            if action in STEPS:
+                step += STEPS[action]
+            elif action in JUMPS:
+                # a jump cancels the steps before it
+                jump, step = action, 0
+            else:
+                actions.append(action)
+        if self.joystick is not None:
+            jump, step = self._poll_sticks(jump, step)
+        self.motion = Motion(jump, step)
+        return actions
+
+    def _add_joystick(self, device_index):
+        self.joystick = pygame.joystick.Joystick(device_index)
+        self.joystick.init()
+        # sticks are polled: do not queue their stream of events
+        pygame.event.set_blocked(pygame.JOYAXISMOTION)
+
+    def _poll_sticks(self, jump, step):
+        '''Add the motion of the sticks pushed all the way.'''
+        # -1, 0 or 1: 1 only if within 0.05 of full scale
+        def axis(n): return int(round(self.joystick.get_axis(n), 1))
+        # right-hand stick for fine-grain left/right
+        step += STEPS['right']*axis(4)
+        # left-hand stick for coarse-grain left/right
+        step += STEPS['up']*axis(0)
+        # triggers: left to go home, right to go to the end
+        trigger = axis(2)
+        if trigger:
+            jump, step = ('home' if trigger == 1 else 'end'), 0
+        return jump, step
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""Extended dynamic range from a ladder of exposure times.
+
+A single exposure time cannot show weak and strong lines at once: an
+exposure long enough for the weak lines saturates the strong ones. An
+:class:`ExposureLadder` captures one frame at each exposure time of a
+ladder (e.g., 1ms, 10ms, 100ms) and merges them into one spectrum of
+extended dynamic range.
+
+Counts above the dark *offset* (the counts at zero exposure time) are
+proportional to exposure time, so each frame measures the same counts
+*rate* (counts per cycle), except where it saturates. The offset is
+subtracted from every frame first: scaled with the rate, it would add
+a false step to the merge wherever a pixel saturates in one more
+frame. The merged rate of a pixel is the sum of its counts above the
+offset over the sum of the exposure times, taking only the frames in
+which the pixel is not saturated: long exposures, with the better
+signal-to-noise ratio, weigh the most. A pixel saturated in every
+frame gets the lower bound of its shortest exposure.
+
+The merged spectrum is in counts at the longest exposure time, offset
+included, like a frame captured at that exposure time that does not
+saturate. It goes up to :attr:`ExposureLadder.full_scale`, far above
+65535 counts.
+
+The offset is estimated from the frames themselves, see
+:meth:`ExposureLadder.offset`, so the merge needs no dark spectrum.
+
+Example
+-------
+>>> ladder = ExposureLadder(cycles=[50, 500, 5000])
+>>> for i, cycles in enumerate(ladder.cycles):
+...     kit.setExposure(int(cycles))
+...     ladder.frames[i] = kit.captureFrame().pixels
+>>> spectrum = ladder.merge()
+"""
+
+import numpy as np
+from .autoexpose import SATURATION
+
+class ExposureLadder(object):
+    """Frames captured at a ladder of exposure times, and their merge.
+
+    Attributes
+    ----------
+    cycles : numpy.ndarray
+        exposure times in cycles, shortest first
+    frames : numpy.ndarray
+        ``(len(cycles), num_pixels)`` uint16 counts, row i is captured
+        with exposure time ``cycles[i]``
+    saturation : int
+        counts at or above this value are saturated
+    dark_percentile : int
+        percent of the pixels averaged to estimate the dark offset,
+        see :meth:`offset`
+    """
+    def __init__(self, cycles, num_pixels=392, saturation=SATURATION,
+                 dark_percentile=10):
+        '''
+        Parameters
+        ----------
+        cycles:
+            - exposure times in cycles, at least two different
+        num_pixels:
+            - pixels per frame, see :meth:`resize`
+        saturation, dark_percentile:
+            - see class attributes
+        '''
+        self.cycles = np.unique(cycles)
+        if len(self.cycles) < 2:
+            raise ValueError(f"a ladder needs two exposure times or more, got {list(cycles)}")
+        self.saturation = saturation
+        self.dark_percentile = dark_percentile
+        self.resize(num_pixels)
+
+    @property
+    def full_scale(self):
+        '''Largest merged counts value: full scale at the shortest exposure.'''
+        return 65535*self.cycles[-1]/self.cycles[0]
+
+    def resize(self, num_pixels):
+        '''Merge frames of `num_pixels` pixels, e.g., after binning changes.'''
+        self.frames = np.zeros((len(self.cycles), num_pixels), dtype=np.uint16)
+        self._unsaturated = np.empty(self.frames.shape, dtype=bool)
+        self._counts = np.empty(num_pixels)
+
+    def add(self, index, pixels):
+        '''Store the frame `pixels` captured with exposure time ``cycles[index]``.'''
+        if len(pixels) != self.frames.shape[1]: self.resize(len(pixels))
+        self.frames[index] = pixels
+
+    def offset(self):
+        '''Return the dark offset: the estimated counts at zero exposure time.
+
+        The darkest pixels (the `dark_percentile` percent darkest in
+        the longest exposure) see little light. Their mean counts grow
+        linearly with exposure time, light and dark current alike, so
+        their means in the two shortest exposures are extrapolated to
+        zero exposure time.
+        '''
+        frames = self.frames
+        k = max(frames.shape[1]*self.dark_percentile//100, 1)
+        # picked in another frame than the frames averaged: picking the
+        # lowest counts of a frame biases its mean low by the noise
+        darkest = np.argpartition(frames[-1], k-1)[:k]
+        low = frames[:2, darkest].mean(axis=1)
+        if frames[1, darkest].max() >= self.saturation:
+            # even the darkest pixels saturate: the shortest exposure only
+            return float(low[0])
+        c0, c1 = self.cycles[:2]
+        offset = (c1*low[0] - c0*low[1])/(c1 - c0)
+        # not below zero, not above the dark level of the shortest exposure
+        return float(min(max(offset, 0), low[0]))
+
+    def merge(self):
+        '''Return the merged spectrum, in counts at the longest exposure time.
+
+        Return a new array each call: the caller may keep it.
+        '''
+        frames, unsaturated, counts = self.frames, self._unsaturated, self._counts
+        offset = self.offset()
+        np.less(frames, self.saturation, out=unsaturated)
+        # exposure time and counts above the offset of the unsaturated
+        # frames of each pixel
+        time = self.cycles @ unsaturated
+        np.sum(frames, axis=0, out=counts, where=unsaturated)
+        counts -= offset*np.count_nonzero(unsaturated, axis=0)
+        merged = np.divide(
+            counts, time,
+            out=(frames[0] - offset)/self.cycles[0], # saturated in every frame
+            where=time > 0
+            )
+        merged *= self.cycles[-1]
+        # the offset once, like a frame at the longest exposure time
+        merged += offset
+        return merged
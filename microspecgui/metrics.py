@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""Time the stages of the GUI loop.
+
+:class:`Laps` is a stopwatch for a loop that runs the same stages
+every frame. It stores the duration of each stage of the most recent
+frames in a preallocated NumPy array, so timing a frame costs one
+:func:`time.perf_counter` call per stage and allocates nothing.
+
+Example
+-------
+>>> laps = Laps(['events', 'draw'])
+>>> while True:
+...     laps.start()
+...     handle_events()
+...     laps.lap('events')
+...     draw()
+...     laps.lap('draw')
+...     laps.end()
+>>> laps.summary()['draw']['p99'] # milliseconds
+
+:class:`Monitor` turns the laps and the frame counters into one row of
+metrics per second, and :class:`MetricsWriter` exports the rows to a
+CSV or JSON-lines file.
+
+:class:`Milestones` times things that happen once, e.g., the steps of
+startup up to the first frame.
+"""
+
+import csv
+import json
+from pathlib import Path
+import time
+import tracemalloc
+import numpy as np
+
+class Laps(object):
+    """Per-frame durations of the stages of a loop.
+
+    Attributes
+    ----------
+    stages : tuple
+        stage names in the order they run
+    times : numpy.ndarray
+        ``(capacity, len(stages))`` stage durations in seconds of the
+        last `capacity` frames, oldest frames overwritten first
+    count : int
+        number of frames timed
+    allocated : numpy.ndarray
+        if tracing allocations, the peak bytes allocated during each of
+        the last `capacity` frames
+    """
+    def __init__(self, stages, capacity=1000, trace_allocations=False):
+        '''
+        Parameters
+        ----------
+        stages:
+            - stage names in the order they run each frame
+        capacity:
+            - number of frames kept
+        trace_allocations:
+            - if True, also record the peak memory allocated during each
+              frame, see :mod:`tracemalloc`; start tracing with
+              ``tracemalloc.start()`` first
+            - the allocations of every thread are counted
+        '''
+        self.stages = tuple(stages)
+        self.capacity = capacity
+        self.times = np.zeros((capacity, len(self.stages)))
+        self.count = 0
+        self._column = {stage: i for i, stage in enumerate(self.stages)}
+        self._row = self.times[0]
+        self._t = time.perf_counter()
+        self.trace_allocations = trace_allocations
+        if trace_allocations:
+            if not hasattr(tracemalloc, 'reset_peak'):
+                raise RuntimeError("tracing allocations requires Python 3.9+")
+            self.allocated = np.zeros(capacity)
+            self._allocated_start = 0
+
+    def start(self):
+        '''Start timing a frame.'''
+        self._row = self.times[self.count % self.capacity]
+        if self.trace_allocations:
+            tracemalloc.reset_peak()
+            self._allocated_start = tracemalloc.get_traced_memory()[0]
+        self._t = time.perf_counter()
+
+    def lap(self, stage):
+        '''Record the time since the last lap (or start) as `stage`.'''
+        t = time.perf_counter()
+        # += so a stage may be timed in more than one piece per frame
+        self._row[self._column[stage]] += t - self._t
+        self._t = t
+
+    def end(self):
+        '''Finish timing a frame.'''
+        if self.trace_allocations:
+            self.allocated[self.count % self.capacity] = (
+                tracemalloc.get_traced_memory()[1] - self._allocated_start
+                )
+        self.count += 1
+        # clear the row the next frame overwrites
+        self.times[self.count % self.capacity] = 0
+
+    def recent(self, last=None):
+        '''Return the rows of `times` holding the frames timed.
+
+        Parameters
+        ----------
+        last:
+            - if given, only the rows of the `last` frames timed (at
+              most `capacity`), in no particular order
+        '''
+        n = min(self.count, self.capacity)
+        if last is None or last >= n:
+            return self.times[:n]
+        end = self.count % self.capacity
+        if last <= end:
+            return self.times[end-last:end]
+        # the last frames wrap around the end of the array
+        return np.concatenate((self.times[:end], self.times[end-last:]))
+
+    def summary(self, last=None):
+        '''Return statistics of the stage durations in milliseconds.
+
+        Parameters
+        ----------
+        last:
+            - if given, only the `last` frames timed, see :meth:`recent`
+
+        Return
+        ------
+        dict
+            stage name (and 'total', the whole frame) -> dict of
+            'mean', 'p50', 'p99', 'max'
+        '''
+        times = self.recent(last)*1e3
+        columns = dict(self._column)
+        columns['total'] = None
+        result = {}
+        for stage, column in columns.items():
+            if len(times) == 0:
+                t = np.zeros(1)
+            else:
+                t = times.sum(axis=1) if column is None else times[:,column]
+            result[stage] = dict(
+                mean=float(t.mean()),
+                p50=float(np.percentile(t, 50)),
+                p99=float(np.percentile(t, 99)),
+                max=float(t.max()),
+                )
+        return result
+
+class Monitor(object):
+    """Summarize the GUI loop and acquisition once per interval.
+
+    Each row of metrics covers the frames since the previous row:
+
+    - 'time': seconds since the epoch, 'seconds': length of interval
+    - 'loop_fps', 'plotted_fps', 'captured_fps': GUI loop frames,
+      new frames plotted, and frames captured by the kit, per second
+    - 'dropped', 'overwritten', 'stale': frames the kit dropped,
+      frames captured but overwritten before they were plotted, and
+      GUI frames that re-plotted old data because no new frame arrived
+    - '<stage>_ms', '<stage>_p99_ms': mean and 99th percentile
+      duration of each GUI loop stage, and of 'capture' (the kit)
+    """
+    # counters reported as the change since the previous row
+    COUNTERS = ('plotted', 'captured', 'dropped', 'overwritten', 'stale')
+
+    def __init__(self, laps, capture_laps, interval=1.0):
+        '''
+        Parameters
+        ----------
+        laps:
+            - :class:`Laps` of the GUI loop
+        capture_laps:
+            - :class:`Laps` of the acquisition worker, stage 'capture'
+        interval:
+            - seconds between rows
+        '''
+        self.laps = laps
+        self.capture_laps = capture_laps
+        self.interval = interval
+        self.row = None # latest row
+        self._last_time = time.perf_counter()
+        self._last_frames = laps.count
+        self._last_captures = capture_laps.count
+        self._last_counters = dict.fromkeys(self.COUNTERS, 0)
+
+    def update(self, **counters):
+        '''Return a new row of metrics if the interval is over, else None.
+
+        Parameters
+        ----------
+        counters:
+            - running totals of the frame counters, see class docstring
+        '''
+        now = time.perf_counter()
+        seconds = now - self._last_time
+        if seconds < self.interval: return None
+
+        frames = self.laps.count - self._last_frames
+        captures = self.capture_laps.count - self._last_captures
+        delta = {name: counters.get(name, 0) - self._last_counters[name]
+                 for name in self.COUNTERS}
+        row = dict(
+            time=time.time(),
+            seconds=seconds,
+            loop_fps=frames/seconds,
+            plotted_fps=delta['plotted']/seconds,
+            captured_fps=delta['captured']/seconds,
+            dropped=delta['dropped'],
+            overwritten=delta['overwritten'],
+            stale=delta['stale'],
+            )
+        stages = self.laps.summary(last=frames)
+        stages['capture'] = self.capture_laps.summary(last=captures)['capture']
+        for stage, t in stages.items():
+            row[f'{stage}_ms'] = t['mean']
+            row[f'{stage}_p99_ms'] = t['p99']
+
+        self._last_time = now
+        self._last_frames = self.laps.count
+        self._last_captures = self.capture_laps.count
+        self._last_counters.update(
+            (name, counters.get(name, 0)) for name in self.COUNTERS
+            )
+        self.row = row
+        return row
+
+class MetricsWriter(object):
+    """Write rows of metrics to a CSV or JSON-lines file.
+
+    The format is picked by the file suffix: ``.csv`` is CSV with a
+    header row, anything else is JSON lines (one JSON object per row).
+    Every row is flushed, so the file is up to date if the GUI is
+    killed.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.is_csv = Path(path).suffix.lower() == '.csv'
+        self._file = open(path, 'w', newline='' if self.is_csv else None)
+        self._csv = None
+
+    def write(self, row):
+        '''Append `row` (a dict) to the file.'''
+        if self.is_csv:
+            if self._csv is None:
+                self._csv = csv.DictWriter(self._file, fieldnames=list(row))
+                self._csv.writeheader()
+            self._csv.writerow(row)
+        else:
+            self._file.write(json.dumps(row) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class Milestones(object):
+    """Time of named events since a start time, e.g., of startup.
+
+    Attributes
+    ----------
+    start : float
+        :func:`time.perf_counter` time the milestones are timed from
+    times : dict
+        seconds from `start` to each milestone, in the order reached
+    """
+    def __init__(self, start=None):
+        '''
+        Parameters
+        ----------
+        start:
+            - :func:`time.perf_counter` time to time from, default is now
+        '''
+        self.start = time.perf_counter() if start is None else start
+        self.times = {}
+
+    def mark(self, name, at=None):
+        '''Record that milestone `name` is reached now, or at
+        :func:`time.perf_counter` time `at`.'''
+        if at is None: at = time.perf_counter()
+        self.times[name] = at - self.start
+
+    def report(self):
+        '''Return a table of the milestones: time since start and
+        time since the previous milestone, in milliseconds.'''
+        lines = [f'{"milestone":>16} {"at ms":>8} {"step ms":>8}']
+        last = 0
+        for name, t in self.times.items():
+            lines.append(f'{name:>16} {1e3*t:8.1f} {1e3*(t-last):8.1f}')
+            last = t
+        return '\n'.join(lines)
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""Find spectral peaks with sub-pixel resolution.
+
+:class:`PeakFinder` searches only the meaningful pixels
+(``start_pixel`` to ``stop_pixel``) of a frame:
+
+- the main peak is the largest counts value, found with one
+  vectorized :func:`numpy.argmax` over the meaningful pixels
+- other peaks are the local maxima that stand out from the spectrum
+  by at least a minimum *prominence*, largest first
+
+The position of each peak is refined to a fraction of a pixel, so a
+peak that moves by less than one pixel still moves on screen:
+
+parabolic
+    vertex of the parabola through the peak pixel and its neighbors
+centroid
+    center of mass of the counts above the local minimum, over the
+    peak pixel and two neighbors on each side
+
+The prominence of a peak is its height above the higher of the two
+minima that separate it from higher counts on its left and on its
+right (or from the ends of the meaningful pixels).
+
+Example
+-------
+>>> finder = PeakFinder(start_pixel=220, stop_pixel=373, num_peaks=3)
+>>> peaks = finder.find(frame.pixels)
+>>> peaks[0].pixel # main peak, fractional pixel number
+"""
+
+from collections import namedtuple
+import numpy as np
+
+METHODS = ('parabolic', 'centroid')
+
+Peak = namedtuple('Peak', [
+    'index',      # fractional pixel index, pixel number is index+first_pixel
+    'pixel',      # fractional pixel number
+    'counts',     # counts value at the peak pixel
+    'prominence', # counts above the surrounding minima
+    ])
+
+def parabolic(counts, index):
+    '''Return the fractional index of the vertex of the parabola
+    through counts at `index`-1, `index`, `index`+1.'''
+    if index <= 0 or index >= len(counts)-1:
+        return float(index)
+    left = float(counts[index-1])
+    center = float(counts[index])
+    right = float(counts[index+1])
+    curvature = left - 2*center + right
+    if curvature >= 0:
+        # flat or not a maximum: no refinement
+        return float(index)
+    return index + 0.5*(left - right)/curvature
+
+def centroid(counts, index, half_width=2):
+    '''Return the fractional index of the center of mass of counts
+    around `index` (`half_width` pixels each side), above the local
+    minimum.'''
+    lo = max(index - half_width, 0)
+    hi = min(index + half_width + 1, len(counts))
+    window = np.asarray(counts[lo:hi], dtype=float)
+    window -= window.min()
+    total = window.sum()
+    if total == 0:
+        return float(index)
+    return lo + float(np.dot(window, np.arange(hi-lo)))/total
+
+_REFINE = dict(parabolic=parabolic, centroid=centroid)
+
+def prominence(counts, index):
+    '''Return the prominence of the local maximum at `index`.'''
+    height = counts[index]
+    # nearest higher counts on each side bound the peak
+    higher = np.flatnonzero(counts[:index] > height)
+    left = higher[-1]+1 if len(higher) else 0
+    higher = np.flatnonzero(counts[index+1:] > height)
+    right = index+1+higher[0] if len(higher) else len(counts)
+    left_min = counts[left:index].min() if index > left else height
+    right_min = counts[index+1:right].min() if right > index+1 else height
+    return height - max(left_min, right_min)
+
+class PeakFinder(object):
+    """Find the peaks in the meaningful pixels of a frame.
+
+    Attributes
+    ----------
+    method : str
+        sub-pixel refinement, one of :data:`METHODS`
+    num_peaks : int
+        find at most this many peaks (the main peak is always found)
+    min_prominence : float
+        counts a peak other than the main peak must stand out by
+    """
+    def __init__(self, start_pixel, stop_pixel, num_peaks=1,
+                 min_prominence=2000, method='parabolic', first_pixel=1):
+        '''
+        Parameters
+        ----------
+        start_pixel, stop_pixel:
+            - first and last pixel number of meaningful data
+        num_peaks, min_prominence, method:
+            - see class attributes
+        first_pixel:
+            - pixel number of index 0 of the frames searched, e.g.,
+              `start_pixel` for frames cropped to the meaningful data
+        '''
+        if method not in METHODS:
+            raise ValueError(f"method must be one of {METHODS}, got {method!r}")
+        if num_peaks < 1:
+            raise ValueError(f"num_peaks must be at least 1, got {num_peaks}")
+        self.first_pixel = first_pixel
+        self.start = start_pixel-first_pixel # index of the first meaningful pixel
+        self.stop = stop_pixel-first_pixel+1 # index after the last meaningful pixel
+        self.num_peaks = num_peaks
+        self.min_prominence = min_prominence
+        self.method = method
+
+    def find(self, counts):
+        '''Return the peaks of `counts`, main peak first.
+
+        Return
+        ------
+        list
+            at most `num_peaks` :class:`Peak`, in order of decreasing
+            counts
+        '''
+        window = np.asarray(counts)[self.start:self.stop]
+        refine = _REFINE[self.method]
+
+        # main peak: one vectorized search of the meaningful pixels
+        main = int(np.argmax(window))
+        peaks = [self._peak(window, main, refine)]
+        if self.num_peaks == 1:
+            return peaks
+
+        # other peaks: local maxima (first pixel of a plateau)
+        center = window[1:-1]
+        maxima = 1 + np.flatnonzero(
+            (center > window[:-2]) & (center >= window[2:])
+            )
+        # prominence is at most the height above the lowest counts
+        maxima = maxima[window[maxima] - window.min() >= self.min_prominence]
+        # largest first
+        maxima = maxima[np.argsort(window[maxima], kind='stable')[::-1]]
+        for index in maxima:
+            if len(peaks) == self.num_peaks: break
+            if index == main: continue
+            if prominence(window, index) >= self.min_prominence:
+                peaks.append(self._peak(window, int(index), refine))
+        return peaks
+
+    def _peak(self, window, index, refine):
+        fractional = self.start + refine(window, index)
+        return Peak(
+            index=fractional,
+            pixel=fractional+self.first_pixel,
+            counts=window[index].item(),
+            prominence=prominence(window, index).item(),
+            )
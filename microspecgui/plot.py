@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""Spectrum plot data with NumPy.
+
+The x-coordinates of the plot depend only on the plot layout, so
+:class:`Trace` computes them once. Each frame, :meth:`Trace.update`
+scales and flips the counts in one vectorized step, writing into a
+preallocated ``(N,2)`` array of screen coordinates. The segments of
+the trace (meaningful data and ignored data) are views into that
+array, so plotting a frame allocates no Python lists. Counts outside
+0 to `yrange` (e.g., corrected or HDR counts) are clipped to the plot.
+"""
+
+import numpy as np
+
+class Trace(object):
+    """Screen coordinates of the spectrum trace.
+
+    By default (`reverse` is True), pixel index i (pixel number
+    i+`first_pixel`) is plotted at screen column
+    ``yax_space + max_data_length - 1 - i`` to put short wavelengths on
+    the left side of the plot. If wavelength increases with pixel
+    number, `reverse` is False and pixel index i is plotted at screen
+    column ``yax_space + i``.
+
+    A cropped frame (only the pixels from `first_pixel` on) is plotted
+    the same way: pixel numbers stay the pixel numbers of the full
+    frame.
+
+    Attributes
+    ----------
+    x : numpy.ndarray
+        Screen x-coordinate of each pixel index. Read-only.
+    xy : numpy.ndarray
+        ``(max_data_length,2)`` screen coordinates, updated in place.
+    meaningful, ignored_lower, ignored_upper : numpy.ndarray
+        Views into `xy` for pixels ``start_pixel:stop_pixel`` and the
+        pixels below and above that range.
+    """
+    def __init__(self, max_data_length, start_pixel, stop_pixel,
+                 plot_height, margin, yax_space, yrange=65535, reverse=True,
+                 first_pixel=1):
+        '''
+        Parameters
+        ----------
+        max_data_length:
+            - number of pixels plotted (depends on binning and cropping)
+        start_pixel, stop_pixel:
+            - first and last pixel number of meaningful data
+        plot_height, margin, yax_space:
+            - plot layout in screen pixels
+        yrange:
+            - counts value plotted at the top of the plot
+        reverse:
+            - plot pixel 1 on the right (True) or on the left (False)
+        first_pixel:
+            - pixel number of pixel index 0, e.g., `start_pixel` to
+              plot the meaningful data only
+        '''
+        self.max_data_length = max_data_length
+        self.first_pixel = first_pixel
+        self.yax_space = yax_space
+
+        # counts -> screen y: y = offset + scale*counts
+        # flip to plot upright: full scale is at the top of the plot
+        self._scale = -plot_height/yrange
+        self._offset = plot_height + margin
+        self._top = margin # screen y of full scale
+
+        # x-axis: short wavelengths on left side of plot
+        if reverse:
+            self.x = yax_space + np.arange(max_data_length-1, -1, -1)
+        else:
+            self.x = yax_space + np.arange(max_data_length)
+        self.x.flags.writeable = False
+
+        # screen column -> pixel number (0: no pixel at this column)
+        self._pixel_at = np.zeros(yax_space + max_data_length, dtype=int)
+        self._pixel_at[self.x] = np.arange(first_pixel, first_pixel+max_data_length)
+
+        self.xy = np.empty((max_data_length, 2))
+        self.xy[:,0] = self.x
+        self.xy[:,1] = self._offset
+
+        # Plot segments are views: they see every update of xy
+        start = max(start_pixel-first_pixel, 0)
+        stop = max(stop_pixel-first_pixel+1, 0)
+        self.meaningful = self.xy[start:stop]
+        self.ignored_lower = self.xy[0:start]
+        self.ignored_upper = self.xy[stop:]
+
+    def update(self, counts):
+        '''Scale and flip `counts` into the screen y-coordinates.
+
+        Counts below 0 or above `yrange` are plotted at the bottom or
+        top of the plot.
+        '''
+        y = self.xy[:,1]
+        np.multiply(counts, self._scale, out=y)
+        y += self._offset
+        np.clip(y, self._top, self._offset, out=y)
+
+    def pixel_number(self, position):
+        '''Return the pixel number plotted at screen column `position`.
+
+        Raise ValueError if no pixel is plotted at `position`.
+        '''
+        pixel = 0
+        if 0 <= position < len(self._pixel_at):
+            pixel = self._pixel_at[position]
+        if pixel == 0:
+            raise ValueError(f"no pixel at screen column {position}")
+        return int(pixel)
+
+    def position(self, pixel):
+        '''Return the screen column where pixel number `pixel` is plotted.'''
+        return int(self.x[pixel-self.first_pixel])
+
+    def screen_x(self, index):
+        '''Return the screen x-coordinate of fractional pixel `index`.'''
+        step = self.x[1] - self.x[0] # +1 or -1
+        return float(self.x[0] + step*index)
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""Post-process frames on a pool of worker processes.
+
+Smoothing, baseline removal and line fitting take too long to run in
+the GUI loop at the GUI frame rate. :class:`PostProcessor` runs them
+on a :class:`concurrent.futures.ProcessPoolExecutor` instead, and the
+GUI keeps drawing the raw frames at full rate while it overlays the
+newest processed result.
+
+Frames do not travel through the task queue: each worker has a *slot*
+in one block of :mod:`multiprocessing.shared_memory`, an input row the
+frame is copied into and an output row the processed spectrum is
+written to. The task itself is only the slot, the frame length and
+the stages, and the reply is only the line fit.
+
+There is no queue of frames waiting to be processed. A frame submitted
+while every worker is busy is dropped (and counted): by the time a
+worker is free a newer frame has arrived, so the overlay always shows
+the newest frame a worker could take, and slow post-processing never
+delays the raw plot or piles up memory.
+
+Stages, applied in order (see :data:`STAGES`):
+
+- ``smooth``: Savitzky-Golay smoothing
+- ``baseline``: subtract the baseline, fit as the lower envelope
+- ``fit``: fit a Gaussian to the main line in the meaningful pixels
+
+Example
+-------
+>>> with PostProcessor(('smooth', 'fit'), max_pixels=784) as post:
+...     post.submit(frame.pixels, window=(219, 373))
+...     result = post.poll() # None until a new result is done
+"""
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import numpy as np
+
+# Post-processing stages, in the order they are applied
+STAGES = ('smooth', 'baseline', 'fit')
+
+LineFit = namedtuple('LineFit', [
+    'index',  # fractional pixel index of the line center
+    'fwhm',   # full width at half maximum in pixels
+    'height', # counts at the line center
+    ])
+
+Result = namedtuple('Result', [
+    'spectrum', # processed counts, same length as the frame submitted
+    'fit',      # LineFit of the main line, None if not fit (or no line)
+    'tag',      # tag the frame was submitted with
+    ])
+
+def savgol_coefficients(window_length, order):
+    '''Return the Savitzky-Golay smoothing coefficients.
+
+    The smoothed value is the value at the center of the least-squares
+    polynomial of degree `order` through `window_length` (odd) points.
+    '''
+    half = window_length//2
+    x = np.arange(-half, half+1)
+    # row 0 of the pseudo-inverse evaluates the fit polynomial at 0
+    return np.linalg.pinv(np.vander(x, order+1, increasing=True))[0]
+
+def smooth(counts, window_length=7, order=3):
+    '''Return `counts` smoothed with a Savitzky-Golay filter.
+
+    The ends are extended with the end values, so the smoothed
+    spectrum has the length of `counts`.
+    '''
+    coefficients = savgol_coefficients(window_length, order)
+    padded = np.pad(np.asarray(counts, dtype=float), window_length//2, mode='edge')
+    return np.convolve(padded, coefficients, mode='valid')
+
+def remove_baseline(counts, order=3, iterations=20):
+    '''Return `counts` minus its baseline.
+
+    The baseline is a polynomial of degree `order` fit to the lower
+    envelope: each iteration fits the polynomial and clips the counts
+    above it, so the lines no longer pull the fit up.
+    '''
+    counts = np.asarray(counts, dtype=float)
+    x = np.linspace(-1, 1, len(counts))
+    envelope = counts.copy()
+    for _ in range(iterations):
+        baseline = np.polynomial.polynomial.polyval(
+            x, np.polynomial.polynomial.polyfit(x, envelope, order)
+            )
+        np.minimum(envelope, baseline, out=envelope)
+    return counts - baseline
+
+def fit_line(counts, start=0, stop=None):
+    '''Fit a Gaussian to the main line of ``counts[start:stop]``.
+
+    The line is the peak and the pixels around it above half its
+    height. Its log is fit with a parabola, weighted by the counts so
+    the noisy tails count less (Guo's method).
+
+    Return
+    ------
+    :class:`LineFit`
+        index is a fractional index into `counts`, None if the line
+        is too narrow or not a peak
+    '''
+    window = np.asarray(counts, dtype=float)[start:stop]
+    peak = int(np.argmax(window))
+    height = window[peak]
+    if height <= 0:
+        return None
+    below = np.flatnonzero(window <= height/2)
+    left = below[below < peak]
+    right = below[below > peak]
+    left = left[-1]+1 if len(left) else 0
+    right = right[0] if len(right) else len(window)
+    if right - left < 3:
+        return None
+    y = window[left:right]
+    x = np.arange(left, right) - peak
+    a, b, c = np.polyfit(x, np.log(y), 2, w=y)
+    if a >= 0:
+        return None
+    center = -b/(2*a)
+    return LineFit(
+        index=float(start + peak + center),
+        fwhm=float(2*np.sqrt(np.log(2)/-a)),
+        height=float(np.exp(c - b*b/(4*a))),
+        )
+
+# -----------
+# | Workers |
+# -----------
+
+# the shared memory of a worker process, see _attach
+_shared = None
+
+def _attach(name, num_slots, max_pixels):
+    '''Map the shared memory of the slots. Runs once per worker.'''
+    global _shared
+    from multiprocessing.shared_memory import SharedMemory
+    memory = SharedMemory(name=name)
+    rows = np.ndarray((2, num_slots, max_pixels), dtype=float, buffer=memory.buf)
+    _shared = (memory, rows[0], rows[1])
+
+def _process(slot, num_pixels, stages, window):
+    '''Process the frame in input `slot` into output `slot`.'''
+    memory, inputs, outputs = _shared
+    counts = inputs[slot, :num_pixels]
+    fit = None
+    for stage in stages:
+        if stage == 'smooth':
+            counts = smooth(counts)
+        elif stage == 'baseline':
+            counts = remove_baseline(counts)
+        elif stage == 'fit':
+            fit = fit_line(counts, *window)
+    outputs[slot, :num_pixels] = counts
+    return fit
+
+class PostProcessor(object):
+    """Process frames on worker processes, dropping stale frames.
+
+    Attributes
+    ----------
+    stages : tuple
+        stages applied in order, see :data:`STAGES`
+    submitted : int
+        frames given to a worker
+    dropped : int
+        frames dropped because every worker was busy
+    processed : int
+        results returned by :meth:`poll`
+    skipped : int
+        results :meth:`poll` skipped because a newer result was done
+    failed : int
+        frames a stage raised an exception on
+    error : Exception
+        the newest exception a stage raised, None if none failed
+    """
+    def __init__(self, stages=STAGES, max_pixels=784, workers=1):
+        '''
+        Parameters
+        ----------
+        stages:
+            - see class attributes
+        max_pixels:
+            - the longest frame submitted
+        workers:
+            - worker processes, each processes one frame at a time
+        '''
+        for stage in stages:
+            if stage not in STAGES:
+                raise ValueError(f"stage must be one of {STAGES}, got {stage!r}")
+        self.stages = tuple(stages)
+        self.max_pixels = max_pixels
+        self.submitted = 0
+        self.dropped = 0
+        self.processed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.error = None
+        try:
+            # imported here: the rest of the module runs on Python 3.7
+            from multiprocessing.shared_memory import SharedMemory
+        except ImportError:
+            raise RuntimeError("post-processing requires Python 3.8+") from None
+        # one input and one output row per worker
+        self._memory = SharedMemory(create=True, size=2*workers*max_pixels*8)
+        rows = np.ndarray((2, workers, max_pixels), dtype=float, buffer=self._memory.buf)
+        self._inputs, self._outputs = rows
+        # spawn: do not fork the GUI (its display and threads)
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_attach,
+            initargs=(self._memory.name, workers, max_pixels),
+            )
+        self._free = list(range(workers)) # slots with no frame in flight
+        self._jobs = [] # (future, slot, num_pixels, tag) in order submitted
+
+    def submit(self, counts, window=(0, None), tag=None):
+        '''Process `counts` if a worker is free, else drop them.
+
+        Parameters
+        ----------
+        counts:
+            - the frame, at most `max_pixels` counts
+        window:
+            - (start, stop) indices of the pixels searched for the line
+              to fit, None: to the end
+        tag:
+            - returned with the result, e.g., to tell the results of
+              frames of different pixel layouts apart
+
+        Return
+        ------
+        bool
+            False if the frame was dropped
+        '''
+        if not self._free:
+            self.dropped += 1
+            return False
+        slot = self._free.pop()
+        num_pixels = len(counts)
+        self._inputs[slot, :num_pixels] = counts
+        try:
+            future = self._pool.submit(_process, slot, num_pixels, self.stages, window)
+        except Exception as error:
+            # e.g., a worker died and broke the pool
+            self._free.append(slot)
+            self.failed += 1
+            self.error = error
+            return False
+        self._jobs.append((future, slot, num_pixels, tag))
+        self.submitted += 1
+        return True
+
+    def poll(self):
+        '''Return the newest finished :class:`Result`, None if none finished.
+
+        Results finished before the newest are skipped. The spectrum
+        is a copy: the output row is reused by the next frame. A stage
+        that raised does not raise here: the frame is counted in
+        `failed` and the exception kept in `error`.
+        '''
+        result = None
+        while self._jobs and self._jobs[0][0].done():
+            future, slot, num_pixels, tag = self._jobs.pop(0)
+            try:
+                fit = future.result()
+                if result is not None: self.skipped += 1
+                result = Result(self._outputs[slot, :num_pixels].copy(), fit, tag)
+            except Exception as error:
+                self.failed += 1
+                self.error = error
+            finally:
+                self._free.append(slot)
+        if result is not None: self.processed += 1
+        return result
+
+    def close(self):
+        '''Stop the workers and free the shared memory.'''
+        # frames not yet started are dropped, not processed
+        # (shutdown's cancel_futures requires Python 3.9)
+        for future, *_ in self._jobs:
+            future.cancel()
+        self._jobs = []
+        self._pool.shutdown(wait=True)
+        # release the views of the shared memory before closing it
+        self._inputs = self._outputs = None
+        self._memory.close()
+        self._memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""Record spectra to a fixed-record binary file.
+
+File layout
+-----------
+The file is a 64-byte header followed by fixed-size frame records.
+All values are little-endian.
+
+Header (:data:`HEADER_DTYPE`)::
+
+    magic        8 bytes  b'MSPECREC'
+    version      uint16   file layout version, currently 1
+    binning      uint8    BINNING_ON (1) or BINNING_OFF (0)
+    num_pixels   uint16   pixels per frame
+    start_pixel  uint16   first pixel of meaningful data
+    stop_pixel   uint16   last pixel of meaningful data
+    cycles       uint16   exposure time (cycles) when recording started
+    (reserved, zero-filled up to 64 bytes)
+
+Record (:func:`record_dtype`)::
+
+    timestamp    float64  seconds since the epoch
+    pixels       uint16[num_pixels]
+
+Because every record is the same size, the records are a NumPy array
+that is memory-mapped by :func:`open_recording` without reading the
+file.
+
+Example
+-------
+Record frames:
+
+>>> with Recorder('out.bin', binning=1, num_pixels=392,
+...               start_pixel=220, stop_pixel=373, cycles=50) as rec:
+...     rec.write(time.time(), kit.captureFrame().pixels)
+
+Load the recording:
+
+>>> header, frames = open_recording('out.bin')
+>>> frames['pixels'][0] # first frame
+"""
+
+import numpy as np
+
+MAGIC = b'MSPECREC'
+VERSION = 1
+HEADER_SIZE = 64
+
+_header_fields = [
+    ('magic', 'S8'),
+    ('version', '<u2'),
+    ('binning', 'u1'),
+    ('num_pixels', '<u2'),
+    ('start_pixel', '<u2'),
+    ('stop_pixel', '<u2'),
+    ('cycles', '<u2'),
+    ]
+# pad the header to HEADER_SIZE bytes
+HEADER_DTYPE = np.dtype(_header_fields + [(
+    'reserved', 'u1', HEADER_SIZE - np.dtype(_header_fields).itemsize
+    )])
+
+def record_dtype(num_pixels):
+    '''Return the dtype of one frame record with `num_pixels` pixels.'''
+    return np.dtype([
+        ('timestamp', '<f8'),
+        ('pixels', '<u2', (num_pixels,)),
+        ])
+
+class Recorder(object):
+    """Append frames to a recording through a buffered writer.
+
+    Each frame is copied into one preallocated record and the record's
+    bytes are written, so writing a frame allocates nothing. Bursts are
+    copied into a block of records that grows to the largest burst
+    written and is reused after that.
+    """
+    def __init__(self, path, binning, num_pixels, start_pixel, stop_pixel,
+                 cycles, buffering=1<<20):
+        '''Create the file at `path` and write the header.
+
+        Parameters
+        ----------
+        path:
+            - recording file, overwritten if it exists
+        binning, num_pixels, start_pixel, stop_pixel, cycles:
+            - header values, see module docstring
+        buffering:
+            - size in bytes of the write buffer
+        '''
+        self.path = path
+        self.num_frames = 0
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header['magic'] = MAGIC
+        header['version'] = VERSION
+        header['binning'] = binning
+        header['num_pixels'] = num_pixels
+        header['start_pixel'] = start_pixel
+        header['stop_pixel'] = stop_pixel
+        header['cycles'] = cycles
+        self._record = np.zeros(1, dtype=record_dtype(num_pixels))
+        self._records = self._record # block of records for write_batch
+        self._file = open(path, 'wb', buffering=buffering)
+        self._file.write(header.tobytes())
+
+    def write(self, timestamp, pixels):
+        '''Append one frame.
+
+        Parameters
+        ----------
+        timestamp:
+            - capture time in seconds since the epoch
+        pixels:
+            - `num_pixels` counts values, e.g., ``frame.pixels``
+        '''
+        self._record['timestamp'] = timestamp
+        self._record['pixels'][0] = pixels
+        self._file.write(self._record.data)
+        self.num_frames += 1
+
+    def write_batch(self, timestamps, frames):
+        '''Append many frames with one write.
+
+        Parameters
+        ----------
+        timestamps:
+            - capture time of each frame in seconds since the epoch
+        frames:
+            - ``(num_frames, num_pixels)`` counts, e.g., the frames of
+              a :class:`~microspecgui.batch.BatchCapture`
+        '''
+        num_frames = len(frames)
+        if len(self._records) < num_frames:
+            self._records = np.zeros(num_frames, dtype=self._record.dtype)
+        records = self._records[:num_frames]
+        records['timestamp'] = timestamps
+        records['pixels'] = frames
+        self._file.write(records.data)
+        self.num_frames += num_frames
+
+    def close(self):
+        '''Flush buffered frames and close the file.'''
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def read_header(path):
+    '''Return the header of the recording at `path` as a dict.
+
+    Raise ValueError if `path` is not a recording.
+    '''
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+    if len(header) == 0 or header['magic'][0] != MAGIC:
+        raise ValueError(f"{path} is not a spectra recording")
+    if header['version'][0] != VERSION:
+        raise ValueError(
+            f"{path}: unsupported recording version {header['version'][0]}"
+            )
+    return {name: header[name][0].item() for name, _ in _header_fields}
+
+def open_recording(path):
+    '''Memory-map the recording at `path`.
+
+    Frames are read from disk only when they are accessed, so even a
+    multi-gigabyte recording opens instantly. A partly written last
+    record (e.g., the recorder was killed) is ignored.
+
+    Return
+    ------
+    tuple
+        (header, frames) where header is the dict returned by
+        :func:`read_header` and frames is a read-only structured array
+        with fields 'timestamp' and 'pixels'.
+    '''
+    header = read_header(path)
+    dtype = record_dtype(header['num_pixels'])
+    with open(path, 'rb') as f:
+        size = f.seek(0, 2)
+    num_frames = (size - HEADER_SIZE) // dtype.itemsize
+    if num_frames == 0:
+        frames = np.zeros(0, dtype=dtype)
+    else:
+        frames = np.memmap(path, dtype=dtype, mode='r',
+                           offset=HEADER_SIZE, shape=(num_frames,))
+    return header, frames
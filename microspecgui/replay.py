@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""Play back a recording as if it were a dev-kit.
+
+:class:`ReplayKit` memory-maps a recording made with
+:mod:`microspecgui.record` and answers ``captureFrame()`` with the
+recorded frames. Hand it to :class:`microspecgui.acquire.Acquisition`
+in place of a :class:`MicroSpecSimpleInterface` and the frames go
+through the same rendering path as live data: peak detection, cursor,
+and reference lines.
+
+Frames are read from disk only when they are played, so a
+multi-gigabyte recording opens instantly and seeking does not read the
+frames in between.
+
+Example
+-------
+Play at twice the recorded rate, starting 60 seconds in:
+
+>>> kit = ReplayKit('out.bin', speed=2)
+>>> kit.seekTime(60)
+>>> acq = Acquisition(kit)
+"""
+
+from pathlib import Path
+import time
+import numpy as np
+from .record import open_recording
+from . import replies
+
+class ReplayKit(object):
+    """Frame source that plays back a recording.
+
+    Attributes
+    ----------
+    header : dict
+        recording header, see :func:`microspecgui.record.read_header`
+    frames : numpy.ndarray
+        memory-mapped frame records
+    index : int
+        index of the next frame played
+    speed : float
+        playback speed: 1 is real-time, 2 is twice as fast, 0 plays
+        frames as fast as they are requested
+    loop : bool
+        rewind to the first frame after the last frame
+    """
+    def __init__(self, path, speed=1, loop=True):
+        '''
+        Parameters
+        ----------
+        path:
+            - recording file
+        speed:
+            - see class attribute `speed`
+        loop:
+            - see class attribute `loop`
+        '''
+        self.header, self.frames = open_recording(path)
+        if len(self.frames) == 0:
+            raise ValueError(f"{path} has no frames")
+        self.speed = speed
+        self.loop = loop
+        self.serial = replies.Serial(serial_number=f'replay {Path(path).name}')
+        self._cycles = self.header['cycles']
+        # timestamps are only read where they are needed
+        self._timestamps = self.frames['timestamp']
+        self.seek(0)
+
+    def __len__(self):
+        return len(self.frames)
+
+    # -------------------
+    # | Playback control |
+    # -------------------
+
+    def seek(self, index):
+        '''Play frame `index` next. Return the frame index.'''
+        self.index = min(max(int(index), 0), len(self.frames)-1)
+        # restart the playback clock at this frame
+        self._wall_start = time.perf_counter()
+        self._rec_start = self._timestamps[self.index]
+        return self.index
+
+    def seekTime(self, seconds):
+        '''Play the frame recorded `seconds` after the first frame next.
+
+        Return the frame index.
+        '''
+        # binary search: reads only the pages the search touches
+        t = self._timestamps[0] + seconds
+        return self.seek(np.searchsorted(self._timestamps, t))
+
+    def skip(self, seconds):
+        '''Seek `seconds` forward (backward if negative) from the next
+        frame. Return the frame index.'''
+        return self.seekTime(self.time() + seconds)
+
+    def time(self):
+        '''Return the time of the next frame since the first frame.'''
+        return self._timestamps[self.index] - self._timestamps[0]
+
+    # ------------------------------------
+    # | MicroSpecSimpleInterface methods |
+    # ------------------------------------
+
+    def captureFrame(self):
+        '''Return the next recorded frame when it is due.
+
+        Return None after the last frame if not looping.
+        '''
+        if self.index >= len(self.frames):
+            if not self.loop:
+                # do not spin the acquisition worker
+                time.sleep(0.1)
+                return None
+            self.seek(0)
+        if self.speed:
+            elapsed = (self._timestamps[self.index] - self._rec_start)/self.speed
+            delay = self._wall_start + elapsed - time.perf_counter()
+            if delay > 0: time.sleep(delay)
+        pixels = self.frames['pixels'][self.index]
+        self.index += 1
+        # the kit replies with a list of counts: reply with the uint16
+        # row of the memory map instead, the frame format of the GUI
+        # (see as_frame), so a played frame is never copied
+        return replies.CaptureFrame(
+            status=replies.STATUS_OK,
+            num_pixels=len(pixels),
+            pixels=pixels
+            )
+
+    def getExposure(self):
+        '''Return the exposure time the recording started with.'''
+        return replies.GetExposure(status=replies.STATUS_OK, cycles=self._cycles)
+
+    def setExposure(self, cycles):
+        '''Recorded frames cannot change exposure time: do nothing.'''
+        return replies.Status(status=replies.STATUS_OK)
+
+    def autoExposure(self):
+        '''Recorded frames cannot change exposure time: give up.'''
+        return replies.AutoExposure(
+            status=replies.STATUS_OK,
+            success=0,
+            iterations=0
+            )
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""Replies returned by dev-kit stand-ins.
+
+Frame sources that are not a real dev-kit (e.g., replaying a
+recording or simulating a kit) return these instead of :mod:`microspeclib` replies. Each
+reply has the attribute names of the :mod:`microspeclib` reply it
+stands in for, so the GUI cannot tell the difference.
+"""
+
+from collections import namedtuple
+
+# reply to commands that only return a status, e.g., setExposure
+Status = namedtuple('Status', 'status')
+CaptureFrame = namedtuple('CaptureFrame', 'status num_pixels pixels')
+GetExposure = namedtuple('GetExposure', 'status cycles')
+AutoExposure = namedtuple('AutoExposure', 'status success iterations')
+GetAutoExposeConfig = namedtuple(
+    'GetAutoExposeConfig',
+    'status max_tries start_pixel stop_pixel target target_tolerance max_exposure'
+    )
+GetSensorConfig = namedtuple('GetSensorConfig', 'status binning gain row_bitmap')
+GetLED = namedtuple('GetLED', 'status led_setting')
+# serial number of the kit, like the microspeclib `kit.serial`
+Serial = namedtuple('Serial', 'serial_number')
+
+STATUS_OK = 0
+
+# Exposure time of one cycle in seconds (see to_ms)
+SECONDS_PER_CYCLE = 20e-6
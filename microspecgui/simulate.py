@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""Simulated spectrometer dev-kit.
+
+:class:`SimulatedKit` is a drop-in stand-in for
+:class:`MicroSpecSimpleInterface` that needs no hardware. It answers
+every dev-kit command the GUI uses and captures synthetic spectra: a
+few emission lines on a dark level, with counts that scale with the
+exposure time and saturate at 65535.
+
+Use it to measure GUI throughput without a dev-kit attached:
+
+$ microspec-gui --simulate
+
+Example
+-------
+>>> kit = SimulatedKit(latency=0.002, drop_rate=0.01)
+>>> configure_devkit(kit)
+>>> frame = kit.captureFrame()
+"""
+
+import time
+import numpy as np
+from . import replies
+from .replies import SECONDS_PER_CYCLE
+# Largest 16-bit counts value
+FULL_SCALE = 65535
+
+class SimulatedKit(object):
+    """Hardware-free dev-kit that captures synthetic spectra.
+
+    Attributes
+    ----------
+    latency : float
+        seconds added to every command, like a USB round trip
+    drop_rate : float
+        probability that ``captureFrame()`` drops the frame (returns
+        None), like the rare dropped frame of a real kit
+    firmware_bug_rate : float
+        probability that ``setAutoExposeConfig()`` sets max_exposure to
+        4112 instead of the value sent, like the dev-kit firmware bug
+    realtime : bool
+        if True, ``captureFrame()`` takes as long as the exposure time;
+        if False, only `latency` is added
+    """
+    # Emission lines: (position as fraction of num_pixels,
+    # width in binned pixels, counts per cycle at the line peak)
+    LINES = (
+        (0.62, 3.0, 230.0),
+        (0.74, 5.0, 120.0),
+        (0.88, 2.0, 60.0),
+        )
+    # counts when the exposure time is zero
+    DARK_LEVEL = 2000.0
+    # dark counts per cycle
+    DARK_RATE = 0.5
+    # read noise in counts (standard deviation)
+    READ_NOISE = 20.0
+
+    def __init__(self, latency=0.0, drop_rate=0.0, firmware_bug_rate=0.0,
+                 realtime=True, seed=None, serial_number='SIMULATED'):
+        '''
+        Parameters
+        ----------
+        latency, drop_rate, firmware_bug_rate, realtime:
+            - see class attributes
+        seed:
+            - seed for the random numbers, default None is a different
+              sequence every run
+        serial_number:
+            - serial number reported in ``kit.serial``
+        '''
+        self.latency = latency
+        self.drop_rate = drop_rate
+        self.firmware_bug_rate = firmware_bug_rate
+        self.realtime = realtime
+        self.serial = replies.Serial(serial_number=serial_number)
+        self._rng = np.random.default_rng(seed)
+
+        # Firmware defaults
+        self._bridge_led = [1]
+        self._sensor_led = [1, 1]
+        self._gain = 0x01
+        self._row_bitmap = 0x1F
+        self._cycles = 50
+        self._autoexpose_config = dict(
+            max_tries=12, start_pixel=8, stop_pixel=392,
+            target=46420, target_tolerance=3277, max_exposure=10000
+            )
+        self._set_binning(1)
+
+    def _set_binning(self, binning):
+        '''Precompute the spectrum shape for the pixel configuration.'''
+        self._binning = binning
+        num_pixels = 392 if binning else 784
+        # counts per cycle at each pixel
+        x = np.arange(num_pixels)
+        rate = np.full(num_pixels, self.DARK_RATE)
+        # unbinned pixels are half as wide and collect half the light
+        scale = 1 if binning else 2
+        for position, width, peak in self.LINES:
+            center = position*num_pixels
+            rate += peak/scale*np.exp(-0.5*((x-center)/(width*scale))**2)
+        self._rate = rate
+
+    def _wait(self, seconds=0.0):
+        '''Spend the command latency plus `seconds`.'''
+        seconds += self.latency
+        if seconds > 0: time.sleep(seconds)
+
+    def _expose(self):
+        '''Return one frame of counts as a NumPy array.'''
+        signal = self.DARK_LEVEL + self._rate*self._cycles
+        # shot noise and read noise
+        noise = np.sqrt(signal + self.READ_NOISE**2)
+        counts = signal + noise*self._rng.standard_normal(len(signal))
+        return np.clip(counts, 0, FULL_SCALE).astype(np.uint16)
+
+    # ------------------------------------
+    # | MicroSpecSimpleInterface methods |
+    # ------------------------------------
+
+    def setBridgeLED(self, led_num, led_setting):
+        self._wait()
+        self._bridge_led[led_num] = led_setting
+        return replies.Status(status=replies.STATUS_OK)
+
+    def getBridgeLED(self, led_num):
+        self._wait()
+        return replies.GetLED(status=replies.STATUS_OK,
+                              led_setting=self._bridge_led[led_num])
+
+    def setSensorLED(self, led_num, led_setting):
+        self._wait()
+        self._sensor_led[led_num] = led_setting
+        return replies.Status(status=replies.STATUS_OK)
+
+    def getSensorLED(self, led_num):
+        self._wait()
+        return replies.GetLED(status=replies.STATUS_OK,
+                              led_setting=self._sensor_led[led_num])
+
+    def setSensorConfig(self, binning, gain, row_bitmap):
+        self._wait()
+        self._gain = gain
+        self._row_bitmap = row_bitmap
+        self._set_binning(binning)
+        return replies.Status(status=replies.STATUS_OK)
+
+    def getSensorConfig(self):
+        self._wait()
+        return replies.GetSensorConfig(
+            status=replies.STATUS_OK,
+            binning=self._binning,
+            gain=self._gain,
+            row_bitmap=self._row_bitmap
+            )
+
+    def setExposure(self, cycles):
+        self._wait()
+        self._cycles = cycles
+        return replies.Status(status=replies.STATUS_OK)
+
+    def getExposure(self):
+        self._wait()
+        return replies.GetExposure(status=replies.STATUS_OK, cycles=self._cycles)
+
+    def setAutoExposeConfig(self, max_tries, start_pixel, stop_pixel,
+                            target, target_tolerance, max_exposure):
+        self._wait()
+        if self._rng.random() < self.firmware_bug_rate:
+            max_exposure = 4112
+        self._autoexpose_config = dict(
+            max_tries=max_tries, start_pixel=start_pixel, stop_pixel=stop_pixel,
+            target=target, target_tolerance=target_tolerance,
+            max_exposure=max_exposure
+            )
+        return replies.Status(status=replies.STATUS_OK)
+
+    def getAutoExposeConfig(self):
+        self._wait()
+        return replies.GetAutoExposeConfig(
+            status=replies.STATUS_OK, **self._autoexpose_config
+            )
+
+    def captureFrame(self):
+        self._wait(self._cycles*SECONDS_PER_CYCLE if self.realtime else 0)
+        if self._rng.random() < self.drop_rate:
+            return None
+        pixels = self._expose()
+        # the kit replies with a list of counts: reply with the uint16
+        # array instead, the frame format of the GUI (see as_frame)
+        return replies.CaptureFrame(
+            status=replies.STATUS_OK,
+            num_pixels=len(pixels),
+            pixels=pixels
+            )
+
+    def autoExposure(self):
+        '''Adjust exposure until the peak counts hit the target.
+
+        Like the firmware, each try captures a frame and scales the
+        exposure time by target/peak, limited by max_exposure.
+        '''
+        self._wait()
+        config = self._autoexpose_config
+        start = config['start_pixel']-1
+        stop = config['stop_pixel']
+        success = 0
+        iterations = 0
+        while iterations < config['max_tries']:
+            iterations += 1
+            if self.realtime: time.sleep(self._cycles*SECONDS_PER_CYCLE)
+            peak = int(self._expose()[start:stop].max())
+            if abs(peak - config['target']) <= config['target_tolerance']:
+                success = 1
+                break
+            # counts above the dark level scale with exposure time
+            signal = max(peak - self.DARK_LEVEL, 1.0)
+            cycles = round(self._cycles*(config['target'] - self.DARK_LEVEL)/signal)
+            cycles = min(max(cycles, 1), config['max_exposure'])
+            if cycles == self._cycles:
+                # cannot get closer: exposure is at its limit
+                break
+            self._cycles = cycles
+        return replies.AutoExposure(
+            status=replies.STATUS_OK,
+            success=success,
+            iterations=iterations
+            )
@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+"""Stream captured frames to local subscribers over TCP and WebSocket.
+
+Only one program can own the serial port of a dev-kit. A
+:class:`FrameServer` lets dashboards and loggers see the frames
+anyway: the acquisition worker publishes every captured frame to the
+server, and the server sends it to any number of subscribers.
+
+Each frame is *encoded once*, on the worker, into one message (header
+and counts), whatever the number of subscribers. The server runs an
+:mod:`asyncio` event loop on its own thread and writes that same
+message to every subscriber's socket without waiting: the worker only
+hands the message over, so subscribers never delay acquisition.
+
+A subscriber that reads slower than frames arrive piles up unsent
+data. Once more than ``max_backlog`` bytes wait for it, it is
+*dropped*: disconnected (and counted) rather than buffered without
+bound. A dropped subscriber reconnects to pick up the newest frames.
+
+Subscribe over plain TCP (``port``) or WebSocket (``ws_port``), e.g.,
+from a browser. Over TCP messages follow each other on the stream;
+over WebSocket each message is one binary WebSocket message. Clients
+only listen: the server ignores what they send, except a WebSocket
+close.
+
+Message layout
+--------------
+A 40-byte header (:data:`HEADER_DTYPE`) followed by the counts. All
+values are little-endian::
+
+    magic        4 bytes  b'MSPF'
+    version      uint8    message layout version, currently 1
+    dtype        uint8    counts type, see PAYLOAD_DTYPES:
+                          0 uint16, 1 float32 (HDR mode)
+    autoexpose   uint8    last auto-expose result, see AUTOEXPOSE:
+                          0 none yet, 1 hit target, 2 gave up
+    hdr          uint8    1 in HDR mode, else 0
+    num_pixels   uint16   pixels per frame
+    serial       8 bytes  serial number of the kit, zero-padded
+    sequence     uint32   frames published by the kit so far
+    cycles       uint32   exposure time (cycles), in HDR mode the
+                          longest exposure time of the ladder
+    timestamp    float64  seconds since the epoch
+    (reserved, zero-filled up to 40 bytes)
+
+Example
+-------
+Publish frames:
+
+>>> server = FrameServer(port=8765, ws_port=8766)
+>>> server.start()
+>>> acq = Acquisition(kit, stream=server.channel('091103'))
+
+Subscribe from another program:
+
+>>> sock = socket.create_connection(('127.0.0.1', 8765))
+>>> header, pixels = receive(sock)
+>>> header['cycles'], pixels.max()
+"""
+
+import asyncio
+import base64
+import hashlib
+import struct
+import threading
+import numpy as np
+
+MAGIC = b'MSPF'
+VERSION = 1
+HEADER_SIZE = 40
+
+# Counts types, indexed by the header dtype field
+PAYLOAD_DTYPES = (np.dtype('<u2'), np.dtype('<f4'))
+
+# Auto-expose results, indexed by the header autoexpose field
+AUTOEXPOSE = ('none', 'hit', 'gave up')
+
+_header_fields = [
+    ('magic', 'S4'),
+    ('version', 'u1'),
+    ('dtype', 'u1'),
+    ('autoexpose', 'u1'),
+    ('hdr', 'u1'),
+    ('num_pixels', '<u2'),
+    ('serial', 'S8'),
+    ('sequence', '<u4'),
+    ('cycles', '<u4'),
+    ('timestamp', '<f8'),
+    ]
+# pad the header to HEADER_SIZE bytes
+HEADER_DTYPE = np.dtype(_header_fields + [(
+    'reserved', 'u1', HEADER_SIZE - np.dtype(_header_fields).itemsize
+    )])
+
+# Magic string of the WebSocket handshake, see RFC 6455
+_WS_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+def decode(message):
+    '''Return the (header, pixels) of a `message`.
+
+    `pixels` is a read-only view of `message`: no copy.
+    '''
+    header = np.frombuffer(message, HEADER_DTYPE, count=1)[0]
+    if header['magic'] != MAGIC:
+        raise ValueError(f"not a frame message: magic is {header['magic']!r}")
+    pixels = np.frombuffer(
+        message, PAYLOAD_DTYPES[header['dtype']],
+        count=header['num_pixels'], offset=HEADER_SIZE
+        )
+    return header, pixels
+
+def receive(sock):
+    '''Read the next message from TCP socket `sock`, return its (header, pixels).
+
+    Raises :class:`ConnectionError` if the server closed the
+    connection, e.g., because this subscriber fell behind.
+    '''
+    header = np.frombuffer(_receive_exactly(sock, HEADER_SIZE), HEADER_DTYPE)[0]
+    size = int(header['num_pixels'])*PAYLOAD_DTYPES[header['dtype']].itemsize
+    return decode(header.tobytes() + _receive_exactly(sock, size))
+
+def _receive_exactly(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    while view:
+        n = sock.recv_into(view)
+        if n == 0:
+            raise ConnectionError("frame server closed the connection")
+        view = view[n:]
+    return buffer
+
+def _ws_prefix(size):
+    '''Return the header of a binary WebSocket message of `size` bytes.'''
+    if size < 126:
+        return bytes((0x82, size))
+    if size < 1<<16:
+        return struct.pack('>BBH', 0x82, 126, size)
+    return struct.pack('>BBQ', 0x82, 127, size)
+
+class Channel(object):
+    """Publishes the frames of one kit to a :class:`FrameServer`.
+
+    The acquisition worker of the kit calls :meth:`update` with its
+    dev-kit replies, to keep the frame metadata current, and
+    :meth:`publish` with every frame. Call both from that one thread.
+
+    Attributes
+    ----------
+    serial_number : str
+        serial number of the kit, sent with every frame
+    sequence : int
+        frames published so far
+    """
+    def __init__(self, server, serial_number):
+        self.server = server
+        self.serial_number = serial_number
+        self.sequence = 0
+        # one header, rewritten for each frame
+        self._header = np.zeros(1, HEADER_DTYPE)
+        self._header['magic'] = MAGIC
+        self._header['version'] = VERSION
+        self._header['serial'] = serial_number.encode()[:8]
+
+    def update(self, name, reply):
+        '''Update the frame metadata from the `reply` to dev-kit command `name`.'''
+        header = self._header
+        if name == 'getExposure':
+            header['cycles'] = reply.cycles
+        elif name == 'autoExposure':
+            header['autoexpose'] = AUTOEXPOSE.index('hit' if reply.success else 'gave up')
+        elif name == 'startHdr':
+            header['hdr'] = 1
+            header['cycles'] = reply[-1]
+        elif name == 'stopHdr':
+            header['hdr'] = 0
+
+    def publish(self, pixels, timestamp):
+        '''Send the frame `pixels` captured at `timestamp` to the subscribers.
+
+        Encodes nothing if there are no subscribers.
+        '''
+        self.sequence += 1
+        if not self.server.subscribers:
+            return
+        header = self._header
+        dtype = 0 if pixels.dtype == PAYLOAD_DTYPES[0] else 1
+        header['dtype'] = dtype
+        header['num_pixels'] = len(pixels)
+        header['sequence'] = self.sequence
+        header['timestamp'] = timestamp
+        # the one encoding of the frame, shared by every subscriber
+        message = header.tobytes() + pixels.astype(PAYLOAD_DTYPES[dtype], copy=False).tobytes()
+        self.server.send(message)
+
+class _Subscriber(asyncio.Protocol):
+    '''A TCP subscriber: subscribed as soon as it connects.'''
+    websocket = False
+
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.server._subscribe(self)
+
+    def connection_lost(self, exc):
+        self.server._unsubscribe(self)
+
+    def data_received(self, data):
+        pass
+
+class _WebSocketSubscriber(_Subscriber):
+    '''A WebSocket subscriber: subscribed after the opening handshake.'''
+    websocket = True
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self._request = b''
+        self._open = False
+
+    def data_received(self, data):
+        if self._open:
+            # the only message handled from the client is a close
+            if data[0] & 0x0f == 0x8:
+                self.transport.write(b'\x88\x00')
+                self.transport.close()
+            return
+        self._request += data
+        if b'\r\n\r\n' not in self._request:
+            # a handshake is a few hundred bytes
+            if len(self._request) > 8192: self.transport.abort()
+            return
+        key = None
+        for line in self._request.split(b'\r\n')[1:]:
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b'sec-websocket-key':
+                key = value.strip()
+        if key is None:
+            self.transport.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n')
+            self.transport.close()
+            return
+        accept = base64.b64encode(hashlib.sha1(key + _WS_GUID).digest())
+        self.transport.write(
+            b'HTTP/1.1 101 Switching Protocols\r\n'
+            b'Upgrade: websocket\r\n'
+            b'Connection: Upgrade\r\n'
+            b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n'
+            )
+        self._open = True
+        self.server._subscribe(self)
+
+class FrameServer(object):
+    """Send published frames to TCP and WebSocket subscribers.
+
+    Attributes
+    ----------
+    addresses : list
+        ``(protocol, host, port)`` of each listening socket once
+        started, e.g., to learn the port picked for port 0
+    subscribers : int
+        subscribers connected
+    sent : int
+        frames sent to the subscribers
+    dropped : int
+        subscribers dropped because they fell behind
+    max_backlog : int
+        bytes that may wait to be sent to a subscriber before it is
+        dropped
+    """
+    def __init__(self, host='127.0.0.1', port=None, ws_port=None, max_backlog=1<<18):
+        '''
+        Parameters
+        ----------
+        host:
+            - interface to listen on, default is local connections only
+        port:
+            - TCP port, default is None (no TCP subscribers)
+        ws_port:
+            - WebSocket port, default is None (no WebSocket subscribers)
+        max_backlog:
+            - see class attributes
+        '''
+        if port is None and ws_port is None:
+            raise ValueError("give a TCP port, a WebSocket port, or both")
+        self.host = host
+        self.ports = [(_Subscriber, port), (_WebSocketSubscriber, ws_port)]
+        self.max_backlog = max_backlog
+        self.addresses = []
+        self.subscribers = 0
+        self.sent = 0
+        self.dropped = 0
+        self._subscribers = set() # written on the server thread only
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._error = None
+
+    def channel(self, serial_number):
+        '''Return a new :class:`Channel` that publishes the frames of a kit.'''
+        return Channel(self, serial_number)
+
+    def start(self):
+        '''Listen for subscribers on a background thread.
+
+        Returns once listening. Raises :class:`OSError` if a port
+        cannot be opened, e.g., it is in use.
+        '''
+        self._thread = threading.Thread(target=self._run, name='microspec-server', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+
+    def send(self, message):
+        '''Send the encoded frame `message` to every subscriber.
+
+        Thread-safe and never waits: the server thread does the
+        sending.
+        '''
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._fan_out, message)
+
+    def close(self, timeout=2.0):
+        '''Disconnect the subscribers and stop listening.'''
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # --- server thread ---
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        servers = []
+        try:
+            for protocol, port in self.ports:
+                if port is None: continue
+                server = loop.run_until_complete(loop.create_server(
+                    lambda protocol=protocol: protocol(self), self.host, port
+                    ))
+                servers.append(server)
+                self.addresses.append((
+                    'ws' if protocol.websocket else 'tcp',
+                    *server.sockets[0].getsockname()[:2]
+                    ))
+        except OSError as error:
+            self._error = error
+            for server in servers: server.close()
+            loop.close()
+            self._ready.set()
+            return
+        self._loop = loop
+        self._ready.set()
+        loop.run_forever()
+        # closing
+        self._loop = None
+        for server in servers: server.close()
+        for subscriber in list(self._subscribers): subscriber.transport.abort()
+        # let the servers and connections finish closing
+        loop.run_until_complete(asyncio.sleep(0))
+        loop.close()
+
+    def _subscribe(self, subscriber):
+        self._subscribers.add(subscriber)
+        self.subscribers = len(self._subscribers)
+
+    def _unsubscribe(self, subscriber):
+        self._subscribers.discard(subscriber)
+        self.subscribers = len(self._subscribers)
+
+    def _fan_out(self, message):
+        ws_prefix = None
+        for subscriber in list(self._subscribers):
+            transport = subscriber.transport
+            if transport.get_write_buffer_size() > self.max_backlog:
+                # too slow: drop it rather than buffer without bound
+                self._unsubscribe(subscriber)
+                transport.abort()
+                self.dropped += 1
+                continue
+            if subscriber.websocket:
+                if ws_prefix is None: ws_prefix = _ws_prefix(len(message))
+                transport.writelines((ws_prefix, message))
+            else:
+                transport.write(message)
+        self.sent += 1
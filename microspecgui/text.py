@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Cached fonts and rendered text surfaces.
+
+Font rasterization is one of the biggest per-frame costs in the GUI
+loop. Every label shares one :class:`pygame.font.Font` per (path, size)
+and rendered surfaces are kept in a least-recently-used cache, so a
+label that shows a value it showed recently is not rendered again.
+
+A font file is read from disk once and every size is loaded from the
+bytes in memory.
+"""
+
+from collections import OrderedDict
+import io
+import pygame
+
+_fonts = {}
+_font_files = {}
+
+def get_font(path, size_pt):
+    '''Return the shared Font for font file `path` at `size_pt`.
+
+    The font file is read from disk the first time only, whatever the
+    size.
+    '''
+    key = (str(path), size_pt)
+    font = _fonts.get(key)
+    if font is None:
+        data = _font_files.get(key[0])
+        if data is None:
+            with open(key[0], 'rb') as f:
+                data = _font_files[key[0]] = f.read()
+        font = _fonts[key] = pygame.font.Font(io.BytesIO(data), size_pt)
+    return font
+
+class SurfaceCache(object):
+    """Least-recently-used cache of rendered text surfaces.
+
+    Surfaces are keyed by (font, text, color, antialias, background).
+    """
+    def __init__(self, maxsize=256):
+        '''
+        Parameters
+        ----------
+        maxsize:
+            - number of surfaces kept, the least recently used
+              surface is evicted first
+        '''
+        self.maxsize = maxsize
+        self._surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, antialias, color_rgb, background_rgb=None):
+        '''Return `text` rendered with `font`, rendering only on a miss.
+
+        Parameters are the same as :meth:`pygame.font.Font.render`.
+        The returned surface is shared: do not draw on it.
+        '''
+        key = (font, text, tuple(color_rgb), antialias,
+               None if background_rgb is None else tuple(background_rgb))
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self._surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = font.render(text, antialias, color_rgb, background_rgb)
+        self._surfaces[key] = surface
+        if len(self._surfaces) > self.maxsize:
+            self._surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        '''Drop all cached surfaces.'''
+        self._surfaces.clear()
+
+    def __len__(self):
+        return len(self._surfaces)
+
+# Shared by every label in the GUI
+surfaces = SurfaceCache()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""Waterfall view: spectra over time as rows of color.
+
+Each frame becomes one row of a fixed-size surface: pixel counts are
+colors, newest row at the top. Drawing a row costs no per-pixel
+Python:
+
+- a 65536-entry lookup table holds the screen color of every counts
+  value, already in the surface's pixel format, so coloring a frame
+  is one NumPy fancy index
+- the row is written straight into the surface's pixels through
+  :func:`pygame.surfarray.pixels2d`
+
+The surface is a circular buffer of rows. A new frame overwrites the
+oldest row and moves the *head* (the row of the newest frame) up by
+one. Nothing is scrolled: :meth:`Waterfall.draw` blits the rows from
+the head to the bottom first, then the rows above the head below
+them, so the screen shows the rows in time order.
+
+Example
+-------
+>>> waterfall = Waterfall(columns=trace.x - yax_space, num_rows=300)
+>>> waterfall.add(frame.pixels)
+>>> waterfall.draw(win.surface, (yax_space, margin))
+"""
+
+import numpy as np
+import pygame
+
+# Colors of the colormap from 0 counts to full scale, evenly spaced:
+# dark to bright, mostly Badwolf colors
+COLORMAP = (
+    (0x14, 0x14, 0x13), # blackestgravel
+    (0x5f, 0x00, 0x5f), # deep purple
+    (0xff, 0x2c, 0x4b), # taffy
+    (0xff, 0xa7, 0x24), # orange
+    (0xfa, 0xde, 0x3e), # dirtyblonde
+    (0xff, 0xff, 0xff), # snow
+    )
+
+def colormap_lut(surface, colormap=COLORMAP, size=65536):
+    '''Return the lookup table of counts to mapped colors of `surface`.
+
+    Parameters
+    ----------
+    surface:
+        - :class:`pygame.Surface` the colors are written to
+    colormap:
+        - (r,g,b) colors evenly spaced from 0 counts to full scale
+    size:
+        - number of counts values, 65536 for 16-bit counts
+
+    Return
+    ------
+    numpy.ndarray
+        ``lut[counts]`` is the mapped color of `counts`, as in
+        :meth:`pygame.Surface.map_rgb`
+    '''
+    stops = np.linspace(0, size-1, len(colormap))
+    counts = np.arange(size)
+    lut = np.zeros(size, dtype=np.int64)
+    shifts = surface.get_shifts()
+    losses = surface.get_losses()
+    for channel in range(3):
+        level = np.interp(counts, stops, [color[channel] for color in colormap])
+        level = level.astype(np.int64) >> losses[channel]
+        lut |= level << shifts[channel]
+    # opaque, if the surface has an alpha channel
+    lut |= surface.get_masks()[3]
+    return lut.astype({1: np.uint8, 2: np.uint16, 4: np.uint32}[surface.get_bytesize()])
+
+class Waterfall(object):
+    """Circular surface of colored frames, newest at the top.
+
+    Attributes
+    ----------
+    surface : :class:`pygame.Surface`
+        ``num_rows`` rows, one per frame, in circular order
+    head : int
+        row of the newest frame
+    count : int
+        number of frames added
+    """
+    def __init__(self, columns, num_rows, colormap=COLORMAP):
+        '''
+        Parameters
+        ----------
+        columns:
+            - surface column of each pixel index, e.g.,
+              ``trace.x - yax_space`` to line up with the plot
+        num_rows:
+            - number of frames shown
+        colormap:
+            - see :func:`colormap_lut`
+        '''
+        self.columns = np.asarray(columns)
+        self.num_rows = num_rows
+        self.surface = pygame.Surface((self.columns.max()+1, num_rows)).convert()
+        self.surface.fill(colormap[0])
+        self.lut = colormap_lut(self.surface, colormap)
+        self.head = 0
+        self.count = 0
+
+    def add(self, counts):
+        '''Write a frame of `counts` as the newest row.'''
+        counts = np.asarray(counts)
+        if counts.dtype.kind == 'f':
+            # e.g., averaged counts
+            counts = counts.clip(0, len(self.lut)-1).astype(np.intp)
+        self.head = (self.head - 1) % self.num_rows
+        # direct access to the surface pixels: released when deleted
+        pixels = pygame.surfarray.pixels2d(self.surface)
+        pixels[self.columns, self.head] = self.lut[counts]
+        del pixels
+        self.count += 1
+
+    def draw(self, surface, position):
+        '''Blit the rows newest first at `position`. Return the rects drawn.'''
+        x, y = position
+        width = self.surface.get_width()
+        # newest rows: head to bottom of the circular surface
+        newest = self.num_rows - self.head
+        return [
+            surface.blit(self.surface, (x, y), (0, self.head, width, newest)),
+            surface.blit(self.surface, (x, y+newest), (0, 0, width, self.head)),
+            ]
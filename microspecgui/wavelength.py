@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""Load wavelength maps and precompute pixel-to-wavelength tables.
+
+A wavelength map calibrates one spectrometer: it gives the wavelength
+at each pixel. Maps are text files named after the kit serial number,
+e.g., ``~/.microspecgui/maps/091103.map``::
+
+    # Chromation wavelength map
+    serial_number = 091103
+    # wavelength (nm) = c0 + c1*p + c2*p**2 + ...
+    # p is the unbinned pixel number, 1 to 784
+    coefficients = 1568.9, -1.634, 1.2e-6
+    # range of meaningful wavelengths (nm)
+    wavelength_range = 350, 850
+
+Lines starting with ``#`` are comments.
+
+From the map, :class:`WavelengthMap` derives:
+
+- the pixel-to-wavelength lookup table for each pixel binning
+- start_pixel and stop_pixel: the pixels of the wavelength range
+- the die orientation: whether wavelength increases or decreases with
+  pixel number
+
+The polynomial is evaluated once per binning, when the table is first
+needed. After that, looking up the wavelength of a pixel is an array
+index, and changing binning swaps in the other precomputed table.
+Parsed maps are cached, so each map file is parsed once.
+
+Example
+-------
+>>> wmap = load_map(find_map('091103'))
+>>> table = wmap.table(binning=1)
+>>> table.wavelengths[table.start_pixel-1] # nm at start_pixel
+"""
+
+from collections import namedtuple
+from pathlib import Path
+import numpy as np
+
+# Default folder of map files
+MAP_DIR = Path.home().joinpath('.microspecgui', 'maps')
+
+# Unbinned pixels on the spectrometer chip
+NUM_PIXELS = 784
+
+PixelTable = namedtuple('PixelTable', [
+    'binning',      # BINNING_ON (1) or BINNING_OFF (0)
+    'wavelengths',  # numpy.ndarray: nm at pixel number p is wavelengths[p-1]
+    'start_pixel',  # first pixel in the wavelength range
+    'stop_pixel',   # last pixel in the wavelength range
+    ])
+
+class WavelengthMap(object):
+    """Wavelength calibration of one spectrometer.
+
+    Attributes
+    ----------
+    coefficients : tuple
+        polynomial coefficients, lowest power first, of wavelength (nm)
+        vs. unbinned pixel number
+    wavelength_range : tuple
+        (min, max) meaningful wavelengths in nm
+    serial_number : str
+        kit serial number, or None
+    increasing : bool
+        die orientation: True if wavelength increases with pixel number
+    """
+    def __init__(self, coefficients, wavelength_range, serial_number=None):
+        self.coefficients = tuple(coefficients)
+        self.wavelength_range = tuple(sorted(wavelength_range))
+        self.serial_number = serial_number
+        self._tables = {}
+        unbinned = self.table(0).wavelengths
+        self.increasing = bool(unbinned[-1] > unbinned[0])
+
+    def table(self, binning):
+        '''Return the :class:`PixelTable` for `binning`.
+
+        The table is computed the first time only.
+        '''
+        binning = 1 if binning else 0
+        table = self._tables.get(binning)
+        if table is None:
+            table = self._tables[binning] = self._make_table(binning)
+        return table
+
+    def _make_table(self, binning):
+        if binning:
+            # binned pixel b is unbinned pixels 2b-1 and 2b
+            p = 2*np.arange(1, NUM_PIXELS//2 + 1) - 0.5
+        else:
+            p = np.arange(1, NUM_PIXELS + 1, dtype=float)
+        wavelengths = np.polynomial.polynomial.polyval(p, self.coefficients)
+        wavelengths.flags.writeable = False
+        lo, hi = self.wavelength_range
+        in_range = np.flatnonzero((wavelengths >= lo) & (wavelengths <= hi))
+        if len(in_range) == 0:
+            raise ValueError(
+                f"no pixel is in the wavelength range {lo}-{hi}nm"
+                )
+        return PixelTable(
+            binning=binning,
+            wavelengths=wavelengths,
+            start_pixel=int(in_range[0]) + 1,
+            stop_pixel=int(in_range[-1]) + 1,
+            )
+
+def wavelength_at(wavelengths, pixel):
+    '''Return the wavelength at fractional pixel number `pixel`.
+
+    Interpolates linearly between the neighboring pixels of the
+    lookup table `wavelengths` (see :class:`PixelTable`).
+    '''
+    index = pixel - 1
+    i = min(max(int(index), 0), len(wavelengths)-2)
+    return float(wavelengths[i] + (index-i)*(wavelengths[i+1]-wavelengths[i]))
+
+def parse_map(text, source='<map>'):
+    '''Return the :class:`WavelengthMap` described by `text`.
+
+    Raise ValueError if `text` is not a valid map file.
+    '''
+    values = {}
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        line = line.split('#')[0].strip()
+        if not line: continue
+        key, sep, value = line.partition('=')
+        if not sep:
+            raise ValueError(f"{source}:{line_number}: expected 'key = value'")
+        values[key.strip()] = value.strip()
+    try:
+        coefficients = [float(c) for c in values['coefficients'].split(',')]
+        wavelength_range = [float(w) for w in values['wavelength_range'].split(',')]
+    except KeyError as missing:
+        raise ValueError(f"{source}: missing {missing}") from None
+    except ValueError:
+        raise ValueError(f"{source}: coefficients and wavelength_range "
+                         "must be comma-separated numbers") from None
+    if len(wavelength_range) != 2:
+        raise ValueError(f"{source}: wavelength_range must be 'min, max'")
+    return WavelengthMap(
+        coefficients,
+        wavelength_range,
+        serial_number=values.get('serial_number'),
+        )
+
+# Parsed maps: (path, modification time) -> WavelengthMap
+_maps = {}
+
+def load_map(path):
+    '''Return the :class:`WavelengthMap` in file `path`.
+
+    The file is parsed the first time only (and again if it changes).
+    '''
+    path = Path(path)
+    key = (str(path.resolve()), path.stat().st_mtime)
+    wmap = _maps.get(key)
+    if wmap is None:
+        wmap = _maps[key] = parse_map(path.read_text(), source=str(path))
+    return wmap
+
+def find_map(serial_number, map_dir=MAP_DIR):
+    '''Return the path of the map file for `serial_number`, or None.'''
+    path = Path(map_dir).joinpath(f'{serial_number}.map')
+    return path if path.is_file() else None
@@ -57,7 +57,8 @@ setuptools.setup(
     python_requires='>=3.7',
     install_requires=[
         "pygstuff",
-        "microspec"
+        "microspec",
+        "numpy",
         ],
     license='MIT', # field in *.egg-info/PKG-INFO
     platforms=['Windows', 'Mac', 'Linux'], # legacy field in *.egg-info/PKG-INFO
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""Check the HDR merge of :mod:`microspecgui.hdr` on simulated frames."""
+
+import numpy as np
+import pytest
+from microspecgui.hdr import ExposureLadder
+from microspecgui.simulate import SimulatedKit
+
+def merge_simulated(seed, cycles=(50, 500, 5000)):
+    '''Return the ladder, the merge and the true counts at the longest exposure.'''
+    kit = SimulatedKit(realtime=False, seed=seed)
+    ladder = ExposureLadder(cycles)
+    for index, rung in enumerate(ladder.cycles):
+        kit.setExposure(int(rung))
+        ladder.add(index, kit.captureFrame().pixels)
+    truth = kit.DARK_LEVEL + kit._rate*ladder.cycles[-1]
+    return ladder, ladder.merge(), truth
+
+def merge_noise(ladder):
+    '''Return the standard deviation of the merged counts of each pixel.
+
+    Shot and read noise of the unsaturated frames, scaled like the
+    merge; the shortest exposure if saturated in every frame.
+    '''
+    unsaturated = ladder.frames < ladder.saturation
+    unsaturated[0] |= ~unsaturated.any(axis=0)
+    variance = np.sum(ladder.frames, axis=0, where=unsaturated, dtype=float)
+    variance += SimulatedKit.READ_NOISE**2*np.count_nonzero(unsaturated, axis=0)
+    return np.sqrt(variance)/(ladder.cycles @ unsaturated)*ladder.cycles[-1]
+
+@pytest.mark.parametrize('seed', range(5))
+def test_monotonic_across_saturation_edges(seed):
+    ladder, merged, truth = merge_simulated(seed)
+    # unsaturated frames of each pixel: changes at a saturation edge
+    rungs = np.count_nonzero(ladder.frames < ladder.saturation, axis=0)
+    edges = np.flatnonzero(np.diff(rungs))
+    assert len(edges) > 0
+    noise = merge_noise(ladder)
+    for i in edges:
+        step, true_step = merged[i+1] - merged[i], truth[i+1] - truth[i]
+        # merged counts rise (or fall) with the true counts, by about
+        # as much: the dark offset adds no step at the edge
+        assert np.sign(step) == np.sign(true_step)
+        assert abs(step - true_step) < 0.05*abs(true_step) + 4*np.hypot(noise[i], noise[i+1])
+
+@pytest.mark.parametrize('seed', range(5))
+def test_merge_matches_truth(seed):
+    ladder, merged, truth = merge_simulated(seed)
+    assert np.all(abs(merged - truth) < 0.01*truth + 5*merge_noise(ladder))